@@ -0,0 +1,224 @@
+# Optional automatic cropping of the screenshot to the question (--autocrop).
+# The frame is analysed with NumPy on a grid of cells: every cell gets the
+# share of its pixels on a sharp horizontal and on a sharp vertical
+# brightness edge, cells with enough of both count as text (straight window
+# borders only have one kind), and text cells closer than a line or word gap
+# are joined. The joined text region around the mouse cursor (the question
+# the user is looking at) becomes the crop, plus a safety margin. When the
+# region isn't clearly denser than the rest of the screen, or there is no
+# text near the cursor, the whole frame is sent as before.
+# Only the cropped part is converted into an image, so a smaller screenshot
+# is cheaper to encode, upload and bill (see stats()).
+import threading
+import time
+from collections import deque
+
+import capture
+import token_estimator
+import tracing
+from logs import get_logger
+
+log = get_logger("autocrop")
+
+STEP = 2 # Every STEP-th pixel and row is analysed
+CELL = 8 # Cells of CELL x CELL analysed pixels (16x16 screen pixels with STEP 2)
+EDGE_THRESHOLD = 24 # Brightness step (0-255) that counts as an edge
+TEXT_DENSITY = 0.04 # Share of pixels on edges of each direction that makes a cell text
+GAP_CELLS = 2 # Text cells at most this far apart belong to the same region
+SEED_RADIUS = 240 # The region must come this close to the cursor, in screen pixels
+MARGIN = 32 # Safety margin around the region in screen pixels
+MIN_CONFIDENCE = 0.5
+MAX_AREA_SHARE = 0.85 # Crops larger than this share of the frame save too little
+
+enabled = False
+_lock = threading.Lock() # Backends without a lock of their own
+_stats_lock = threading.Lock()
+_stats = {"frames": 0, "cropped": 0, "pixels_in": 0, "pixels_out": 0, "tokens_in": 0, "tokens_out": 0}
+_durations = deque(maxlen=200)
+_local = threading.local() # Region of each thread's last grab
+
+
+class Region:
+    """Result of the analysis: the crop box, or None to send the whole frame."""
+    def __init__(self, frame_size, box, confidence, reason, duration_ms=0.0):
+        self.frame_size = frame_size
+        self.box = box
+        self.confidence = confidence
+        self.reason = reason
+        self.duration_ms = duration_ms
+
+    @property
+    def size(self):
+        if self.box is None:
+            return self.frame_size
+        left, top, right, bottom = self.box
+        return right - left, bottom - top
+
+    def __repr__(self):
+        return f"<Region {self.box} confidence {self.confidence:.2f} ({self.reason})>"
+
+
+def enable():
+    global enabled
+    try:
+        import numpy # noqa: F401 - only checks that the analysis can run
+    except ImportError:
+        log.error("Automatic cropping needs NumPy (pip install numpy), sending full screenshots.")
+        return False
+    enabled = True
+    log.success("Automatic cropping of the screenshots enabled.")
+    return True
+
+
+def _grow(mask, steps=1):
+    """Mask grown by steps cells in the 8 directions (binary dilation without SciPy)."""
+    for _ in range(steps):
+        grown = mask.copy()
+        grown[1:] |= mask[:-1]
+        grown[:-1] |= mask[1:]
+        grown[:, 1:] |= grown[:, :-1].copy()
+        grown[:, :-1] |= grown[:, 1:].copy()
+        mask = grown
+    return mask
+
+
+def text_cells(frame):
+    """Boolean (rows, columns) grid of the cells that look like text."""
+    import numpy as np
+    # The green channel follows the brightness closely enough for edges, and is a view
+    green = frame.array()[::STEP, ::STEP, 1].astype(np.int16)
+    rows, columns = green.shape[0] // CELL, green.shape[1] // CELL
+    green = green[:rows * CELL, :columns * CELL]
+    horizontal = np.zeros(green.shape, dtype=bool) # Steps between neighbours in a row
+    horizontal[:, 1:] = np.abs(green[:, 1:] - green[:, :-1]) > EDGE_THRESHOLD
+    vertical = np.zeros(green.shape, dtype=bool)
+    vertical[1:] = np.abs(green[1:] - green[:-1]) > EDGE_THRESHOLD
+    minimum = TEXT_DENSITY * CELL * CELL
+    return ((horizontal.reshape(rows, CELL, columns, CELL).sum(axis=(1, 3)) >= minimum)
+            & (vertical.reshape(rows, CELL, columns, CELL).sum(axis=(1, 3)) >= minimum))
+
+
+def _seed(joined, cell, radius):
+    """The joined cell nearest to the cursor's cell, or None if none is within radius cells."""
+    import numpy as np
+    row, column = cell
+    if joined[row, column]:
+        return row, column
+    top, left = max(0, row - radius), max(0, column - radius)
+    near = np.argwhere(joined[top:row + radius + 1, left:column + radius + 1])
+    if not len(near):
+        return None
+    nearest = near[np.abs(near - (row - top, column - left)).max(axis=1).argmin()]
+    return top + nearest[0], left + nearest[1]
+
+
+def find_region(frame, cursor=None):
+    """Finds the text region around the cursor (the middle of the frame without one)."""
+    import numpy as np
+    start = time.perf_counter()
+
+    def result(box, confidence, reason):
+        return Region(frame.size, box, confidence, reason, (time.perf_counter() - start) * 1000)
+
+    text = text_cells(frame)
+    if not text.any():
+        return result(None, 0.0, "no text on the screen")
+    cell_pixels = CELL * STEP
+    x, y = cursor or (frame.width // 2, frame.height // 2)
+    cell = (min(max(y // cell_pixels, 0), text.shape[0] - 1), min(max(x // cell_pixels, 0), text.shape[1] - 1))
+
+    # Flood fill from the cursor over the joined text cells
+    joined = _grow(text, GAP_CELLS)
+    seed = _seed(joined, cell, SEED_RADIUS // cell_pixels)
+    if seed is None:
+        return result(None, 0.0, "no text near the cursor")
+    region = np.zeros_like(joined)
+    region[seed] = True
+    while True:
+        grown = _grow(region, 4) & joined
+        if np.array_equal(grown, region):
+            break
+        region = grown
+
+    # Bounding box of the text inside the region, not of the joining halo
+    rows, columns = np.nonzero(region & text)
+    if not len(rows):
+        return result(None, 0.0, "no text near the cursor")
+    top, bottom, left, right = rows.min(), rows.max() + 1, columns.min(), columns.max() + 1
+
+    # Confidence: how much denser the region is than the rest of the screen
+    inside = text[top:bottom, left:right]
+    outside_cells = text.size - inside.size
+    inside_density = inside.mean()
+    outside_density = (text.sum() - inside.sum()) / outside_cells if outside_cells else 0.0
+    confidence = float(max(0.0, 1 - outside_density / inside_density))
+
+    box = (max(0, int(left) * cell_pixels - MARGIN), max(0, int(top) * cell_pixels - MARGIN),
+           min(frame.width, int(right) * cell_pixels + MARGIN), min(frame.height, int(bottom) * cell_pixels + MARGIN))
+    area_share = (box[2] - box[0]) * (box[3] - box[1]) / (frame.width * frame.height)
+    if area_share > MAX_AREA_SHARE:
+        return result(None, confidence, f"the region covers {area_share:.0%} of the screen")
+    if confidence < MIN_CONFIDENCE:
+        return result(None, confidence, "the region is not denser than the rest of the screen")
+    return result(box, confidence, "text region around the cursor")
+
+
+def _record(region):
+    full, cropped = region.frame_size, region.size
+    with _stats_lock:
+        _stats["frames"] += 1
+        _stats["cropped"] += region.box is not None
+        _stats["pixels_in"] += full[0] * full[1]
+        _stats["pixels_out"] += cropped[0] * cropped[1]
+        _stats["tokens_in"] += token_estimator.image_tokens(*full)
+        _stats["tokens_out"] += token_estimator.image_tokens(*cropped)
+        _durations.append(region.duration_ms)
+
+
+def grab():
+    """Captures the screen and returns the question region (the whole screen when unsure) as a PIL image."""
+    backend = capture.get_backend()
+    cursor = capture.cursor_position() # Before the lock, the X11 backend takes it too
+    with getattr(backend, "lock", None) or _lock: # The frame is only valid until the next capture
+        frame = backend.grab_frame()
+        with tracing.span("autocrop") as span:
+            try:
+                region = find_region(frame, cursor)
+            except Exception as e:
+                log.error("Automatic cropping failed, sending the whole screen: %s", e)
+                region = Region(frame.size, None, 0.0, "analysis failed")
+            _record(region)
+            _local.region = region
+            if span is not None:
+                span["attrs"].update(confidence=round(region.confidence, 2), box=region.box, reason=region.reason)
+        if region.box is None:
+            log.debug("Autocrop sends the whole screen: %s (confidence %.2f).", region.reason, region.confidence)
+            return frame.to_image()
+        full, cropped = region.frame_size, region.size
+        log.debug("Autocrop: %sx%s -> %sx%s (%.0f%% fewer pixels, ~%s fewer image tokens), confidence %.2f, %.1f ms.",
+                  *full, *cropped, 100 * (1 - cropped[0] * cropped[1] / (full[0] * full[1])),
+                  token_estimator.image_tokens(*full) - token_estimator.image_tokens(*cropped), region.confidence, region.duration_ms)
+        return frame.crop(region.box).to_image()
+
+
+def last_region():
+    """Region of the calling thread's last grab(), None before the first one."""
+    return getattr(_local, "region", None)
+
+
+def stats():
+    """Pixel and token reduction of the cropping so far, for the status command."""
+    if not enabled:
+        return None
+    with _stats_lock:
+        s = dict(_stats)
+        durations = sorted(_durations)
+    return {
+        "frames": s["frames"],
+        "cropped": s["cropped"],
+        "pixelReduction": round(1 - s["pixels_out"] / s["pixels_in"], 3) if s["pixels_in"] else None,
+        "tokenReduction": round(1 - s["tokens_out"] / s["tokens_in"], 3) if s["tokens_in"] else None,
+        "tokensSaved": s["tokens_in"] - s["tokens_out"],
+        "p50_ms": round(tracing.percentile(durations, 50), 1) if durations else None,
+        "p95_ms": round(tracing.percentile(durations, 95), 1) if durations else None,
+    }
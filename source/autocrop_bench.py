@@ -0,0 +1,147 @@
+# Benchmark of the automatic cropping (autocrop.py) on synthetic desktops:
+# a question window at a random place between a few other windows, with the
+# mouse cursor on the question. For every resolution it reports the analysis
+# time (p50/p95), how often the crop kept the whole question, how often it
+# fell back to the full frame, and the pixel and image token reduction.
+#
+# Usage:
+#   py autocrop_bench.py
+#   py autocrop_bench.py --sizes 3840x2160 --scenes 50
+import argparse
+import json
+import logging
+import random
+
+import autocrop
+import capture
+import logs
+import token_estimator
+import tracing
+
+WORDS = ("which", "of", "the", "following", "statements", "is", "true", "about", "function", "integral",
+         "derivative", "select", "answer", "matrix", "value", "when", "equals", "probability", "a)", "b)")
+
+
+def _font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size) # Pillow 10.1+
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _text_window(draw, rng, box, font, line_height, lines=None):
+    left, top, right, bottom = box
+    draw.rectangle(box, fill="white", outline=(170, 170, 170))
+    draw.rectangle((left, top, right, top + line_height), fill=(45, 95, 165)) # Title bar
+    y = top + line_height * 2
+    boxes = [] # Bounding boxes of the lines
+    for _ in range(lines or 10 ** 6):
+        if y > bottom - line_height * 2:
+            break
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+        while len(words) > 1 and draw.textlength(words, font=font) > right - left - 2 * line_height:
+            words = words.rsplit(" ", 1)[0]
+        draw.text((left + line_height, y), words, fill=(20, 20, 20), font=font)
+        boxes.append(draw.textbbox((left + line_height, y), words, font=font))
+        y += line_height
+    return boxes
+
+
+def scene(width, height, seed):
+    """A desktop image, the box of the question's text and the cursor position."""
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    scale = height / 1080
+    font, line_height = _font(int(16 * scale)), int(26 * scale)
+    image = Image.new("RGB", (width, height), (38, 70, 112))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, height - int(40 * scale), width, height), fill=(30, 30, 30)) # Taskbar
+    for i in range(8):
+        x = int((12 + i * 48) * scale)
+        draw.rectangle((x, height - int(32 * scale), x + int(24 * scale), height - int(8 * scale)),
+                       fill=(rng.randint(80, 255), rng.randint(80, 255), rng.randint(80, 255)))
+
+    # A few short other windows (chat, notes), then the question window on top
+    for _ in range(rng.randint(1, 3)):
+        w, h = int(width * rng.uniform(0.15, 0.25)), int(height * rng.uniform(0.15, 0.3))
+        x, y = rng.randint(0, width - w), rng.randint(0, height - h - int(40 * scale))
+        _text_window(draw, rng, (x, y, x + w, y + h), font, line_height, lines=rng.randint(2, 4))
+    w, h = int(width * rng.uniform(0.3, 0.5)), int(height * rng.uniform(0.3, 0.5))
+    x, y = rng.randint(0, width - w), rng.randint(0, height - h - int(40 * scale))
+    lines = _text_window(draw, rng, (x, y, x + w, y + h), font, line_height)
+    question = (min(b[0] for b in lines), min(b[1] for b in lines), max(b[2] for b in lines), max(b[3] for b in lines))
+    line = rng.choice(lines) # The cursor rests on the text the user is reading
+    cursor = (rng.randint(line[0], line[2]), rng.randint(line[1], line[3]))
+    return image, question, cursor
+
+
+def _contains(box, inner):
+    return box[0] <= inner[0] and box[1] <= inner[1] and box[2] >= inner[2] and box[3] >= inner[3]
+
+
+def bench_size(width, height, scenes):
+    durations, kept, fallbacks = [], 0, 0
+    pixels_in = pixels_out = tokens_in = tokens_out = 0
+    for seed in range(scenes):
+        image, question, cursor = scene(width, height, seed)
+        frame = capture.frame_from_image(image)
+        region = autocrop.find_region(frame, cursor)
+        durations.append(region.duration_ms)
+        box = region.box or (0, 0, width, height)
+        fallbacks += region.box is None
+        kept += _contains(box, question)
+        pixels_in += width * height
+        pixels_out += region.size[0] * region.size[1]
+        tokens_in += token_estimator.image_tokens(width, height)
+        tokens_out += token_estimator.image_tokens(*region.size)
+    durations.sort()
+    return {
+        "size": f"{width}x{height}",
+        "scenes": scenes,
+        "p50_ms": round(tracing.percentile(durations, 50), 1),
+        "p95_ms": round(tracing.percentile(durations, 95), 1),
+        "question_kept": round(kept / scenes, 3),
+        "fallback_rate": round(fallbacks / scenes, 3),
+        "pixel_reduction": round(1 - pixels_out / pixels_in, 3),
+        "token_reduction": round(1 - tokens_out / tokens_in, 3),
+        "tokens_per_question": (round(tokens_in / scenes), round(tokens_out / scenes)),
+    }
+
+
+def print_report(results):
+    print(f"\n{'size':>10} {'p50/p95 ms':>14} {'kept':>6} {'fallback':>9} {'pixels':>7} {'tokens':>7} {'tokens/question':>16}")
+    for r in results:
+        before, after = r["tokens_per_question"]
+        print(f"{r['size']:>10} {r['p50_ms']:>6} / {r['p95_ms']:<5} {r['question_kept']:>6.0%} "
+              f"{r['fallback_rate']:>9.0%} {-r['pixel_reduction']:>7.0%} {-r['token_reduction']:>7.0%} "
+              f"{before:>7} -> {after:<6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the automatic screenshot cropping.")
+    parser.add_argument("--sizes", default="1920x1080,2560x1440,3840x2160", help="Screen resolutions")
+    parser.add_argument("--scenes", type=int, default=20, help="Synthetic desktops per resolution")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the app's logs")
+    args = parser.parse_args()
+
+    logs.configure(verbose=args.verbose)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for size in args.sizes.split(","):
+        width, height = (int(v) for v in size.split("x"))
+        print(f"Running {size}...")
+        results.append(bench_size(width, height, args.scenes))
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
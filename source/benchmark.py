@@ -0,0 +1,282 @@
+# Offline benchmark of the question pipeline.
+# Drives gemini.process_question and gemini.create_gemini_contents against the
+# local fake client (fake_gemini.py) with synthetic screenshots and PDFs, so it
+# needs neither API keys nor a desktop.
+#
+# Usage:
+#   py benchmark.py                      run and print the report
+#   py benchmark.py --save-baseline      also store the results as the baseline
+#   py benchmark.py --compare            compare against the stored baseline
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import capture
+import fake_gemini
+import logs
+import metrics
+import notifier
+import tracing
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(script_dir, "..", "bench_baseline.json")
+REGRESSION_THRESHOLD = 0.10 # Changes above 10% are flagged
+MIN_STAGE_CHANGE_MS = 1.0 # ... unless a stage moved by less than this (timer noise)
+
+# Every run works in a throwaway directory: fake API keys, traces and temp files
+work_dir = tempfile.mkdtemp(prefix="scrai-bench-")
+
+
+def import_gemini_offline(keys):
+    """Imports the gemini module with a file of fake API keys."""
+    key_file = os.path.join(work_dir, "apikeys.txt")
+    with open(key_file, "w", encoding="utf-8") as f:
+        f.write("# last_index=-1\n")
+        for i in range(keys):
+            f.write(f"fake-key-{i}\n")
+    os.environ["SCRAI_API_KEY_FILE"] = key_file
+
+    import gemini
+    gemini.file_manager.MANIFEST_FILE = os.path.join(work_dir, "file_manifest.json")
+    gemini.chunking.CHUNK_DIR = os.path.join(work_dir, "chunks")
+    gemini.chunking.CACHE_FILE = os.path.join(work_dir, "chunk_answers.jsonl")
+    gemini.token_estimator.ESTIMATES_FILE = os.path.join(work_dir, "token_estimates.json")
+    return gemini
+
+
+class TraceCollector:
+    """Tracing listener collecting the traces of the running scenario."""
+    def __init__(self):
+        self.traces = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.traces.append(record)
+
+    def take(self):
+        with self._lock:
+            traces, self.traces = self.traces, []
+        return traces
+
+
+def _parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def _make_pdf_sets(specs):
+    """specs like '0', '1x20', '3x50' -> lists of PDF paths (count x pages)."""
+    sets = {}
+    for spec in specs:
+        count, pages = (spec.split("x") + ["0"])[:2] if "x" in spec else (spec, "0")
+        paths = []
+        for i in range(int(count)):
+            path = os.path.join(work_dir, f"bench_{spec}_{i}.pdf")
+            fake_gemini.synthetic_pdf(path, int(pages), page_bytes=3000, seed=i)
+            paths.append(path)
+        sets[spec] = paths
+    return sets
+
+
+def run_scenario(gemini, backend, collector, screenshot, pdf_paths, questions, concurrency, prompt_file):
+    """Runs `questions` process_question calls and returns the measured numbers."""
+    capture.set_backend(capture.FakeCapture(screenshot))
+    tray = notifier.FakeNotifier()
+    before = dict(backend.stats)
+    collector.take()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if concurrency <= 1:
+        for _ in range(questions):
+            gemini.process_question(tray, pdf_paths, "models/gemini-2.5-flash", prompt_file)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(gemini.process_question, tray, pdf_paths, "models/gemini-2.5-flash", prompt_file)
+                       for _ in range(questions)]
+            for future in futures:
+                future.result()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    traces = collector.take()
+    return {
+        "questions": questions,
+        "concurrency": concurrency,
+        "errors": sum(1 for t in traces if t["status"] != "ok"),
+        "questions_per_s": round(questions / elapsed, 3),
+        "stages_ms": tracing.stage_stats(traces),
+        "peak_memory_mb": round(peak / 1e6, 2), # Python allocations (tracemalloc)
+        "rss_mb": round((metrics.process_rss_bytes() or 0) / 1e6, 1), # Whole process, incl. image buffers
+        "bytes_uploaded_per_question": (backend.stats["bytes_uploaded"] - before["bytes_uploaded"]) // max(1, questions),
+        "uploads_per_question": round((backend.stats["uploads"] - before["uploads"]) / max(1, questions), 2),
+    }
+
+
+def run_contents_scenario(gemini, screenshot, pdf_paths, iterations, prompt_file):
+    """Times create_gemini_contents alone with a screenshot already on disk."""
+    image_path = os.path.join(work_dir, "contents_bench.png")
+    screenshot.save(image_path)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        gemini.create_gemini_contents(image_path, pdf_paths, prompt_file)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"p50_ms": round(timings[len(timings) // 2], 1), "max_ms": round(timings[-1], 1)}
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Prints the change of every metric against the baseline. Returns the number of regressions."""
+    regressions = 0
+    print("\nComparison with baseline (lower is better, except questions_per_s):")
+    for name, current in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            print(f"  {name}: not in baseline")
+            continue
+
+        # (metric, new, old, higher is better, smallest absolute change that counts)
+        pairs = [("questions_per_s", current["questions_per_s"], old["questions_per_s"], True, 0),
+                 ("peak_memory_mb", current["peak_memory_mb"], old["peak_memory_mb"], False, 0),
+                 ("bytes_uploaded_per_question", current["bytes_uploaded_per_question"],
+                  old["bytes_uploaded_per_question"], False, 0)]
+        for stage, stats in current["stages_ms"].items():
+            if stage in old["stages_ms"]:
+                for p in ("p50", "p95"):
+                    pairs.append((f"{stage}.{p}", stats[p], old["stages_ms"][stage][p], False, MIN_STAGE_CHANGE_MS))
+
+        for metric, new_value, old_value, higher_is_better, min_change in pairs:
+            if not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            worse = change < -threshold if higher_is_better else change > threshold
+            worse = worse and abs(new_value - old_value) >= min_change
+            regressions += worse
+            flag = "REGRESSION" if worse else ""
+            print(f"  {name:<32} {metric:<32} {old_value:>12} -> {new_value:<12} {change:+7.1%} {flag}")
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{'scenario':<32} {'q/s':>8} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>8} {'RSS MB':>7} {'sent/q':>10}")
+    for name, r in results["scenarios"].items():
+        total = r["stages_ms"].get("total", {"p50": 0, "p95": 0})
+        print(f"{name:<32} {r['questions_per_s']:>8} {r['errors']:>4} {total['p50']:>9} {total['p95']:>9} "
+              f"{r['peak_memory_mb']:>8} {r['rss_mb']:>7} {r['bytes_uploaded_per_question']:>10}")
+
+    print("\nPer-stage p50 / p95 (ms):")
+    for name, r in results["scenarios"].items():
+        stages = ", ".join(f"{stage} {s['p50']}/{s['p95']}" for stage, s in r["stages_ms"].items() if stage != "total")
+        print(f"  {name}: {stages}")
+
+    print("\ncreate_gemini_contents alone:")
+    for name, r in results["contents"].items():
+        print(f"  {name}: p50 {r['p50_ms']} ms, max {r['max_ms']} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the question pipeline.")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per scenario")
+    parser.add_argument("--sizes", default="1280x720,1920x1080,3840x2160", help="Screenshot sizes")
+    parser.add_argument("--pdf-sets", default="0,1x20,3x50", help="PDF sets as COUNTxPAGES")
+    parser.add_argument("--concurrency", default="1,4", help="Concurrent triggers for the throughput runs")
+    parser.add_argument("--keys", type=int, default=4, help="Number of fake API keys")
+    parser.add_argument("--upload-ms", type=float, default=50, help="Mean fake upload latency")
+    parser.add_argument("--generate-ms", type=float, default=300, help="Mean fake model latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency jitter as a share of the mean")
+    parser.add_argument("--bandwidth-mbps", type=float, default=160, help="Fake upload bandwidth")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of fake calls failing with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of fake calls failing with 429")
+    parser.add_argument("--input-token-limit", type=int, default=1_048_576,
+                        help="Fake model input limit (PDF sets above it are answered with map-reduce)")
+    parser.add_argument("--prompt", default="default_prompt.txt", help="Prompt file from prompt_files")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the app's logs")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logs.root.setLevel(logging.WARNING)
+    tracing.TRACE_FILE = os.path.join(work_dir, "traces.jsonl")
+    gemini = import_gemini_offline(args.keys)
+
+    config = fake_gemini.FakeConfig(
+        upload_latency=(args.upload_ms / 1000, args.upload_ms * args.jitter / 1000),
+        generate_latency=(args.generate_ms / 1000, args.generate_ms * args.jitter / 1000),
+        upload_bandwidth=args.bandwidth_mbps * 1e6 / 8,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        input_token_limit=args.input_token_limit,
+        seed=1,
+    )
+    backend = fake_gemini.FakeBackend(config)
+    gemini.client_factory = backend.client_factory
+    gemini._init_client_with_index(0)
+
+    collector = TraceCollector()
+    tracing.add_listener(collector)
+
+    sizes = [_parse_size(s) for s in args.sizes.split(",")]
+    pdf_sets = _make_pdf_sets(args.pdf_sets.split(","))
+    screenshots = {size: fake_gemini.synthetic_screenshot(*size, seed=1) for size in sizes}
+
+    results = {"meta": vars(args) | {"python": sys.version.split()[0], "time": time.time()},
+               "scenarios": {}, "contents": {}}
+
+    # Latency per stage for every screenshot size and PDF set
+    for (width, height), screenshot in screenshots.items():
+        for spec, pdf_paths in pdf_sets.items():
+            name = f"{width}x{height}/pdf{spec}"
+            print(f"Running {name}...")
+            results["scenarios"][name] = run_scenario(gemini, backend, collector, screenshot, pdf_paths,
+                                                      args.questions, 1, args.prompt)
+            results["contents"][name] = run_contents_scenario(gemini, screenshot, pdf_paths,
+                                                              args.questions, args.prompt)
+
+    # Throughput under repeated and concurrent triggers on a mid-sized setup
+    size = sizes[len(sizes) // 2]
+    spec = list(pdf_sets)[len(pdf_sets) // 2]
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        name = f"throughput/c{concurrency}"
+        print(f"Running {name}...")
+        results["scenarios"][name] = run_scenario(gemini, backend, collector, screenshots[size], pdf_sets[spec],
+                                                  args.questions * max(1, concurrency), concurrency, args.prompt)
+
+    results["fake_api"] = dict(backend.stats)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    regressions = 0
+    if args.compare:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                regressions = compare(results, json.load(f))
+        else:
+            print(f"\nNo baseline at {args.baseline}, run with --save-baseline first.")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+# Answers a folder of saved images (e.g. exported question screenshots) with
+# the same prompt and PDF context, without the hotkey. Every image is one
+# question (create_gemini_contents + call_gemini_multimodal) on the next API
+# key, run by a bounded pool of workers: the folder is read lazily and only
+# a few images per worker are queued at a time. The PDFs are uploaded once per
+# key before the run, so all workers share the same handles.
+#
+# Every answer is appended to the results file (JSONL, or CSV if the name ends
+# in .csv) as soon as it arrives. Running the same command again resumes: the
+# images already answered are skipped and the failed ones are tried again.
+# Throughput, latency and the errors by reason are reported at the end.
+#
+# Usage:
+#   py bulk.py ../exports --pdf ../docs/notes.pdf
+#   py bulk.py ../exports --pdf notes.pdf --prompt short --output answers.csv --workers 8
+#   py bulk.py ../exports --target fake         offline dry run with fake keys
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import logs
+import token_estimator
+import tracing
+from logs import get_logger
+
+log = get_logger("bulk")
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+DEFAULT_OUTPUT = "bulk_results.jsonl" # In the image folder
+QUEUE_PER_WORKER = 2 # Images waiting per worker, the rest of the folder isn't read yet
+RETRIES = 2 # Tries with other keys after a failed call
+FIELDS = ("image", "status", "answer", "error", "tokens", "key", "ms", "time")
+
+
+def _is_url(source):
+    return source.lower().startswith(("http://", "https://"))
+
+
+def iter_images(folder):
+    """Image files of the folder in name order."""
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+            yield path
+
+
+class ResultsFile:
+    """Append-only JSONL or CSV results, the last row of an image wins on resume."""
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        self._lock = threading.Lock()
+
+    def answered(self):
+        """Names of the images with an answer from an earlier run."""
+        if not os.path.exists(self.path):
+            return set()
+        status = {}
+        with open(self.path, encoding="utf-8", newline="") as f:
+            if self.is_csv:
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+            try:
+                for row in rows:
+                    status[row["image"]] = row["status"]
+            except (ValueError, KeyError) as e:
+                # A run killed mid-write leaves a partial last line
+                log.warning("Ignoring the rest of %s: %s", self.path, e)
+        return {image for image, s in status.items() if s == "ok"}
+
+    def write(self, row):
+        with self._lock:
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                if self.is_csv:
+                    writer = csv.DictWriter(f, fieldnames=FIELDS)
+                    if new:
+                        writer.writeheader()
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class Stats:
+    """Counters of the run, shared by the workers."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ok = self.failed = self.tokens = 0
+        self.errors = {} # reason -> count
+        self.traces = []
+
+    def add(self, row):
+        with self._lock:
+            if row["status"] == "ok":
+                self.ok += 1
+            else:
+                self.failed += 1
+                self.errors[row["error"]] = self.errors.get(row["error"], 0) + 1
+            self.tokens += row["tokens"]
+
+    def add_trace(self, record):
+        """Tracing listener: the finished traces of the questions, for the latency report."""
+        if record["name"] == "bulk":
+            with self._lock:
+                self.traces.append(record)
+
+
+def ask(gemini, image_path, pdf_sources, prompt_file, model, prompt_text):
+    """One try at an image with the next key. Returns (answer or None, tokens, key index, error reason)."""
+    from PIL import Image
+    with tracing.trace("bulk", model=model, prompt_file=prompt_file, pdf_count=len(pdf_sources)) as trace:
+        with tracing.span("rotate_key"):
+            key_index = gemini.rotate_api_key_and_persist()
+        trace.attrs["key_index"] = key_index
+        with Image.open(image_path) as image: # Only reads the header
+            estimate = token_estimator.Estimate([image.size], pdf_sources, prompt_text)
+
+        contents = gemini.create_gemini_contents(image_path, pdf_sources, prompt_file, key_index)
+        if not contents:
+            tracing.mark_error(reason="upload")
+            return None, 0, key_index, "upload"
+        with tracing.span("model_call"):
+            answer, tokens = gemini.call_gemini_multimodal(contents, model, key_index, estimate=estimate)
+        # Only the image upload is released, the PDFs stay for the other workers
+        gemini.file_manager.release(gemini.get_client(key_index), gemini.key_fingerprint(key_index), contents[0])
+        trace.attrs["tokens"] = tokens
+        if not answer:
+            tracing.mark_error()
+            return None, tokens, key_index, trace.attrs.get("error") or "empty_answer"
+        trace.attrs["answer"] = answer
+        return answer, tokens, key_index, None
+
+
+def process_image(gemini, image_path, args, prompt_text, results, stats, stop):
+    if stop.is_set():
+        return
+    start = time.perf_counter()
+    tokens = 0
+    for attempt in range(RETRIES + 1):
+        try:
+            answer, used, key_index, error = ask(gemini, image_path, args.pdf, args.prompt, args.model, prompt_text)
+        except Exception as e: # e.g. not a readable image, no other key helps
+            log.error("%s: %s", os.path.basename(image_path), e)
+            answer, used, key_index, error = None, 0, gemini.current_index, "exception"
+            break
+        tokens += used
+        if answer is not None or stop.is_set():
+            break
+        log.warning("%s failed on key #%s (%s)%s", os.path.basename(image_path), key_index + 1, error,
+                    ", trying another key." if attempt < RETRIES else ".")
+    row = {
+        "image": os.path.basename(image_path),
+        "status": "ok" if answer is not None else "error",
+        "answer": answer,
+        "error": error,
+        "tokens": tokens,
+        "key": key_index + 1,
+        "ms": round((time.perf_counter() - start) * 1000),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    results.write(row)
+    stats.add(row)
+    log.info("%s: %s", row["image"], answer if answer is not None else f"ERR ({error})")
+
+
+def print_report(stats, skipped, elapsed, workers, keys):
+    done = stats.ok + stats.failed
+    print(f"\n{done} images in {elapsed:.1f} s with {workers} workers on {keys} keys "
+          f"({done / elapsed if elapsed else 0:.2f} images/s), {skipped} answered before.")
+    print(f"  ok {stats.ok}, failed {stats.failed}, {stats.tokens} tokens"
+          + (f" ({stats.tokens / done:.0f} per image)" if done else ""))
+    for reason, count in sorted(stats.errors.items(), key=lambda item: -item[1]):
+        print(f"  {reason}: {count}")
+    latency = tracing.stage_stats(stats.traces)
+    if latency:
+        print(f"\n{'stage':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9}")
+        for stage, s in sorted(latency.items()):
+            print(f"{stage:<14} {s['count']:>6} {s['p50']:>9} {s['p95']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a folder of images with the same prompt and PDFs.")
+    parser.add_argument("folder", help="Folder of the images")
+    parser.add_argument("--pdf", action="append", default=[], help="PDF path or URL for the context (repeatable)")
+    parser.add_argument("--prompt", default="default_prompt.txt", help="Prompt file in ../prompt_files")
+    parser.add_argument("--model", help="Model (default: the one of the last session, or the 2.5 flash model)")
+    parser.add_argument("--output", help=f"Results file, .jsonl or .csv (default: {DEFAULT_OUTPUT} in the folder)")
+    parser.add_argument("--workers", type=int, help="Questions in flight (default: 2 per API key)")
+    parser.add_argument("--target", choices=("model", "fake"), default="model",
+                        help="The real API, or the offline fake client for a dry run")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the app's logs")
+    args = parser.parse_args(argv)
+
+    # Paths are given from the caller's directory, the app works in the source folder
+    folder = os.path.abspath(args.folder)
+    output = os.path.abspath(args.output or os.path.join(folder, DEFAULT_OUTPUT))
+    args.pdf = [p if _is_url(p) else os.path.abspath(p) for p in args.pdf]
+    os.chdir(script_dir)
+
+    logs.configure(verbose=args.verbose)
+    if not args.verbose:
+        logs.root.setLevel(logging.WARNING)
+        log.setLevel(logging.INFO) # One line per image
+
+    if not os.path.isdir(folder):
+        print(f"Not a folder: {folder}")
+        return 1
+    missing = [p for p in args.pdf if not _is_url(p) and not os.path.exists(p)]
+    if missing:
+        print(f"PDF not found: {', '.join(missing)}")
+        return 1
+
+    if args.target == "fake":
+        import benchmark
+        import fake_gemini
+        gemini = benchmark.import_gemini_offline(4)
+        gemini.client_factory = fake_gemini.FakeBackend(fake_gemini.FakeConfig(seed=1)).client_factory
+        gemini._init_client_with_index(0)
+        tracing.TRACE_FILE = os.path.join(benchmark.work_dir, "traces.jsonl")
+    else:
+        import gemini
+    if not args.model:
+        import session # Imports gemini, so only after the target's setup
+        saved = session.load()
+        args.model = (saved or {}).get("model") or DEFAULT_MODEL
+    keys = len(gemini.api_keys)
+    workers = max(1, args.workers or 2 * keys)
+
+    try:
+        prompt_text = gemini.read_prompt(gemini.prompt_path(args.prompt))
+    except OSError:
+        print(f"Prompt file not found: {gemini.prompt_path(args.prompt)}")
+        return 1
+    if args.pdf and gemini.needs_map_reduce(args.pdf, args.model):
+        print("The PDFs don't fit into one request of the model, use fewer or smaller PDFs.")
+        return 1
+
+    # Every key uploads (or reuses) the PDFs once, before the workers share them
+    if args.pdf:
+        print(f"Uploading {len(args.pdf)} PDFs with {keys} keys...")
+        tasks = [(source, idx) for idx in range(keys) for source in args.pdf]
+        with ThreadPoolExecutor(max_workers=min(len(tasks), 4), thread_name_prefix="bulk-upload") as pool:
+            failed = sum(u is None for u in pool.map(lambda task: gemini.upload_pdf_part(*task), tasks))
+        if failed:
+            log.warning("%s of %s PDF uploads failed, those questions go without them.", failed, len(tasks))
+
+    results = ResultsFile(output)
+    answered = results.answered()
+    stats = Stats()
+    tracing.add_listener(stats.add_trace)
+    stop = threading.Event()
+    slots = threading.BoundedSemaphore(workers * QUEUE_PER_WORKER)
+    skipped = 0
+
+    print(f"Answering the images of {folder} with {args.model} ({workers} workers), results in {output}...")
+    start = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk")
+    try:
+        for path in iter_images(folder):
+            if os.path.basename(path) in answered:
+                skipped += 1
+                continue
+            # Short timeouts, so Ctrl+C is handled on every platform
+            while not slots.acquire(timeout=1):
+                pass
+            future = pool.submit(process_image, gemini, path, args, prompt_text, results, stats, stop)
+            future.add_done_callback(lambda f: slots.release())
+        pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        print("\nStopping, the answers so far are saved. Run the same command again to resume.")
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+    print_report(stats, skipped, time.perf_counter() - start, workers, keys)
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
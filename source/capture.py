@@ -0,0 +1,497 @@
+# Screen capture backends. The question pipeline only calls grab(), which
+# returns a PIL image of the whole screen from the selected backend:
+#   x11        Linux X11 displays: MIT-SHM shared memory, or Pillow's XCB grabber
+#              when the display has no shared memory (e.g. forwarded over SSH)
+#   gdi        Windows: BitBlt into a DIB section
+#   pyautogui  generic fallback (default on macOS)
+#   fake       a synthetic screenshot, for headless runs and benchmarks
+#
+# grab_frame() skips the PIL image: it returns a Frame, a view of the backend's
+# own pixel buffer (BGRX, 4 bytes per pixel). Cropping it or taking a NumPy
+# array of it copies nothing, the pixels are converted once in to_image().
+# The buffer is reused by the next capture of the same backend, use
+# Frame.copy() to keep a frame longer. cursor_position() tells where the mouse
+# is in the frame's pixels (None when the backend can't tell).
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+from logs import get_logger
+
+log = get_logger("capture")
+
+
+class Frame:
+    """One captured screen: a BGRX buffer of height rows, stride bytes apart."""
+    def __init__(self, buffer, width, height, stride=None):
+        self.buffer = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        self.width = width
+        self.height = height
+        self.stride = stride or width * 4
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def nbytes(self):
+        return self.width * self.height * 4
+
+    def crop(self, box):
+        """Frame of the (left, top, right, bottom) box, still a view of the same buffer."""
+        left, top, right, bottom = box
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(self.width, right), min(self.height, bottom)
+        if right <= left or bottom <= top:
+            raise ValueError(f"Empty crop box {box} for a {self.width}x{self.height} frame.")
+        start = top * self.stride + left * 4
+        end = (bottom - 1) * self.stride + right * 4
+        return Frame(self.buffer[start:end], right - left, bottom - top, self.stride)
+
+    def array(self):
+        """NumPy view of the pixels, shape (height, width, 4) in BGRX order."""
+        import numpy as np # Optional, only needed by the callers of array()
+        return np.ndarray((self.height, self.width, 4), dtype=np.uint8, buffer=self.buffer,
+                          strides=(self.stride, 4, 1))
+
+    def to_image(self):
+        """Converts the pixels to an RGB PIL image (the only copy)."""
+        from PIL import Image
+        return Image.frombuffer("RGB", self.size, self.buffer, "raw", "BGRX", self.stride, 1)
+
+    def copy(self):
+        """Frame with its own buffer, not overwritten by later captures."""
+        if self.stride == self.width * 4 and self.buffer.contiguous:
+            return Frame(bytes(self.buffer), self.width, self.height)
+        rows = (self.buffer[y * self.stride:y * self.stride + self.width * 4] for y in range(self.height))
+        return Frame(b"".join(rows), self.width, self.height)
+
+
+def frame_from_image(image):
+    """Frame holding a copy of a PIL image's pixels, for backends that only return images."""
+    return Frame(image.convert("RGB").tobytes("raw", "BGRX"), image.width, image.height)
+
+
+class _FrameCapture:
+    """Backends with a native frame grabber get grab() from it."""
+    def __init__(self):
+        self.lock = threading.Lock() # The frame buffer is shared by the captures
+
+    def grab(self):
+        with self.lock:
+            return self.grab_frame().to_image()
+
+    def cursor_position(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class PyAutoGuiCapture:
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui # Needs a desktop session, so only imported when selected
+        self._pyautogui = pyautogui
+
+    def grab(self):
+        return self._pyautogui.screenshot()
+
+    def grab_frame(self):
+        return frame_from_image(self.grab())
+
+    def cursor_position(self):
+        return tuple(self._pyautogui.position())
+
+    def close(self):
+        pass
+
+
+# --- X11 ---
+
+_Z_PIXMAP = 2
+_ALL_PLANES = 0xFFFFFFFF
+_IPC_PRIVATE, _IPC_CREAT, _IPC_RMID = 0, 0o1000, 0
+
+_XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+
+class _XImage(ctypes.Structure):
+    # Only the leading fields are read, the struct is never allocated here
+    _fields_ = [("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int),
+                ("format", ctypes.c_int), ("data", ctypes.c_void_p), ("byte_order", ctypes.c_int),
+                ("bitmap_unit", ctypes.c_int), ("bitmap_bit_order", ctypes.c_int),
+                ("bitmap_pad", ctypes.c_int), ("depth", ctypes.c_int), ("bytes_per_line", ctypes.c_int),
+                ("bits_per_pixel", ctypes.c_int), ("red_mask", ctypes.c_ulong),
+                ("green_mask", ctypes.c_ulong), ("blue_mask", ctypes.c_ulong)]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [("shmseg", ctypes.c_ulong), ("shmid", ctypes.c_int),
+                ("shmaddr", ctypes.c_void_p), ("readOnly", ctypes.c_int)]
+
+
+def _load_library(name):
+    path = ctypes.util.find_library(name)
+    if not path:
+        raise RuntimeError(f"lib{name} not found.")
+    return ctypes.cdll.LoadLibrary(path)
+
+
+class _XShmGrabber:
+    """Copies the root window into a shared memory segment with XShmGetImage."""
+    def __init__(self, display):
+        xlib, xext, libc = _load_library("X11"), _load_library("Xext"), _load_library("c")
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        for func in ("XDefaultScreen", "XConnectionNumber"):
+            getattr(xlib, func).argtypes = [ctypes.c_void_p]
+        for func in ("XDisplayWidth", "XDisplayHeight", "XDefaultDepth"):
+            getattr(xlib, func).argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XFree.argtypes = [ctypes.c_void_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        xlib.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        xlib.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong] + [ctypes.c_void_p] * 7
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+        self._xlib, self._xext, self._libc = xlib, xext, libc
+        self._image = None
+        self._shminfo = _XShmSegmentInfo(shmid=-1)
+
+        self._display = xlib.XOpenDisplay(display.encode())
+        if not self._display:
+            raise RuntimeError(f"Cannot open X11 display {display!r}.")
+        try:
+            self._attach()
+        except Exception:
+            self.close()
+            raise
+
+    def _attach(self):
+        xlib, xext, libc = self._xlib, self._xext, self._libc
+        if not xext.XShmQueryExtension(self._display):
+            raise RuntimeError("The display has no MIT-SHM extension.")
+        screen = xlib.XDefaultScreen(self._display)
+        self._root = xlib.XRootWindow(self._display, screen)
+        self.width = xlib.XDisplayWidth(self._display, screen)
+        self.height = xlib.XDisplayHeight(self._display, screen)
+        self._image = xext.XShmCreateImage(self._display, xlib.XDefaultVisual(self._display, screen),
+                                           xlib.XDefaultDepth(self._display, screen), _Z_PIXMAP, None,
+                                           ctypes.byref(self._shminfo), self.width, self.height)
+        if not self._image:
+            raise RuntimeError("XShmCreateImage failed.")
+        image = self._image.contents
+        if image.bits_per_pixel != 32:
+            raise RuntimeError(f"Unsupported pixel format ({image.bits_per_pixel} bits per pixel).")
+        self.stride = image.bytes_per_line
+        size = self.stride * self.height
+
+        self._shminfo.shmid = libc.shmget(_IPC_PRIVATE, size, _IPC_CREAT | 0o600)
+        if self._shminfo.shmid < 0:
+            raise RuntimeError(f"shmget of {size} bytes failed.")
+        address = libc.shmat(self._shminfo.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            raise RuntimeError("shmat failed.")
+        self._shminfo.shmaddr = image.data = address
+        self._shminfo.readOnly = 0
+
+        # A remote display can't attach our memory: that is reported as an X error,
+        # and the default handler would exit the process
+        errors = []
+        handler = _XErrorHandler(lambda display, event: errors.append(event) or 0)
+        previous = xlib.XSetErrorHandler(ctypes.cast(handler, ctypes.c_void_p))
+        try:
+            attached = xext.XShmAttach(self._display, ctypes.byref(self._shminfo))
+            xlib.XSync(self._display, False)
+        finally:
+            xlib.XSetErrorHandler(previous)
+        if not attached or errors:
+            raise RuntimeError("XShmAttach failed (remote display?).")
+        self._attached = True
+        # Freed by the system once both sides detached
+        libc.shmctl(self._shminfo.shmid, _IPC_RMID, None)
+        self._buffer = memoryview((ctypes.c_ubyte * size).from_address(address)).cast("B")
+
+    def grab_frame(self):
+        if not self._xext.XShmGetImage(self._display, self._root, self._image, 0, 0, _ALL_PLANES):
+            raise RuntimeError("XShmGetImage failed (did the screen resolution change?).")
+        return Frame(self._buffer, self.width, self.height, self.stride)
+
+    def cursor_position(self):
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        x, y, win_x, win_y, mask = ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_uint()
+        if not self._xlib.XQueryPointer(self._display, self._root, *(ctypes.byref(v) for v in
+                                        (root, child, x, y, win_x, win_y, mask))):
+            return None # The pointer is on another screen
+        return x.value, y.value
+
+    def close(self):
+        if getattr(self, "_attached", False):
+            self._xext.XShmDetach(self._display, ctypes.byref(self._shminfo))
+            self._attached = False
+        if self._image:
+            self._xlib.XFree(self._image) # Only the struct, the pixels are in the segment
+            self._image = None
+        if self._shminfo.shmid >= 0 and not getattr(self, "_buffer", None):
+            self._libc.shmctl(self._shminfo.shmid, _IPC_RMID, None) # Failed before the segment was handed over
+        if self._shminfo.shmaddr:
+            self._libc.shmdt(self._shminfo.shmaddr)
+            self._shminfo.shmaddr = None
+        if self._display:
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+
+
+class X11Capture(_FrameCapture):
+    name = "x11"
+
+    def __init__(self, display=None):
+        super().__init__()
+        self.display = display or os.environ.get("DISPLAY")
+        if not self.display:
+            raise RuntimeError("No X11 display to capture (DISPLAY is not set).")
+        try:
+            self._shm = _XShmGrabber(self.display)
+            log.debug("Capturing %s with MIT-SHM (%sx%s).", self.display, self._shm.width, self._shm.height)
+        except Exception as e:
+            log.warning("X11 shared memory capture is not available (%s), using the XCB grabber.", e)
+            from PIL import ImageGrab
+            self._shm = None
+            self._image_grab = ImageGrab
+
+    def grab(self):
+        if self._shm is None:
+            return self._image_grab.grab(xdisplay=self.display)
+        return super().grab()
+
+    def grab_frame(self):
+        if self._shm is None:
+            return frame_from_image(self._image_grab.grab(xdisplay=self.display))
+        return self._shm.grab_frame()
+
+    def cursor_position(self):
+        if self._shm is None:
+            return None
+        with self.lock: # The grabber's display connection isn't thread safe
+            return self._shm.cursor_position()
+
+    def close(self):
+        with self.lock:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm = None
+
+
+# --- Windows ---
+
+class _BitmapInfoHeader(ctypes.Structure):
+    _fields_ = [("biSize", ctypes.c_uint32), ("biWidth", ctypes.c_int32), ("biHeight", ctypes.c_int32),
+                ("biPlanes", ctypes.c_uint16), ("biBitCount", ctypes.c_uint16),
+                ("biCompression", ctypes.c_uint32), ("biSizeImage", ctypes.c_uint32),
+                ("biXPelsPerMeter", ctypes.c_int32), ("biYPelsPerMeter", ctypes.c_int32),
+                ("biClrUsed", ctypes.c_uint32), ("biClrImportant", ctypes.c_uint32)]
+
+
+_SM_CXSCREEN, _SM_CYSCREEN = 0, 1
+_SRCCOPY, _CAPTUREBLT = 0x00CC0020, 0x40000000
+_DPI_AWARENESS_PER_MONITOR_V2 = -4
+
+
+class GdiCapture(_FrameCapture):
+    """BitBlt of the primary screen into a DIB section, whose pixels are read in place."""
+    name = "gdi"
+
+    def __init__(self):
+        super().__init__()
+        if sys.platform != "win32":
+            raise RuntimeError("The gdi capture backend only runs on Windows.")
+        user32, gdi32 = ctypes.windll.user32, ctypes.windll.gdi32
+        user32.GetDC.restype = ctypes.c_void_p
+        user32.GetDC.argtypes = [ctypes.c_void_p]
+        user32.ReleaseDC.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        if hasattr(user32, "SetThreadDpiAwarenessContext"): # Windows 10 1607+
+            # DPI_AWARENESS_CONTEXT is a pointer-sized handle, not an int
+            user32.SetThreadDpiAwarenessContext.restype = ctypes.c_void_p
+            user32.SetThreadDpiAwarenessContext.argtypes = [ctypes.c_void_p]
+        gdi32.CreateCompatibleDC.restype = ctypes.c_void_p
+        gdi32.CreateCompatibleDC.argtypes = [ctypes.c_void_p]
+        gdi32.CreateDIBSection.restype = ctypes.c_void_p
+        gdi32.CreateDIBSection.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint,
+                                           ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p, ctypes.c_uint32]
+        gdi32.SelectObject.restype = ctypes.c_void_p
+        gdi32.SelectObject.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        gdi32.BitBlt.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                 ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_uint32]
+        gdi32.DeleteObject.argtypes = [ctypes.c_void_p]
+        gdi32.DeleteDC.argtypes = [ctypes.c_void_p]
+        self._user32, self._gdi32 = user32, gdi32
+
+        with self._dpi_aware():
+            self.width = user32.GetSystemMetrics(_SM_CXSCREEN)
+            self.height = user32.GetSystemMetrics(_SM_CYSCREEN)
+            self._screen_dc = user32.GetDC(None)
+        self._memory_dc = gdi32.CreateCompatibleDC(self._screen_dc)
+        header = _BitmapInfoHeader(biSize=ctypes.sizeof(_BitmapInfoHeader), biWidth=self.width,
+                                   biHeight=-self.height, # Negative: top-down rows like the other backends
+                                   biPlanes=1, biBitCount=32, biCompression=0)
+        bits = ctypes.c_void_p()
+        self._bitmap = gdi32.CreateDIBSection(self._memory_dc, ctypes.byref(header), 0, ctypes.byref(bits), None, 0)
+        if not self._bitmap:
+            self.close()
+            raise RuntimeError("CreateDIBSection failed.")
+        gdi32.SelectObject(self._memory_dc, self._bitmap)
+        size = self.width * self.height * 4
+        self._buffer = memoryview((ctypes.c_ubyte * size).from_address(bits.value)).cast("B")
+
+    @contextmanager
+    def _dpi_aware(self):
+        # Physical pixels on scaled displays; the setting is per thread, hotkeys run on their own
+        setter = getattr(self._user32, "SetThreadDpiAwarenessContext", None)
+        previous = setter(_DPI_AWARENESS_PER_MONITOR_V2) if setter else None
+        try:
+            yield
+        finally:
+            if previous:
+                setter(previous)
+
+    def grab_frame(self):
+        with self._dpi_aware():
+            if not self._gdi32.BitBlt(self._memory_dc, 0, 0, self.width, self.height,
+                                      self._screen_dc, 0, 0, _SRCCOPY | _CAPTUREBLT):
+                raise RuntimeError("BitBlt of the screen failed.")
+        self._gdi32.GdiFlush()
+        return Frame(self._buffer, self.width, self.height)
+
+    def cursor_position(self):
+        point = (ctypes.c_long * 2)()
+        with self._dpi_aware(): # Physical pixels, like the frame
+            if not self._user32.GetCursorPos(point):
+                return None
+        return point[0], point[1]
+
+    def close(self):
+        if getattr(self, "_bitmap", None):
+            self._gdi32.DeleteObject(self._bitmap)
+            self._bitmap = None
+        if getattr(self, "_memory_dc", None):
+            self._gdi32.DeleteDC(self._memory_dc)
+            self._memory_dc = None
+        if getattr(self, "_screen_dc", None):
+            self._user32.ReleaseDC(None, self._screen_dc)
+            self._screen_dc = None
+
+
+class FakeCapture:
+    """Returns copies of one fixed image instead of the screen."""
+    name = "fake"
+
+    def __init__(self, image=None, size=(1920, 1080), seed=0, cursor=None):
+        if image is None:
+            import fake_gemini
+            image = fake_gemini.synthetic_screenshot(*size, seed=seed)
+        self.image = image
+        self.cursor = cursor
+        self._frame = frame_from_image(image) # Converted once, every frame is a view of it
+
+    def grab(self):
+        return self.image.copy()
+
+    def grab_frame(self):
+        return self._frame
+
+    def cursor_position(self):
+        return self.cursor
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "x11": X11Capture,
+    "gdi": GdiCapture,
+    "pyautogui": PyAutoGuiCapture,
+    "fake": FakeCapture,
+}
+
+_backend = None
+_lock = threading.Lock()
+
+
+def default_backend_name():
+    if sys.platform.startswith("linux"):
+        if not os.environ.get("DISPLAY"):
+            # Never a silent fallback to the fake screen: its questions would still be billed
+            raise RuntimeError("No X display (DISPLAY is not set). Use --capture fake for a synthetic screen.")
+        return "x11"
+    if sys.platform == "win32":
+        return "gdi"
+    return "pyautogui"
+
+
+def create_backend(name=None):
+    """Creates the named capture backend, or the default one of this platform."""
+    name = name or default_backend_name()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown capture backend {name!r} (available: {', '.join(BACKENDS)}).")
+    backend = BACKENDS[name]()
+    if name == "fake":
+        log.warning("Using the fake capture backend, questions will see a synthetic screen.")
+    else:
+        log.info("Using the %s capture backend.", name)
+    return backend
+
+
+def set_backend(backend):
+    """Selects the backend used by grab(), e.g. a FakeCapture in benchmarks."""
+    global _backend
+    with _lock:
+        _backend = backend
+
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+def grab():
+    """Captures the whole screen as a PIL image."""
+    return get_backend().grab()
+
+
+def grab_frame():
+    """Captures the whole screen as a Frame view, valid until the next capture."""
+    return get_backend().grab_frame()
+
+
+def cursor_position():
+    """(x, y) of the mouse in screen pixels, or None if the backend can't tell."""
+    try:
+        return get_backend().cursor_position()
+    except Exception as e:
+        log.debug("Cannot get the cursor position: %s", e)
+        return None
@@ -0,0 +1,144 @@
+# Micro-benchmark of the screen capture backends.
+# For every available backend it times the two ways to capture the screen:
+#   frame  grab_frame(), a view of the backend's pixel buffer
+#   image  grab(), a PIL image (what the question pipeline saves)
+# and measures the memory traffic of each capture: the size of the new pixel
+# buffers it returns (0 for a view of the backend's shared buffer), bytes
+# allocated by Python (tracemalloc peak, e.g. tobytes() copies) and fresh
+# pages touched (minor page faults, POSIX only). The fake backend runs at
+# every --sizes resolution, the real ones at the resolution of the screen.
+#
+# Usage:
+#   py capture_bench.py
+#   py capture_bench.py --backends x11,fake --sizes 1920x1080,3840x2160 --runs 50
+import argparse
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import capture
+import logs
+import tracing
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _minor_faults():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt if resource else 0
+
+
+def output_bytes(result, shared):
+    """Bytes of the pixel buffer a capture returned, unless it is the shared one."""
+    if isinstance(result, capture.Frame):
+        return 0 if result.buffer.obj is shared else result.nbytes
+    # Pillow stores RGB(A) images with 4 bytes per pixel
+    return result.width * result.height * (1 if result.mode in ("1", "L", "P") else 4)
+
+
+def measure(func, runs):
+    """Runs func repeatedly; returns p50/p95 ms and the mean new, allocated and touched MB per run."""
+    first = func() # Warm up: first captures allocate the shared buffers
+    shared = first.buffer.obj if isinstance(first, capture.Frame) else None
+    del first
+    durations = []
+    copied = allocated = touched = 0
+    for _ in range(runs):
+        tracemalloc.start()
+        faults = _minor_faults()
+        start = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - start) * 1000)
+        touched += (_minor_faults() - faults) * PAGE_SIZE
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        copied += output_bytes(result, shared)
+        del result
+    durations.sort()
+    return {
+        "p50_ms": round(tracing.percentile(durations, 50), 2),
+        "p95_ms": round(tracing.percentile(durations, 95), 2),
+        "new_mb": round(copied / runs / 1e6, 2),
+        "alloc_mb": round(allocated / runs / 1e6, 2),
+        "touched_mb": round(touched / runs / 1e6, 2) if resource else None,
+    }
+
+
+def bench_backend(name, backend, runs):
+    frame = backend.grab_frame()
+    result = {
+        "backend": name,
+        "size": f"{frame.width}x{frame.height}",
+        "frame_mb": round(frame.nbytes / 1e6, 2),
+        "frame": measure(backend.grab_frame, runs),
+        "image": measure(backend.grab, runs),
+    }
+    # Crop before converting: only the middle quarter of the screen becomes an image
+    box = (frame.width // 4, frame.height // 4, frame.width * 3 // 4, frame.height * 3 // 4)
+    result["crop_image"] = measure(lambda: backend.grab_frame().crop(box).to_image(), runs)
+    return result
+
+
+def print_report(results):
+    columns = ("frame", "image", "crop_image")
+    print(f"\n{'backend':<10} {'size':>10} {'frame MB':>9}  " + "  ".join(f"{c + ' p50/p95 ms':>22}" for c in columns))
+    for r in results:
+        times = "  ".join(f"{r[c]['p50_ms']:>10} / {r[c]['p95_ms']:<9}" for c in columns)
+        print(f"{r['backend']:<10} {r['size']:>10} {r['frame_mb']:>9}  {times}")
+
+    print("\nMemory traffic per capture in MB (new pixel buffers / allocated by Python / fresh pages touched):")
+    for r in results:
+        traffic = ", ".join(f"{c} {r[c]['new_mb']} / {r[c]['alloc_mb']} / "
+                            f"{r[c]['touched_mb'] if r[c]['touched_mb'] is not None else '-'}" for c in columns)
+        print(f"  {r['backend']:<10} {r['size']:>10}  {traffic}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the screen capture backends.")
+    parser.add_argument("--backends", default=",".join(capture.BACKENDS), help="Backends to measure")
+    parser.add_argument("--sizes", default="1280x720,1920x1080,3840x2160", help="Resolutions of the fake backend")
+    parser.add_argument("--runs", type=int, default=20, help="Captures per measurement")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the app's logs")
+    args = parser.parse_args()
+
+    logs.configure(verbose=args.verbose)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for name in args.backends.split(","):
+        if name == "fake":
+            for size in args.sizes.split(","):
+                width, height = (int(v) for v in size.split("x"))
+                print(f"Running fake {size}...")
+                results.append(bench_backend(name, capture.FakeCapture(size=(width, height)), args.runs))
+            continue
+        try:
+            backend = capture.create_backend(name)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        print(f"Running {name}...")
+        try:
+            results.append(bench_backend(name, backend, args.runs))
+        except Exception as e:
+            print(f"  {name} failed: {e}")
+        finally:
+            backend.close()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# PDF sets too large for the model's input, answered with map-reduce:
+# the sources are split into token-bounded chunks (whole PDFs packed
+# together, or page ranges of a PDF that doesn't fit on its own), every chunk
+# is asked with the screenshot in parallel, and the candidate answers are
+# reduced by one final call (see gemini._process_map_reduce).
+# Chunk answers are cached by chunk, question, model and prompt, so asking
+# the same question over the same material again only costs the reduce call.
+# Every answer is appended to the cache file as one JSON line; the file is
+# compacted (the last line of a key wins) when it is loaded and when it holds
+# mostly replaced or dropped entries.
+# The question is the text region around the cursor (see autocrop.py), the
+# rest of the screen (clock, other windows) changes between captures; without
+# a clear region the answers aren't cached.
+import hashlib
+import json
+import os
+import threading
+import time
+
+import autocrop
+import capture
+import file_manager
+import token_estimator
+from logs import get_logger
+
+log = get_logger("chunking")
+
+CHUNK_DIR = "../chunks" # Page ranges split out of large PDFs, reused while the PDF doesn't change
+CACHE_FILE = "../chunk_answers.jsonl"
+CACHE_MAX_ENTRIES = 5000 # The oldest answers are dropped beyond this
+CONTEXT_SHARE = 0.8 # Share of the model's input limit a request may fill (token estimates are rough)
+
+_cache = None # cache key -> {"answer", "created"}, oldest first
+_cache_lines = 0 # Lines in the cache file, including replaced and dropped entries
+_cache_lock = threading.Lock()
+_split_lock = threading.Lock()
+
+
+def _is_url(source):
+    return source.lower().startswith(("http://", "https://"))
+
+
+def _source_id(source):
+    """Content hash of a local file, the address of a URL."""
+    if _is_url(source) or not os.path.exists(source):
+        return source
+    return file_manager.file_sha256(source)
+
+
+class Chunk:
+    """PDF parts asked together: (source, first page, last page), pages 1-based, None for the whole file."""
+    def __init__(self):
+        self.parts = []
+        self.tokens = 0
+
+    def add(self, source, first, last, tokens):
+        self.parts.append((source, first, last))
+        self.tokens += tokens
+
+    @property
+    def key(self):
+        """Identifies the content of the chunk (not the file names)."""
+        ids = "|".join(f"{_source_id(s)}:{first}-{last}" for s, first, last in self.parts)
+        return hashlib.sha256(ids.encode()).hexdigest()
+
+    def __repr__(self):
+        parts = ", ".join(os.path.basename(s) + (f" p{first}-{last}" if first else "") for s, first, last in self.parts)
+        return f"<Chunk ~{self.tokens} tokens: {parts}>"
+
+
+def plan(pdf_sources, max_tokens):
+    """Packs the sources in order into chunks of at most max_tokens (estimated)."""
+    units = []
+    for source in pdf_sources:
+        pages = token_estimator.pdf_page_count(source)
+        page_tokens = token_estimator.pdf_page_tokens(source)
+        page_budget = max(1, int(max_tokens // page_tokens))
+        if pages <= page_budget or _is_url(source):
+            if pages > page_budget:
+                log.warning("%s may not fit into one request, URLs can't be split. Add it as a local file.", source)
+            units.append((source, None, None, round(pages * page_tokens)))
+            continue
+        for first in range(1, pages + 1, page_budget):
+            last = min(pages, first + page_budget - 1)
+            units.append((source, first, last, round((last - first + 1) * page_tokens)))
+
+    chunks = [Chunk()]
+    for source, first, last, tokens in units:
+        if chunks[-1].parts and chunks[-1].tokens + tokens > max_tokens:
+            chunks.append(Chunk())
+        chunks[-1].add(source, first, last, tokens)
+    return chunks
+
+
+def chunk_files(chunk):
+    """Files (or URLs) to upload for a chunk; page ranges are split into CHUNK_DIR once."""
+    files = []
+    for source, first, last in chunk.parts:
+        files.append(source if first is None else split_pages(source, first, last))
+    return files
+
+
+def existing_chunk_files(sha256s):
+    """Chunk files already split out of the PDFs with the given content hashes."""
+    prefixes = tuple(sha256[:16] + "_" for sha256 in sha256s)
+    if not prefixes or not os.path.isdir(CHUNK_DIR):
+        return []
+    return sorted(os.path.join(CHUNK_DIR, name) for name in os.listdir(CHUNK_DIR) if name.startswith(prefixes))
+
+
+def split_pages(source, first, last):
+    """Pages first-last (1-based) of a local PDF as a chunk file, split once."""
+    try:
+        from pypdf import PdfReader, PdfWriter # Only needed for PDFs larger than a request
+    except ImportError:
+        raise RuntimeError(f"{os.path.basename(source)} is too large for one request "
+                           "and splitting it needs the pypdf package (pip install pypdf).")
+    sha256 = file_manager.file_sha256(source)
+    path = os.path.join(CHUNK_DIR, f"{sha256[:16]}_p{first}-{last}.pdf")
+    with _split_lock:
+        if not os.path.exists(path):
+            os.makedirs(CHUNK_DIR, exist_ok=True)
+            reader = PdfReader(source)
+            writer = PdfWriter()
+            for page in reader.pages[first - 1:last]:
+                writer.add_page(page)
+            with open(path + ".tmp", "wb") as f:
+                writer.write(f)
+            os.replace(path + ".tmp", path)
+            log.debug("Split pages %s-%s of %s into %s.", first, last, os.path.basename(source), path)
+    return path
+
+
+# --- Answer cache ---
+
+def _load_cache():
+    global _cache, _cache_lines
+    if _cache is None:
+        _cache, _cache_lines = {}, 0
+        if os.path.exists(CACHE_FILE):
+            try:
+                with open(CACHE_FILE, encoding="utf-8") as f:
+                    for line in f:
+                        _cache_lines += 1
+                        try:
+                            entry = json.loads(line)
+                            key = entry.pop("key")
+                        except (ValueError, KeyError):
+                            continue # A partial line of an interrupted write
+                        _cache.pop(key, None)
+                        _cache[key] = entry
+            except OSError as e:
+                log.error("Error loading %s: %s. Starting with an empty cache.", CACHE_FILE, e)
+            _drop_oldest()
+            if _cache_lines > len(_cache):
+                _compact()
+    return _cache
+
+
+def _drop_oldest():
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        del _cache[next(iter(_cache))]
+
+
+def _compact():
+    """Rewrites the cache file with only the current entries."""
+    global _cache_lines
+    try:
+        with open(CACHE_FILE + ".tmp", "w", encoding="utf-8") as f:
+            for key, entry in _cache.items():
+                f.write(json.dumps(dict(entry, key=key)) + "\n")
+        os.replace(CACHE_FILE + ".tmp", CACHE_FILE)
+        _cache_lines = len(_cache)
+        log.debug("Compacted %s to %s answers.", CACHE_FILE, len(_cache))
+    except OSError as e:
+        log.error("Error saving %s: %s", CACHE_FILE, e)
+
+
+def question_key(screenshot):
+    """Content hash of the question region of a screenshot, None if there is no clear region."""
+    if autocrop.enabled:
+        # The screenshot is already the region, or the whole screen if there was none
+        region = autocrop.last_region()
+        if region is None or region.box is None:
+            return None
+        question = screenshot
+    else:
+        try:
+            region = autocrop.find_region(capture.frame_from_image(screenshot), capture.cursor_position())
+        except Exception as e: # e.g. no NumPy
+            log.debug("No question region for the answer cache: %s", e)
+            return None
+        if region.box is None:
+            return None
+        question = screenshot.crop(region.box)
+    data = question.convert("RGB").tobytes()
+    return hashlib.sha256(f"{question.size}".encode() + data).hexdigest()
+
+
+def cache_key(chunk, question, model, prompt_sha256, generation_config=None):
+    settings = json.dumps(generation_config, sort_keys=True) if generation_config else ""
+    return hashlib.sha256(f"{chunk.key}|{question}|{model}|{prompt_sha256}|{settings}".encode()).hexdigest()
+
+
+def cached_answer(key):
+    with _cache_lock:
+        entry = _load_cache().get(key)
+    return entry["answer"] if entry else None
+
+
+def store_answer(key, answer):
+    global _cache_lines
+    with _cache_lock:
+        cache = _load_cache()
+        cache.pop(key, None) # Moves a replaced answer to the end, the newest
+        cache[key] = entry = {"answer": answer, "created": time.time()}
+        _drop_oldest()
+        if _cache_lines >= 2 * CACHE_MAX_ENTRIES:
+            _compact()
+            return
+        try:
+            with open(CACHE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dict(entry, key=key)) + "\n")
+            _cache_lines += 1
+        except OSError as e:
+            log.error("Error saving %s: %s", CACHE_FILE, e)
@@ -0,0 +1,340 @@
+# Local stand-in for google.genai.Client, used by the offline benchmarks.
+# It implements the parts of the client this app calls (files.upload/get/
+# list/delete, models.generate_content/generate_content_stream/list/get/
+# count_tokens) with configurable latency and failures, and counts what
+# would have been sent to the API.
+import hashlib
+import io
+import json
+import itertools
+import os
+import pathlib
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# Rough Gemini token costs, good enough to make usage_metadata look real
+IMAGE_TOKENS = 258
+PDF_PAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+DEFAULT_MODELS = [
+    "models/gemini-2.0-flash",
+    "models/gemini-2.5-flash",
+    "models/gemini-2.5-pro",
+]
+
+
+class FakeConfig:
+    """Latencies are in seconds: (mean, jitter) with uniform jitter."""
+    def __init__(self, upload_latency=(0.05, 0.02), generate_latency=(0.8, 0.3),
+                 list_latency=(0.1, 0.02), upload_bandwidth=20e6,
+                 failure_rate=0.0, rate_limit_rate=0.0, answer="B",
+                 models=None, input_token_limit=1_048_576, seed=None):
+        self.upload_latency = upload_latency
+        self.generate_latency = generate_latency
+        self.list_latency = list_latency
+        self.upload_bandwidth = upload_bandwidth # Bytes per second, added to upload latency
+        self.failure_rate = failure_rate # Share of calls failing with 503
+        self.rate_limit_rate = rate_limit_rate # Share of calls failing with 429
+        self.answer = answer
+        self.models = models or list(DEFAULT_MODELS)
+        self.input_token_limit = input_token_limit
+        self.random = random.Random(seed)
+
+
+class FakeBackend:
+    """State shared by all fake clients (one client per API key)."""
+    def __init__(self, config=None):
+        self.config = config or FakeConfig()
+        self.lock = threading.Lock()
+        self.files = {} # name -> FakeFile, across all keys like a real project
+        self.stats = {"uploads": 0, "bytes_uploaded": 0, "deletes": 0, "generate_calls": 0,
+                      "stream_calls": 0, "list_calls": 0, "failures": 0, "rate_limited": 0}
+        self._ids = itertools.count(1)
+
+    def client_factory(self, api_key=None, **kwargs):
+        """Drop-in replacement for genai.Client(api_key=...)."""
+        return FakeClient(self, api_key)
+
+    def count(self, stat, amount=1):
+        with self.lock:
+            self.stats[stat] += amount
+
+    def sleep(self, latency, extra=0.0):
+        mean, jitter = latency
+        with self.lock:
+            delay = mean + self.config.random.uniform(-jitter, jitter)
+        time.sleep(max(0.0, delay) + extra)
+
+    def maybe_fail(self):
+        with self.lock:
+            roll = self.config.random.random()
+        if roll < self.config.rate_limit_rate:
+            self.count("rate_limited")
+            raise FakeAPIError("429 RESOURCE_EXHAUSTED. Fake rate limit.")
+        if roll < self.config.rate_limit_rate + self.config.failure_rate:
+            self.count("failures")
+            raise FakeAPIError("503 UNAVAILABLE. Fake server error.")
+
+    def next_id(self):
+        with self.lock:
+            return next(self._ids)
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class FakeFile(SimpleNamespace):
+    pass
+
+
+def _read_upload(file):
+    """Returns (bytes, default display name) for the file argument of files.upload."""
+    if isinstance(file, (str, os.PathLike)):
+        path = pathlib.Path(file)
+        return path.read_bytes(), path.name
+    if isinstance(file, io.IOBase) or hasattr(file, "read"):
+        return file.read(), "upload"
+    raise TypeError(f"Unsupported file argument: {type(file)!r}")
+
+
+def _guess_mime(data, display_name):
+    if data[:5] == b"%PDF-":
+        return "application/pdf"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if display_name.endswith(".webp") or data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class FakeFiles:
+    def __init__(self, backend, owner):
+        self._backend = backend
+        self._owner = owner
+
+    def upload(self, file=None, config=None, **kwargs):
+        data, display_name = _read_upload(file)
+        config = config or {}
+        if not isinstance(config, dict):
+            config = {k: getattr(config, k) for k in ("mime_type", "display_name") if getattr(config, k, None)}
+
+        b = self._backend
+        b.sleep(b.config.upload_latency, len(data) / b.config.upload_bandwidth)
+        b.maybe_fail()
+        b.count("uploads")
+        b.count("bytes_uploaded", len(data))
+
+        name = f"files/fake-{b.next_id()}"
+        uploaded = FakeFile(
+            name=name,
+            uri=f"https://fake.local/v1beta/{name}",
+            display_name=config.get("display_name", display_name),
+            mime_type=config.get("mime_type") or _guess_mime(data, display_name),
+            size_bytes=len(data),
+            sha256_hash=hashlib.sha256(data).hexdigest(),
+            create_time=time.time(),
+            expiration_time=time.time() + 48 * 3600,
+            state="ACTIVE",
+            owner=self._owner,
+            pages=data.count(b"/Type /Page") - data.count(b"/Type /Pages") if data[:5] == b"%PDF-" else 0,
+        )
+        with b.lock:
+            b.files[name] = uploaded
+        return uploaded
+
+    def get(self, name=None, **kwargs):
+        with self._backend.lock:
+            found = self._backend.files.get(name)
+        if found is None or found.owner != self._owner:
+            raise FakeAPIError(f"404 NOT_FOUND. File {name} does not exist.")
+        return found
+
+    def list(self, config=None, **kwargs):
+        with self._backend.lock:
+            return [f for f in self._backend.files.values() if f.owner == self._owner]
+
+    def delete(self, name=None, **kwargs):
+        with self._backend.lock:
+            found = self._backend.files.get(name)
+            if found is None or found.owner != self._owner:
+                raise FakeAPIError(f"404 NOT_FOUND. File {name} does not exist.")
+            del self._backend.files[name]
+        self._backend.count("deletes")
+
+
+class FakeModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def _count_tokens(self, contents):
+        tokens = 0
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, str):
+                tokens += max(1, len(part) // CHARS_PER_TOKEN)
+            elif getattr(part, "mime_type", "") == "application/pdf":
+                tokens += max(1, getattr(part, "pages", 1)) * PDF_PAGE_TOKENS
+            else:
+                tokens += IMAGE_TOKENS
+        return tokens
+
+    def _answer(self, contents, config):
+        """The configured answer, as the batch JSON (one entry per image) if a JSON response is requested."""
+        answer = self._backend.config.answer
+        if config is None:
+            return answer
+        mime_type = config.get("response_mime_type") if isinstance(config, dict) else getattr(config, "response_mime_type", None)
+        if mime_type != "application/json":
+            return answer
+        images = sum(1 for part in contents if getattr(part, "mime_type", "").startswith("image/"))
+        return json.dumps({"answers": [{"capture": i, "answer": answer} for i in range(1, images + 1)]})
+
+    def _response(self, model, contents, config=None):
+        prompt_tokens = self._count_tokens(contents)
+        limit = self._backend.config.input_token_limit
+        if prompt_tokens > limit:
+            raise FakeAPIError(f"400 INVALID_ARGUMENT. The input token count ({prompt_tokens}) "
+                               f"exceeds the maximum number of tokens allowed ({limit}).")
+        answer = self._answer(contents, config)
+        answer_tokens = max(1, len(answer) // CHARS_PER_TOKEN)
+        return SimpleNamespace(
+            text=answer,
+            model_version=model,
+            prompt_feedback=None,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=answer_tokens,
+                total_token_count=prompt_tokens + answer_tokens,
+            ),
+        )
+
+    def generate_content(self, model=None, contents=None, config=None, **kwargs):
+        b = self._backend
+        b.count("generate_calls")
+        b.sleep(b.config.generate_latency)
+        b.maybe_fail()
+        return self._response(model, contents, config)
+
+    def generate_content_stream(self, model=None, contents=None, config=None, **kwargs):
+        b = self._backend
+        b.count("stream_calls")
+        b.maybe_fail()
+        full = self._response(model, contents, config)
+        text = full.text
+        chunks = max(1, min(len(text), 4))
+        step = -(-len(text) // chunks)
+        mean, jitter = b.config.generate_latency
+        for i in range(chunks):
+            b.sleep((mean / chunks, jitter / chunks))
+            yield SimpleNamespace(
+                text=text[i * step:(i + 1) * step],
+                usage_metadata=full.usage_metadata if i == chunks - 1 else None,
+                prompt_feedback=None,
+            )
+
+    def list(self, config=None, **kwargs):
+        b = self._backend
+        b.count("list_calls")
+        b.sleep(b.config.list_latency)
+        return [self.get(model=name) for name in b.config.models]
+
+    def get(self, model=None, **kwargs):
+        return SimpleNamespace(
+            name=model,
+            supported_actions=["generateContent", "countTokens"],
+            input_token_limit=self._backend.config.input_token_limit,
+            output_token_limit=8192,
+        )
+
+    def count_tokens(self, model=None, contents=None, **kwargs):
+        return SimpleNamespace(total_tokens=self._count_tokens(contents))
+
+
+class FakeClient:
+    def __init__(self, backend, api_key=None):
+        self.api_key = api_key
+        self.files = FakeFiles(backend, api_key)
+        self.models = FakeModels(backend)
+
+
+# --- Synthetic inputs ---
+
+def synthetic_screenshot(width, height, seed=0):
+    """Draws a screenshot-like image: a window with lines of 'words' and a few answer boxes."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (236, 236, 236))
+    draw = ImageDraw.Draw(image)
+
+    # Window with a title bar
+    left, top = width // 10, height // 10
+    right, bottom = width - width // 10, height - height // 10
+    draw.rectangle((left, top, right, bottom), fill="white", outline=(180, 180, 180))
+    draw.rectangle((left, top, right, top + 32), fill=(40, 90, 160))
+
+    # Text lines made of dark 'word' blocks
+    line_height = 28
+    y = top + 60
+    while y < bottom - line_height:
+        x = left + 40
+        line_end = rng.randint((left + right) // 2, right - 40)
+        while x < line_end:
+            word = rng.randint(20, 90)
+            draw.rectangle((x, y, min(x + word, line_end), y + 14), fill=(rng.randint(20, 70),) * 3)
+            x += word + 10
+        y += line_height
+        if rng.random() < 0.15:
+            # Answer option box
+            draw.rectangle((left + 40, y, left + 60, y + 20), outline=(90, 90, 90), width=2)
+            y += line_height
+    return image
+
+
+def synthetic_pdf(path, pages, page_bytes=2000, seed=0):
+    """Writes a valid PDF with the given number of text pages of roughly page_bytes each."""
+    rng = random.Random(seed)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "theorem", "proof", "lemma", "answer", "question"]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None] # Pages object filled in below
+    page_ids = []
+    for _ in range(pages):
+        lines = []
+        size = 0
+        y = 780
+        while size < page_bytes:
+            text = " ".join(rng.choice(words) for _ in range(10))
+            line = f"BT /F1 10 Tf 40 {y} Td ({text}) Tj ET\n".encode()
+            lines.append(line)
+            size += len(line)
+            y = y - 12 if y > 40 else 780
+        stream = b"".join(lines)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>"
+                       % content_id)
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+    with open(path, "wb") as f:
+        f.write(out.getvalue())
+    return path
@@ -0,0 +1,277 @@
+# Lifecycle of the files uploaded through the Gemini Files API.
+# Every upload is recorded per API key in a local manifest with its content
+# hash, size, expiry and purpose:
+#   pdf         reused by later questions, also after a restart, while the remote file lives
+#   screenshot  ephemeral, deleted in the background once the question is answered
+# A background garbage collector drops expired entries and deletes leftover
+# screenshots, superseded PDF versions and old uploads of this app that are
+# missing from the manifest.
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from logs import get_logger
+
+log = get_logger("file_manager")
+
+MANIFEST_FILE = "../file_manifest.json"
+FILE_TTL_SECONDS = 48 * 3600 # How long the Files API keeps an upload
+REUSE_MARGIN_SECONDS = 3600 # Files expiring sooner than this are uploaded again
+GC_INTERVAL_SECONDS = 600
+GC_FIRST_DELAY_SECONDS = 30 # Don't compete with the startup
+SCREENSHOT_GRACE_SECONDS = 600 # Screenshots still listed after this were not cleaned up (crash, failed delete)
+DELETE_WORKERS = 4
+OWN_DISPLAY_PREFIXES = ("question_screenshot_",) # Unknown remote files the GC may delete
+
+_lock = threading.RLock()
+_manifest = None # key fingerprint -> {remote file name: entry}
+_handles = {} # (key fingerprint, remote file name) -> file object returned by the API
+_hash_cache = {} # (path, mtime, size) -> sha256 of local files
+_delete_pool = ThreadPoolExecutor(max_workers=DELETE_WORKERS, thread_name_prefix="file-delete")
+_gc_stop = threading.Event()
+_stopped = False # The delete pool is shut down, deletes run inline
+_gc_thread = None
+reuse_hits = 0
+reuse_misses = 0
+
+metrics.register_cache("file_reuse", lambda: (reuse_hits, reuse_misses))
+
+
+def key_fingerprint(api_key):
+    """Identifies a key in the manifest without storing the key itself."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def file_sha256(path):
+    """SHA-256 of a local file, cached while its mtime and size don't change."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    sha = _hash_cache.get(key)
+    if sha is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        sha = _hash_cache[key] = h.hexdigest()
+    return sha
+
+
+def _timestamp(value):
+    """Expiration times are datetimes from the API (floats from the fake client)."""
+    if value is None:
+        return None
+    if hasattr(value, "timestamp"):
+        return value.timestamp()
+    return float(value)
+
+
+def _load():
+    global _manifest
+    if _manifest is None:
+        _manifest = {}
+        if os.path.exists(MANIFEST_FILE):
+            try:
+                with open(MANIFEST_FILE, encoding="utf-8") as f:
+                    _manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                log.error("Error loading %s: %s. Starting with an empty manifest.", MANIFEST_FILE, e)
+    return _manifest
+
+
+def _save():
+    try:
+        with open(MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(_manifest, f, indent=1)
+        os.replace(MANIFEST_FILE + ".tmp", MANIFEST_FILE)
+    except OSError as e:
+        log.error("Error saving %s: %s", MANIFEST_FILE, e)
+
+
+def register(fingerprint, uploaded, purpose, sha256=None, source=None, size=None):
+    """Records a new upload of the key in the manifest."""
+    now = time.time()
+    entry = {
+        "purpose": purpose,
+        "sha256": sha256,
+        "source": source,
+        "size": size if size is not None else getattr(uploaded, "size_bytes", None) or 0,
+        "mime_type": getattr(uploaded, "mime_type", None),
+        "created": now,
+        "expires": _timestamp(getattr(uploaded, "expiration_time", None)) or now + FILE_TTL_SECONDS,
+    }
+    with _lock:
+        _load().setdefault(fingerprint, {})[uploaded.name] = entry
+        _handles[(fingerprint, uploaded.name)] = uploaded
+        _save()
+
+
+def forget(fingerprint, name):
+    """Removes an upload from the manifest."""
+    with _lock:
+        _load().get(fingerprint, {}).pop(name, None)
+        _handles.pop((fingerprint, name), None)
+        _save()
+
+
+def find(client, fingerprint, sha256=None, source=None, purpose="pdf"):
+    """
+    Returns the handle of a live earlier upload with the same content hash
+    (or the same source, for URLs), or None if it has to be uploaded.
+    """
+    global reuse_hits, reuse_misses
+    deadline = time.time() + REUSE_MARGIN_SECONDS
+    with _lock:
+        candidates = sorted(
+            ((e["created"], name) for name, e in _load().get(fingerprint, {}).items()
+             if e["purpose"] == purpose and e["expires"] > deadline
+             and (e["sha256"] == sha256 if sha256 else e["source"] == source)),
+            reverse=True)
+    for _, name in candidates:
+        handle = _handles.get((fingerprint, name))
+        if handle is None:
+            # First use since a restart: check that the remote file still exists
+            try:
+                handle = client.files.get(name=name)
+            except Exception as e:
+                log.debug("Manifest entry %s is gone remotely: %s", name, e)
+                forget(fingerprint, name)
+                continue
+            with _lock:
+                _handles[(fingerprint, name)] = handle
+        reuse_hits += 1
+        log.debug("Reusing uploaded file %s.", name)
+        return handle
+    reuse_misses += 1
+    return None
+
+
+def live_uploads(fingerprint, sources):
+    """{source: remote file name} of the newest live upload of each source."""
+    now = time.time()
+    uploads = {}
+    with _lock:
+        entries = sorted(_load().get(fingerprint, {}).items(), key=lambda item: item[1]["created"])
+    for name, e in entries:
+        if e["purpose"] == "pdf" and e["source"] in sources and e["expires"] > now:
+            uploads[e["source"]] = name
+    return uploads
+
+
+def _delete(client, fingerprint, name):
+    try:
+        client.files.delete(name=name)
+    except Exception as e:
+        if "404" not in str(e) and "NOT_FOUND" not in str(e):
+            log.warning("Failed to delete uploaded file %s: %s", name, e)
+            return False
+    forget(fingerprint, name)
+    return True
+
+
+def release(client, fingerprint, uploaded):
+    """Deletes an ephemeral upload in the background, it isn't needed anymore."""
+    if not _stopped:
+        try:
+            _delete_pool.submit(_delete, client, fingerprint, uploaded.name)
+            return
+        except RuntimeError: # stop() shut the pool down meanwhile
+            pass
+    # A question finishing during shutdown
+    _delete(client, fingerprint, uploaded.name)
+
+
+def collect_garbage(clients):
+    """
+    Cleans up the storage of the given {key fingerprint: client} and returns
+    the number of deleted remote files.
+    """
+    now = time.time()
+    to_delete = []
+    for fingerprint, client in clients.items():
+        with _lock:
+            entries = dict(_load().get(fingerprint, {}))
+            # Expired entries: the API already removed the files
+            expired = [name for name, e in entries.items() if e["expires"] <= now]
+            for name in expired:
+                del _manifest[fingerprint][name]
+                _handles.pop((fingerprint, name), None)
+            if expired:
+                _save()
+
+        live = {name: e for name, e in entries.items() if e["expires"] > now}
+        newest_pdf = {} # source -> name of the newest upload
+        for name, e in sorted(live.items(), key=lambda item: item[1]["created"]):
+            if e["purpose"] == "screenshot" and e["created"] < now - SCREENSHOT_GRACE_SECONDS:
+                to_delete.append((client, fingerprint, name))
+            elif e["purpose"] == "pdf" and e["source"]:
+                if e["source"] in newest_pdf: # An older version of a changed PDF
+                    to_delete.append((client, fingerprint, newest_pdf[e["source"]]))
+                newest_pdf[e["source"]] = name
+
+        # Uploads of this app that never made it into the manifest (e.g. from older versions)
+        try:
+            remote = list(client.files.list())
+        except Exception as e:
+            log.warning("Failed to list the uploaded files of key %s: %s", fingerprint, e)
+            continue
+        with _lock: # Uploads registered while the list was fetched
+            known = set(_load().get(fingerprint, {}))
+        for f in remote:
+            display_name = getattr(f, "display_name", None) or ""
+            if f.name in known or not display_name.startswith(OWN_DISPLAY_PREFIXES):
+                continue
+            # Not registered yet: a question may have just uploaded it and still need it
+            created = _timestamp(getattr(f, "create_time", None))
+            if created is None or created > time.time() - SCREENSHOT_GRACE_SECONDS:
+                continue
+            to_delete.append((client, fingerprint, f.name))
+
+    deleted = sum(map(lambda args: _delete(*args), to_delete) if _stopped
+                  else _delete_pool.map(lambda args: _delete(*args), to_delete))
+    if to_delete:
+        log.info("File GC deleted %s of %s stale uploads.", deleted, len(to_delete))
+    return deleted
+
+
+def start_gc(get_clients, interval=GC_INTERVAL_SECONDS):
+    """Runs collect_garbage(get_clients()) periodically on a daemon thread."""
+    global _gc_thread
+    if _gc_thread is not None:
+        return
+
+    def loop():
+        delay = GC_FIRST_DELAY_SECONDS
+        while not _gc_stop.wait(delay):
+            try:
+                collect_garbage(get_clients())
+            except Exception as e:
+                log.error("File GC failed: %s", e)
+            delay = interval
+
+    _gc_thread = threading.Thread(target=loop, name="file-gc", daemon=True)
+    _gc_thread.start()
+
+
+def stop():
+    """Stops the GC and waits for the pending deletes."""
+    global _stopped
+    _gc_stop.set()
+    _stopped = True
+    _delete_pool.shutdown(wait=True)
+
+
+def storage_usage(fingerprint):
+    """Live uploads of a key according to the manifest."""
+    now = time.time()
+    with _lock:
+        live = [e for e in _load().get(fingerprint, {}).values() if e["expires"] > now]
+    return {
+        "files": len(live),
+        "bytes": sum(e["size"] for e in live),
+        "pdfs": sum(1 for e in live if e["purpose"] == "pdf"),
+        "screenshots": sum(1 for e in live if e["purpose"] == "screenshot"),
+    }
@@ -1,15 +1,29 @@
 import io
+import json
 import os
 import sys
+import time
 import pathlib
 import tempfile
+import threading
 import requests
-import pyautogui
+from concurrent.futures import ThreadPoolExecutor
 
 from google import genai
 
+import autocrop
+import capture
+import chunking
+import file_manager
+import history
+import metrics
+import recorder
+import token_estimator
+import tracing
 from ansi import ansi
-from trayicon import TrayIcon
+from logs import get_logger
+
+log = get_logger("gemini")
 
 # A script abszolút elérési útja
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,10 +32,17 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
 client = None
+client_factory = genai.Client # Replaced by the offline benchmark with a local fake
 
-API_KEY_FILE = "../apikeys.txt"
+API_KEY_FILE = os.environ.get("SCRAI_API_KEY_FILE", "../apikeys.txt") # Overridable for the offline benchmark
 api_keys = []
 last_index = -1
+current_index = -1 # Index of the key the client was initialized with
+clients = {} # key index -> (factory, client), one client per key, created on first use
+
+KEY_COOLDOWN_SECONDS = 60 # How long a rate limited key is skipped by the rotation
+key_cooldowns = {} # key index -> time.time() until the key is cooling down
+_rotate_lock = threading.Lock()
 
 def _parse_last_index_line(line: str) -> int:
     """
@@ -75,15 +96,46 @@ def _write_last_index_header(path: str, last_idx: int, keys: list[str]):
             for k in keys:
                 f.write(k + "\n")
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to update '{path}' with last_index={last_idx}: {e}")
+        log.error("Failed to update '%s' with last_index=%s: %s", path, last_idx, e)
+
+def get_client(idx: int):
+    """Returns the client of the API key at index idx, creating it on first use."""
+    cached = clients.get(idx)
+    if cached is None or cached[0] is not client_factory: # The benchmarks swap the factory
+        cached = clients[idx] = (client_factory, client_factory(api_key=api_keys[idx]))
+    return cached[1]
+
+def key_fingerprint(idx: int):
+    """Identifies the key at index idx in the file manifest."""
+    return file_manager.key_fingerprint(api_keys[idx])
 
 def _init_client_with_index(idx: int):
     """
     Initializes the Gemini client with the API key at index idx.
     """
-    global client
-    key = api_keys[idx]
-    client = genai.Client(api_key=key)
+    global client, current_index
+    client = get_client(idx)
+    current_index = idx
+
+def start_key_cooldown(idx: int):
+    """Marks a key as rate limited so the rotation skips it for a while."""
+    key_cooldowns[idx] = time.time() + KEY_COOLDOWN_SECONDS
+    log.warning("API key #%s is cooling down for %s seconds.", idx + 1, KEY_COOLDOWN_SECONDS)
+
+def key_cooldowns_remaining():
+    """Returns {key index: remaining cooldown seconds} of the keys still cooling down."""
+    now = time.time()
+    return {idx: until - now for idx, until in list(key_cooldowns.items()) if until > now}
+
+metrics.set_key_cooldowns_source(key_cooldowns_remaining)
+
+def storage_usage_by_key():
+    """Returns {key number: live uploads, bytes, PDFs, screenshots} from the file manifest."""
+    return {idx + 1: file_manager.storage_usage(key_fingerprint(idx)) for idx in range(len(api_keys))}
+
+def start_file_gc():
+    """Starts the background cleanup of the uploaded files of every key."""
+    file_manager.start_gc(lambda: {key_fingerprint(idx): get_client(idx) for idx in range(len(api_keys))})
 
 # Load keys and initialize client
 try:
@@ -91,81 +143,141 @@ try:
     # Use the next key after last_index for initial client setup
     initial_idx = (last_index + 1) % len(api_keys)
     _init_client_with_index(initial_idx)
-    print(ansi.SUCCESS_MSG + f"Loaded {len(api_keys)} API keys. Initialized with key index: {initial_idx}.")
+    log.success("Loaded %s API keys. Initialized with key index: %s.", len(api_keys), initial_idx)
 
 except FileNotFoundError as e:
-    print(ansi.ERROR_MSG + str(e))
-    print("Please create 'apikeys.txt' in the parent directory with one key per line.")
+    log.error("%s", e)
+    log.error("Please create 'apikeys.txt' in the parent directory with one key per line.")
     sys.exit(1)
 except Exception as e:
-    print(ansi.ERROR_MSG + f"Error loading API keys: {e}")
+    log.error("Error loading API keys: %s", e)
     sys.exit(1)
 
 
+def next_key_index():
+    """Index of the key the next rotation switches to."""
+    # Skip keys that are cooling down after a rate limit, unless all of them are
+    cooling = key_cooldowns_remaining()
+    for step in range(1, len(api_keys) + 1):
+        candidate = (last_index + step) % len(api_keys)
+        if candidate not in cooling:
+            return candidate
+    return (last_index + 1) % len(api_keys)
+
 def rotate_api_key_and_persist():
     """
     Advances to the next API key cyclically and persists the new last_index in apikeys.txt.
-    Also re-initializes the client with the new key.
+    Also re-initializes the client with the new key. Returns the index of the key to use.
     """
     global last_index, api_keys
     
     if not api_keys:
-        print(ansi.ERROR_MSG + "No API keys available to rotate.")
-        return
+        log.error("No API keys available to rotate.")
+        return current_index
 
-    try:
-        next_index = (last_index + 1) % len(api_keys)
-        _init_client_with_index(next_index)
+    with _rotate_lock: # Map-reduce workers rotate at the same time
+        try:
+            next_index = next_key_index()
+            _init_client_with_index(next_index)
         
-        # Persist the newly used index as last_index
-        last_index = next_index
-        _write_last_index_header(API_KEY_FILE, last_index, api_keys)
+            # Persist the newly used index as last_index
+            last_index = next_index
+            _write_last_index_header(API_KEY_FILE, last_index, api_keys)
         
-        print(ansi.INFO_MSG + f"Switched to API key #{next_index + 1} (Index: {next_index})")
-    except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to rotate and persist API key: {e}")
-
+            log.info("Switched to API key #%s (Index: %s)", next_index + 1, next_index)
+            return next_index
+        except Exception as e:
+            log.error("Failed to rotate and persist API key: %s", e)
+            return current_index
+
+
+def grab_screen():
+    """Captures the screen as a PIL image with the selected capture backend, cropped to the question with --autocrop."""
+    if autocrop.enabled:
+        return autocrop.grab()
+    return capture.grab()
+
+def capture_screenshot():
+    """Captures the screen as a PIL image."""
+    with tracing.span("capture") as span:
+        screenshot = grab_screen()
+        if span is not None:
+            span["attrs"]["size"] = screenshot.size
+    token_estimator.last_image_size = screenshot.size
+    return screenshot
+
+def save_screenshot(screenshot):
+    """Saves a screenshot to a temp directory and returns its path."""
+    # Unique name, so overlapping questions don't overwrite or delete each other's screenshot
+    fd, temp_image_path = tempfile.mkstemp(prefix="question_screenshot_", suffix=".png")
+    os.close(fd)
+    with tracing.span("encode") as span:
+        screenshot.save(temp_image_path)
+        if span is not None:
+            span["attrs"]["bytes"] = os.path.getsize(temp_image_path)
+    t = tracing.current_trace()
+    if t is not None and history.enabled:
+        t.attrs["thumbnail_hash"] = history.thumbnail_hash(screenshot)
+    return temp_image_path
 
 def take_screenshot():
     """Takes a screenshot and saves it to a temp directory."""
-    temp_image_path = os.path.join(tempfile.gettempdir(), "question_screenshot.png")
-    screenshot = pyautogui.screenshot()
-    screenshot.save(temp_image_path)
-    return temp_image_path
+    return save_screenshot(capture_screenshot())
 
-def load_image_part(image_path):
+def load_image_part(image_path, key_index=None):
     """Loads an image from a file path and prepares it as a Gemini content part."""
+    key_index = current_index if key_index is None else key_index
     try:
-        uploaded_file = client.files.upload(file=image_path)
+        # The GC recognizes leaked screenshots by their display name
+        uploaded_file = get_client(key_index).files.upload(
+            file=image_path,
+            config=dict(display_name=os.path.basename(image_path)),
+        )
+        # Recorded as ephemeral, deleted once the question is answered
+        file_manager.register(key_fingerprint(key_index), uploaded_file, "screenshot",
+                              size=os.path.getsize(image_path))
         return uploaded_file
     except FileNotFoundError:
-        print(ansi.ERROR_MSG + f"Image file not found at {image_path}")
+        log.error("Image file not found at %s", image_path)
         return None
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Error loading or processing image {image_path}: {e}")
+        log.error("Error loading or processing image %s: %s", image_path, e)
         return None
     
 
-def upload_pdf_part(pdf_source):
+def upload_pdf_part(pdf_source, key_index=None):
     """
     Handles uploading a PDF file (local path or URL) to Gemini and
     returns the file_data dictionary for the contents list.
+    Live uploads of the same PDF are reused instead of uploading it again.
     """
     is_url = pdf_source.lower().startswith('http') or pdf_source.lower().startswith('https')
+    key_index = current_index if key_index is None else key_index
+    client = get_client(key_index)
+    fingerprint = key_fingerprint(key_index)
 
     try:
+        sha256 = None
+        if not is_url and os.path.exists(pdf_source):
+            sha256 = file_manager.file_sha256(pdf_source)
+        # URLs are matched by their address, so a reused one isn't even downloaded
+        reused = file_manager.find(client, fingerprint, sha256=sha256, source=pdf_source)
+        if reused is not None:
+            log.success("Reusing the uploaded %r. URI: %s", os.path.basename(pdf_source), reused.uri)
+            return reused
+
         if is_url:
-            print(ansi.INFO_MSG + f"Attempting to download PDF from {pdf_source}...")
+            log.info("Attempting to download PDF from %s...", pdf_source)
             response = requests.get(pdf_source, stream=True, timeout=30)
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
             data = response.content
-            print(ansi.SUCCESS_MSG + f"Downloaded ({len(data)} bytes).")
+            log.debug("Downloaded (%s bytes).", len(data))
 
             # Wrap bytes in a file-like object
             file_obj = io.BytesIO(data)
             display_name = os.path.basename(pdf_source) or "downloaded.pdf"
 
-            print(ansi.INFO_MSG + "Uploading PDF (from URL) to Gemini...")
+            log.info("Uploading PDF (from URL) to Gemini...")
             uploaded = client.files.upload(
                 file=file_obj,
                 config=dict(
@@ -176,184 +288,605 @@ def upload_pdf_part(pdf_source):
 
         else:
             local_path = pathlib.Path(pdf_source)
-            print(ansi.INFO_MSG + f"Reading local PDF from {local_path!r}")
+            log.debug("Reading local PDF from %r", local_path)
             if not local_path.exists():
-                print(ansi.ERROR_MSG + f"Local file not found: {local_path!r}")
+                log.error("Local file not found: %r", local_path)
                 return None
 
-            print(ansi.INFO_MSG + f"Uploading {local_path.name!r} to Gemini...")
+            log.info("Uploading %r to Gemini...", local_path.name)
             uploaded = client.files.upload(
                 file=local_path,
                 # config is optional for local files, Gemini will infer from `.pdf`
             )
 
-        print(ansi.SUCCESS_MSG + f"File uploaded successfully. URI: {uploaded.uri}")
+        log.success("File uploaded successfully. URI: %s", uploaded.uri)
+        file_manager.register(fingerprint, uploaded, "pdf", sha256=sha256, source=pdf_source)
         return uploaded
 
     except requests.exceptions.RequestException as e:
-        print(ansi.ERROR_MSG + f"Error downloading PDF from {pdf_source}: {e}")
+        log.error("Error downloading PDF from %s: %s", pdf_source, e)
         return None
     except Exception as e:
         # Catch any other unexpected exceptions during reading/uploading
-        print(ansi.ERROR_MSG + f"An unexpected error occurred during PDF upload processing for {pdf_source}: {e}")
+        log.error("An unexpected error occurred during PDF upload processing for %s: %s", pdf_source, e)
         return None
     
 
-def create_gemini_contents(image_path, pdf_sources, prompt_file_name):
+def prompt_path(prompt_file_name):
+    """Path of a prompt file given by its name, with or without .txt."""
+    if not prompt_file_name:
+        prompt_file_name = "default_prompt.txt"  # Default prompt file name if none provided
+    if not prompt_file_name.endswith(".txt"):
+        prompt_file_name += ".txt"
+    return "../prompt_files/" + prompt_file_name
+
+
+_prompt_cache = {} # path -> ((mtime, size), text)
+
+def read_prompt(path):
+    """Text of a prompt file, re-read only when the file changes."""
+    stat = os.stat(path)
+    key = (stat.st_mtime, stat.st_size)
+    cached = _prompt_cache.get(path)
+    if cached is None or cached[0] != key:
+        with open(path, "r") as file:
+            cached = _prompt_cache[path] = (key, file.read().strip())
+    return cached[1]
+
+
+def create_gemini_contents(image_path, pdf_sources, prompt_file_name, key_index=None):
     """
     Creates the list of content parts for the Gemini API call.
     Includes the image, uploaded PDF files, and the instruction prompt.
+    image_path can also be a list of paths (batch mode), the images come first in order.
+    The files are uploaded with the key at key_index (default: the current key).
     """
     contents = []
-
-    # 1. Add Image Part
-    image_part = load_image_part(image_path)
-    if image_part is None:
-        print(ansi.ERROR_MSG + "Cannot proceed without a valid image part.")
-        return None
-    contents.append(image_part)
-    print(ansi.SUCCESS_MSG + "Image added.")
+    key_index = current_index if key_index is None else key_index
+    image_paths = image_path if isinstance(image_path, list) else [image_path]
+
+    # 1. Add Image Part(s)
+    for path in image_paths:
+        with tracing.span("image_upload"):
+            image_part = load_image_part(path, key_index)
+        if image_part is None:
+            log.error("Cannot proceed without a valid image part.")
+            for uploaded in contents: # Don't leave the other captures of a batch behind
+                file_manager.release(get_client(key_index), key_fingerprint(key_index), uploaded)
+            return None
+        contents.append(image_part)
+    log.success("Image added." if len(image_paths) == 1 else f"{len(image_paths)} images added.")
 
     # 2. Add Uploaded PDF Parts (Only if upload is successful)
     uploaded_pdf_parts = []
     for source in pdf_sources:
-        pdf_part = upload_pdf_part(source)
+        with tracing.span("pdf_upload", source=source):
+            pdf_part = upload_pdf_part(source, key_index)
         if pdf_part:
             uploaded_pdf_parts.append(pdf_part)
 
     if uploaded_pdf_parts:
         contents.extend(uploaded_pdf_parts)
-        print(ansi.SUCCESS_MSG + f"Successfully added {len(uploaded_pdf_parts)} uploaded PDF file parts.")
-    else:
-        print(ansi.WARNING_MSG + "No usable PDF files were uploaded from the provided sources.")
+        log.success("Successfully added %s uploaded PDF file parts.", len(uploaded_pdf_parts))
+    elif pdf_sources:
+        log.warning("No usable PDF files were uploaded from the provided sources.")
 
     # 3. Add Instruction Prompt Part (Loaded from a file)
 
-    # set the prompt file name
-    if not prompt_file_name:
-        prompt_file_name = "default_prompt.txt"  # Default prompt file name if none provided
-    if not prompt_file_name.endswith(".txt"):
-        prompt_file_name += ".txt"
-
-    PROMPT_FILE = "../prompt_files/" + prompt_file_name
+    PROMPT_FILE = prompt_path(prompt_file_name)
     try:
-        with open(PROMPT_FILE, "r") as file:
-            instruction_prompt = file.read().strip()
+        with tracing.span("prompt_load"):
+            instruction_prompt = read_prompt(PROMPT_FILE)
         if not instruction_prompt:
-            print(ansi.ERROR_MSG + f"Prompt file '{PROMPT_FILE}' is empty. Exiting.")
+            log.error("Prompt file '%s' is empty. Exiting.", PROMPT_FILE)
             exit()
-        print(ansi.SUCCESS_MSG + "Prompt file loaded successfully.")
-        print(ansi.SUCCESS_MSG + "API key loaded successfully.")
+        log.success("Prompt file loaded successfully.")
+        log.success("API key loaded successfully.")
 
     except FileNotFoundError:
-        print(ansi.ERROR_MSG + f"Prompt file '{PROMPT_FILE}' not found.")
-        print("Please create a file named 'example.txt' in the prompt_files directory and paste your prompt inside.")
+        log.error("Prompt file '%s' not found.", PROMPT_FILE)
+        log.error("Please create a file named 'example.txt' in the prompt_files directory and paste your prompt inside.")
         exit()
     except Exception as e:
-        print(ansi.ERROR_MSG + f"An unexpected error occurred while loading the prompt file: {e}")
+        log.error("An unexpected error occurred while loading the prompt file: %s", e)
         exit()
 
 
     # 3. Add the Final Instruction Text Part (Guides the model on how to respond)
     contents.append(instruction_prompt)
-    print(ansi.SUCCESS_MSG + "Instruction prompt added.")
+    log.success("Instruction prompt added.")
 
     # Basic check: Do we have at least the image and instruction prompt?
     if any(part is None for part in contents) or len(contents) < 2:
-        print(ansi.ERROR_MSG + "Content creation failed. Missing image or instruction prompt.")
+        log.error("Content creation failed. Missing image or instruction prompt.")
         return None
 
     return contents
 
 
-def call_gemini_multimodal(contents, selected_model):
-    """Calls the Gemini API with the list of multimodal content parts."""
+def call_gemini_multimodal(contents, selected_model, key_index=None, config=None, estimate=None):
+    """
+    Calls the Gemini API with the list of multimodal content parts.
+    config is passed on to generate_content (e.g. a structured response schema).
+    The token estimate of the contents, if given, is calibrated with the usage.
+    """
+    # The files in contents are only visible to the key that uploaded them
+    key_index = current_index if key_index is None else key_index
 
     try:
-        print(ansi.INFO_MSG + "Calling Gemini API...")
+        log.info("Calling Gemini API...")
         # Use the model specified by the user
-        response = client.models.generate_content(
+        response = get_client(key_index).models.generate_content(
             model=selected_model,
             contents=contents,
+            config=config,
         )
         
         # Extract token usage
         tokens_used = 0
         if hasattr(response, 'usage_metadata') and hasattr(response.usage_metadata, 'total_token_count'):
             tokens_used = response.usage_metadata.total_token_count
+            if estimate is not None:
+                token_estimator.observe(estimate, response.usage_metadata)
+            # The rest of the total is the answer (and thinking), for the router's cost estimates
+            input_tokens = getattr(response.usage_metadata, "prompt_token_count", None)
+            trace = tracing.current_trace()
+            if trace is not None and input_tokens is not None:
+                trace.attrs["input_tokens"] = trace.attrs.get("input_tokens", 0) + input_tokens
 
         # Access the text response
         if not hasattr(response, 'text') or not response.text:
-            print(ansi.WARNING_MSG + "API returned an empty response or no text content.")
+            log.warning("API returned an empty response or no text content.")
             # Check for block reasons from the API
             if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
                 if response.prompt_feedback.block_reason:
-                    print(f"API blocked response: {response.prompt_feedback.block_reason}")
+                    log.warning("API blocked response: %s", response.prompt_feedback.block_reason)
                     if response.prompt_feedback.block_reason_message:
-                        print(f"Block message: {response.prompt_feedback.block_reason_message}")
+                        log.warning("Block message: %s", response.prompt_feedback.block_reason_message)
                 else:
-                    print("API returned no text, but no specific block reason provided in feedback.")
+                    log.warning("API returned no text, but no specific block reason provided in feedback.")
 
             return None, tokens_used
 
         answer = response.text.strip()
 
         # Although the prompt asks the model to keep it under 128, we add this check as a safeguard and warning.
-        if len(answer) > 128:
-            print(ansi.WARNING_MSG + f"API response length ({len(answer)}) exceeded the requested 128 characters.")
+        if len(answer) > 128 and not (config and config.get("response_mime_type")):
+            log.warning("API response length (%s) exceeded the requested 128 characters.", len(answer))
 
         return answer, tokens_used
 
     except Exception as e:
         if (e.__class__.__name__ == "LocalProtocolError"):
-            print(ansi.FAIL + "INVALID API KEY: " + ansi.ENDC + e.__str__())
+            log.error("INVALID API KEY: %s", e)
+            tracing.mark_error(reason="invalid_key")
 
         elif ("429 RESOURCE_EXHAUSTED" in e.__str__()):
-            print(ansi.ERROR_MSG + "API rate limit exceeded. Please try again later.")
-            print(ansi.INFO_MSG + "If this persists, consider trying a different model or checking your API usage.")
+            log.error("API rate limit exceeded. Please try again later.")
+            start_key_cooldown(key_index)
+            tracing.mark_error(reason="rate_limit")
+            log.info("If this persists, consider trying a different model or checking your API usage.")
 
         else:
-            print(ansi.ERROR_MSG + e.__str__())
+            log.error("%s", e)
+            tracing.mark_error(reason="api_error")
 
-        return None
-    
-def process_question(trayicon: TrayIcon, pdf_sources_list, selected_model, prompt_file_name):
-    # Rotate API key before processing
-    rotate_api_key_and_persist()
-
-    # Take a screenshot of the current screen
-    image_path = take_screenshot()
-    if not os.path.exists(image_path):
-        print(ansi.ERROR_MSG + f"Image file not found at '{image_path}'.")
-        return None
+        return None, 0
     
-    # Prepare content and call API
-    print(ansi.INFO_MSG + "Preparing content for Gemini...")
+def process_question(trayicon, pdf_sources_list, selected_model, prompt_file_name, generation_config=None):
+    """
+    Answers the question on the screen: screenshot, upload, model call and tray update.
+    Every stage is timed as a span of one trace. Returns the number of tokens used.
+    generation_config (e.g. {"temperature": 0.2}) is passed on to the model calls.
+    """
+    metrics.IN_FLIGHT.inc()
+    try:
+        # With a token budget the PDFs are trimmed to fit one request instead
+        if pdf_sources_list and token_budget is None and needs_map_reduce(pdf_sources_list, selected_model):
+            return _process_map_reduce(trayicon, pdf_sources_list, selected_model, prompt_file_name,
+                                       generation_config)
+        return _process_question(trayicon, pdf_sources_list, selected_model, prompt_file_name, generation_config)
+    finally:
+        metrics.IN_FLIGHT.dec()
+
+def _process_question(trayicon, pdf_sources_list, selected_model, prompt_file_name, generation_config=None):
+    with tracing.trace("question", model=selected_model, prompt_file=prompt_file_name,
+                       pdf_count=len(pdf_sources_list)) as trace:
+        log.debug("Trace %s started.", trace.trace_id)
+
+        # Rotate API key before processing
+        # This question keeps its key, even if another one rotates meanwhile
+        with tracing.span("rotate_key"):
+            key_index = rotate_api_key_and_persist()
+        trace.attrs["key_index"] = key_index
+
+        # Take a screenshot of the current screen
+        screenshot = capture_screenshot()
+
+        # Fit the token budget before anything is uploaded
+        try:
+            prompt_text = read_prompt(prompt_path(prompt_file_name))
+        except OSError:
+            prompt_text = None # Reported when the contents are created
+        if token_budget is not None:
+            screenshot, pdf_sources_list = fit_token_budget(screenshot, pdf_sources_list, prompt_text)
+            if screenshot is None:
+                with tracing.span("tray_update"):
+                    trayicon.display_answer("ERR", color="red")
+                tracing.mark_error(reason="token_budget")
+                return 0
+        estimate = token_estimator.Estimate([screenshot.size], pdf_sources_list, prompt_text)
+        trace.attrs["estimated_tokens"] = estimate.total
+
+        image_path = save_screenshot(screenshot)
+        if not os.path.exists(image_path):
+            log.error("Image file not found at '%s'.", image_path)
+            tracing.mark_error()
+            return 0
+
+        # Prepare content and call API
+        log.info("Preparing content for Gemini...")
+
+        with tracing.span("tray_update"):
+            trayicon.set_loading()
+        contents = create_gemini_contents(image_path, pdf_sources_list, prompt_file_name, key_index)
+
+        # Keep the request for replays (only when recording is enabled)
+        if recorder.enabled:
+            prompt_text = contents[-1] if contents else None
+            recorder.capture(image_path, recorder.config_snapshot(
+                pdf_sources_list, selected_model, prompt_file_name, prompt_text))
+
+        tokens_used = 0
+        answer, color = "ERR", "red"
+        if contents:
+            with tracing.span("model_call"):
+                response_text, tokens_used = call_gemini_multimodal(contents, selected_model, key_index,
+                                                                    config=generation_config, estimate=estimate)
+            # The screenshot upload isn't needed anymore
+            file_manager.release(get_client(key_index), key_fingerprint(key_index), contents[0])
+            recorder.set_response(response_text, tokens_used)
+
+            if response_text is not None:
+                log.info(ansi.BOLD + ansi.UNDERLINE + "Response from Gemini:" + ansi.ENDC + " " + ansi.BOLD + "%s" + ansi.ENDC, response_text)
+                answer, color = response_text, "black"
+            else:
+                log.error("Failed to get a valid response from the API.")
+        else:
+            log.error("Failed to prepare content for the API call (image or PDF upload failed).")
 
-    trayicon.set_loading()
-    contents = create_gemini_contents(image_path, pdf_sources_list, prompt_file_name)
+        with tracing.span("tray_update"):
+            trayicon.display_answer(answer, color=color)
+        if answer == "ERR":
+            tracing.mark_error()
+        trace.attrs["tokens"] = tokens_used
+        trace.attrs["answer"] = answer
 
-    tokens_used = 0
-    if contents:
-        response_text, tokens_used = call_gemini_multimodal(contents, selected_model)
+        # Cleanup: Remove the temporary image file
+        try:
+            os.remove(image_path)
+            log.debug("Temporary image file removed.")
+        except Exception as e:
+            log.error("Failed to remove temporary image file '%s': %s", image_path, e)
 
-        print(ansi.INFO_MSG + ansi.BOLD + ansi.UNDERLINE + "Response from Gemini:" + ansi.ENDC, end=" ")
-        if response_text is not None:
-            print(ansi.BOLD + response_text + ansi.ENDC)
-            trayicon.display_answer(response_text)
-        else:
-            print(ansi.ERROR_MSG + "Failed to get a valid response from the API.")
-            trayicon.display_answer("ERR", color="red")
+        return tokens_used
+
+
+# --- Per-question token budget ---
+
+token_budget = None # Input tokens a question may use (--token-budget), None: no limit
+
+def fit_token_budget(screenshot, pdf_sources_list, prompt_text):
+    """
+    Shrinks a question to the token budget: returns the (possibly downscaled)
+    screenshot and the PDFs to send, trimmed PDFs as split files. The
+    screenshot is None if the question can't fit.
+    """
+    plan = token_estimator.fit_budget(screenshot.size, pdf_sources_list, prompt_text, token_budget)
+    if plan.rejected:
+        log.error("The question doesn't fit the budget of %s tokens: %s.", token_budget, plan.rejected)
+        return None, []
+    if plan.scale < 1:
+        from PIL import Image
+        size = (max(1, int(screenshot.width * plan.scale)), max(1, int(screenshot.height * plan.scale)))
+        log.info("Screenshot scaled to %sx%s to fit the token budget.", *size)
+        screenshot = screenshot.resize(size, Image.LANCZOS)
+    sources = []
+    for source, pages in plan.pdf_parts:
+        if pages is None:
+            sources.append(source)
+            continue
+        log.warning("Only the first %s pages of %s fit the token budget.", pages, os.path.basename(source))
+        sources.append(chunking.split_pages(source, 1, pages))
+    for source in plan.dropped:
+        log.warning("%s dropped, it doesn't fit the token budget.", os.path.basename(source))
+    return screenshot, sources
+
+
+# --- Map-reduce: PDF sets larger than the model's input limit ---
+
+DEFAULT_INPUT_TOKEN_LIMIT = 1_048_576
+NOT_FOUND = "NOT_FOUND"
+
+MAP_INSTRUCTION = (
+    "The PDF files above are only one part of the material. If this part contains the answer, "
+    "answer following the instructions above. If it doesn't, reply with exactly " + NOT_FOUND + "."
+)
+REDUCE_INSTRUCTION = (
+    "The material was too large for one request, so the question was asked over its parts separately. "
+    "The answers found in the parts:\n{candidates}\n"
+    "Decide which one is correct and reply following the instructions above."
+)
+NO_CANDIDATES_INSTRUCTION = "None of the parts of the material contained the answer. Answer from your own knowledge."
+
+input_token_limits = {} # model -> input token limit reported by the API
+
+def input_token_limit(selected_model):
+    """Input token limit of a model, asked from the API once."""
+    limit = input_token_limits.get(selected_model)
+    if limit is None:
+        try:
+            limit = get_client(current_index).models.get(model=selected_model).input_token_limit
+        except Exception as e:
+            log.warning("Cannot get the input limit of %s (%s), assuming %s tokens.",
+                        selected_model, e, DEFAULT_INPUT_TOKEN_LIMIT)
+        limit = input_token_limits[selected_model] = limit or DEFAULT_INPUT_TOKEN_LIMIT
+    return limit
+
+def needs_map_reduce(pdf_sources_list, selected_model):
+    """True if the question with all the PDFs likely doesn't fit into one request."""
+    return (token_estimator.estimate_input_tokens(pdf_sources_list)
+            > input_token_limit(selected_model) * chunking.CONTEXT_SHARE)
+
+def map_reduce_chunks(pdf_sources_list, selected_model):
+    """The chunks a question over the PDFs is split into."""
+    # What is left of the input for PDFs next to the screenshot and the prompt
+    budget = int(input_token_limit(selected_model) * chunking.CONTEXT_SHARE) - token_estimator.estimate_input_tokens([])
+    return chunking.plan(pdf_sources_list, budget)
+
+def question_sources(pdf_sources_list, selected_model):
+    """The files a question over the PDFs uploads: the PDFs, or their chunks if they are too large."""
+    if pdf_sources_list and needs_map_reduce(pdf_sources_list, selected_model):
+        return [f for chunk in map_reduce_chunks(pdf_sources_list, selected_model) for f in chunking.chunk_files(chunk)]
+    return pdf_sources_list
+
+def _map_chunk(trace, chunk, image_path, selected_model, prompt_file_name, generation_config):
+    """Asks the question over one chunk with its own key. Returns (answer or None, tokens)."""
+    with tracing.attach(trace):
+        with tracing.span("rotate_key"):
+            key_index = rotate_api_key_and_persist()
+        try:
+            files = chunking.chunk_files(chunk)
+        except Exception as e:
+            log.error("Cannot prepare %s: %s", chunk, e)
+            return None, 0
+        contents = create_gemini_contents(image_path, files, prompt_file_name, key_index)
+        if not contents:
+            return None, 0
+        client, fingerprint = get_client(key_index), key_fingerprint(key_index)
+        if len(contents) != len(files) + 2: # A PDF of the chunk failed to upload
+            log.error("Skipping %s, not all of its PDFs could be uploaded.", chunk)
+            file_manager.release(client, fingerprint, contents[0])
+            return None, 0
+        contents.append(MAP_INSTRUCTION)
+
+        with tracing.span("map_call", chunk_tokens=chunk.tokens):
+            answer, tokens_used = call_gemini_multimodal(contents, selected_model, key_index, config=generation_config)
+        file_manager.release(client, fingerprint, contents[0])
+        log.debug("%s answered %r.", chunk, answer)
+        return answer, tokens_used
+
+def _reduce_answers(image_path, candidates, selected_model, prompt_file_name, generation_config):
+    """One short call picking the final answer from the chunk answers. Returns (answer or None, tokens)."""
+    with tracing.span("rotate_key"):
+        key_index = rotate_api_key_and_persist()
+    contents = create_gemini_contents(image_path, [], prompt_file_name, key_index)
+    if not contents:
+        return None, 0
+    if candidates:
+        contents.append(REDUCE_INSTRUCTION.format(candidates="\n".join(f"- {c}" for c in candidates)))
     else:
-        print(ansi.ERROR_MSG + "Failed to prepare content for the API call (image or PDF upload failed).")
-        trayicon.display_answer("ERR", color="red")
+        contents.append(NO_CANDIDATES_INSTRUCTION)
+    with tracing.span("model_call"):
+        answer, tokens_used = call_gemini_multimodal(contents, selected_model, key_index, config=generation_config)
+    file_manager.release(get_client(key_index), key_fingerprint(key_index), contents[0])
+    return answer, tokens_used
+
+def _process_map_reduce(trayicon, pdf_sources_list, selected_model, prompt_file_name, generation_config=None):
+    with tracing.trace("question", model=selected_model, prompt_file=prompt_file_name,
+                       pdf_count=len(pdf_sources_list)) as trace:
+        chunks = map_reduce_chunks(pdf_sources_list, selected_model)
+        trace.attrs["chunks"] = len(chunks)
+        log.info("The PDFs don't fit into one request, asking the question over %s chunks.", len(chunks))
+
+        screenshot = capture_screenshot()
+        image_path = save_screenshot(screenshot)
+        with tracing.span("tray_update"):
+            trayicon.set_loading()
+
+        # The answers are cached by the question region, the rest of the screen changes between captures
+        question = chunking.question_key(screenshot)
+        prompt_file = prompt_path(prompt_file_name)
+        prompt_sha256 = file_manager.file_sha256(prompt_file) if os.path.exists(prompt_file) else ""
+        cache_keys = [chunking.cache_key(c, question, selected_model, prompt_sha256, generation_config)
+                      if question else None for c in chunks]
+        answers = [chunking.cached_answer(k) if k else None for k in cache_keys]
+        todo = [i for i, a in enumerate(answers) if a is None]
+        trace.attrs["cached_chunks"] = len(chunks) - len(todo)
+
+        # Map: the chunks in parallel, one key per worker
+        tokens_used = 0
+        if todo:
+            workers = min(len(todo), max(1, len(api_keys) - len(key_cooldowns_remaining())))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="map-chunk") as pool:
+                results = list(pool.map(
+                    lambda i: _map_chunk(trace, chunks[i], image_path, selected_model, prompt_file_name,
+                                         generation_config), todo))
+            for i, (answer, tokens) in zip(todo, results):
+                tokens_used += tokens
+                if answer is not None:
+                    answers[i] = answer
+                    if cache_keys[i]:
+                        chunking.store_answer(cache_keys[i], answer)
+        else:
+            log.info("All %s chunk answers are cached.", len(chunks))
+
+        # Reduce: skipped when the chunks agree
+        failed = sum(1 for a in answers if a is None)
+        candidates = list(dict.fromkeys(a for a in answers if a is not None and a.strip().rstrip(".") != NOT_FOUND))
+        answer, color = "ERR", "red"
+        if failed == len(chunks):
+            log.error("Every chunk failed, no answer.")
+        else:
+            if failed:
+                log.warning("%s of %s chunks failed, answering from the rest.", failed, len(chunks))
+            if len(candidates) == 1:
+                response_text = candidates[0]
+            else:
+                response_text, tokens = _reduce_answers(image_path, candidates, selected_model, prompt_file_name,
+                                                        generation_config)
+                tokens_used += tokens
+            if response_text is not None:
+                log.info(ansi.BOLD + ansi.UNDERLINE + "Response from Gemini:" + ansi.ENDC + " " + ansi.BOLD + "%s" + ansi.ENDC, response_text)
+                answer, color = response_text, "black"
+
+        with tracing.span("tray_update"):
+            trayicon.display_answer(answer, color=color)
+        if answer == "ERR":
+            tracing.mark_error()
+        trace.attrs["tokens"] = tokens_used
+        trace.attrs["answer"] = answer
 
-    # Cleanup: Remove the temporary image file
+        try:
+            os.remove(image_path)
+        except Exception as e:
+            log.error("Failed to remove temporary image file '%s': %s", image_path, e)
+        return tokens_used
+
+
+# --- Batch mode: several captures answered by one request ---
+
+BATCH_MAX_CAPTURES = 20
+BATCH_DISPLAY_SECONDS = 2 # How long each answer of a batch stays in the tray
+
+BATCH_INSTRUCTION = (
+    "The {count} images are separate captures, numbered 1 to {count} in the order they were given. "
+    "Answer the question of each capture separately, following the instructions above, "
+    "and return exactly one entry per capture."
+)
+
+# Structured response: one answer per capture
+BATCH_RESPONSE_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "OBJECT",
+        "properties": {
+            "answers": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "capture": {"type": "INTEGER"},
+                        "answer": {"type": "STRING"},
+                    },
+                    "required": ["capture", "answer"],
+                },
+            },
+        },
+        "required": ["answers"],
+    },
+}
+
+def parse_batch_answers(response_text, count):
+    """Returns the answers of a batch response in capture order ("?" for missing ones), or None."""
     try:
-        os.remove(image_path)
-        print(ansi.INFO_MSG + "Temporary image file removed.")
-    except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to remove temporary image file '{image_path}': {e}")
-    
+        entries = json.loads(response_text)["answers"]
+        by_capture = {int(e["capture"]): str(e["answer"]).strip() for e in entries}
+    except (ValueError, KeyError, TypeError) as e:
+        log.error("Could not parse the batch response: %s", e)
+        return None
+    missing = [i for i in range(1, count + 1) if i not in by_capture]
+    if missing:
+        log.warning("The batch response has no answer for capture(s) %s.", missing)
+    return [by_capture.get(i, "?") for i in range(1, count + 1)]
+
+_batch_display_stop = threading.Event() # Stops the sequence of the previous batch
+
+def _play_batch_answers(trayicon, answers, stop):
+    for i, answer in enumerate(answers, start=1):
+        trayicon.display_answer(f"{i}:{answer}", color="black")
+        if stop.wait(BATCH_DISPLAY_SECONDS):
+            return
+    trayicon.display_answer(" ".join(answers), color="black")
+
+def display_batch_answers(trayicon, answers):
+    """
+    Shows the answers one after the other in the tray, then all of them together.
+    Returns right away, the sequence plays on a daemon thread.
+    """
+    global _batch_display_stop
+    _batch_display_stop.set()
+    stop = _batch_display_stop = threading.Event()
+    threading.Thread(target=_play_batch_answers, args=(trayicon, answers, stop),
+                     name="batch-display", daemon=True).start()
+
+def process_batch(trayicon, image_paths, pdf_sources_list, selected_model, prompt_file_name):
+    """
+    Answers several queued captures with one request, sharing the PDF and prompt
+    context. Removes the temporary image files. Returns the number of tokens used.
+    """
+    metrics.IN_FLIGHT.inc()
+    try:
+        answers, tokens_used = _process_batch(trayicon, image_paths, pdf_sources_list,
+                                              selected_model, prompt_file_name)
+    finally:
+        metrics.IN_FLIGHT.dec()
+        for path in image_paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.error("Failed to remove temporary image file '%s': %s", path, e)
+
+    if answers:
+        display_batch_answers(trayicon, answers)
+    else:
+        trayicon.display_answer("ERR", color="red")
     return tokens_used
 
+def _process_batch(trayicon, image_paths, pdf_sources_list, selected_model, prompt_file_name):
+    count = len(image_paths)
+    with tracing.trace("batch", model=selected_model, prompt_file=prompt_file_name,
+                       pdf_count=len(pdf_sources_list), captures=count) as trace:
+        with tracing.span("rotate_key"):
+            key_index = rotate_api_key_and_persist()
+        trace.attrs["key_index"] = key_index
+
+        log.info("Preparing a batch of %s captures for Gemini...", count)
+        with tracing.span("tray_update"):
+            trayicon.set_loading()
+        contents = create_gemini_contents(image_paths, pdf_sources_list, prompt_file_name, key_index)
+        if not contents:
+            log.error("Failed to prepare content for the batch (image or PDF upload failed).")
+            tracing.mark_error()
+            return None, 0
+        contents.append(BATCH_INSTRUCTION.format(count=count))
+
+        with tracing.span("model_call"):
+            response_text, tokens_used = call_gemini_multimodal(
+                contents, selected_model, key_index, config=BATCH_RESPONSE_CONFIG)
+        for uploaded in contents[:count]:
+            file_manager.release(get_client(key_index), key_fingerprint(key_index), uploaded)
+        trace.attrs["tokens"] = tokens_used
+
+        answers = parse_batch_answers(response_text, count) if response_text else None
+        if answers is None:
+            log.error("Failed to get valid batch answers from the API.")
+            tracing.mark_error()
+            trace.attrs["answer"] = "ERR"
+            return None, tokens_used
+        trace.attrs["answer"] = " ".join(answers)
+
+        log.info(ansi.BOLD + ansi.UNDERLINE + "Batch answers from Gemini:" + ansi.ENDC + " " + ansi.BOLD + "%s" + ansi.ENDC,
+                 "  ".join(f"{i}: {a}" for i, a in enumerate(answers, start=1)))
+        log.info("%s tokens for %s captures (%.0f per capture).", tokens_used, count, tokens_used / count)
+        return answers, tokens_used
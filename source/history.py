@@ -0,0 +1,206 @@
+# Answer history in a local SQLite database (../history.db). Every finished
+# question (or batch) is stored with its timestamp, model, prompt file, answer,
+# tokens (total and input), latency and a thumbnail hash of the screenshot.
+# Rows are written by a background thread; searches go through an FTS5 index
+# and pages are read with keyset pagination (id < cursor), so both stay fast
+# on large histories.
+import queue
+import sqlite3
+import threading
+import time
+
+import tracing
+from logs import get_logger
+
+log = get_logger("history")
+
+HISTORY_DB = "../history.db"
+PAGE_SIZE = 50
+WRITE_BATCH = 100 # Max rows inserted in one transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    model TEXT,
+    prompt_file TEXT,
+    answer TEXT NOT NULL,
+    tokens INTEGER,
+    input_tokens INTEGER,
+    latency_ms REAL,
+    thumbnail_hash TEXT,
+    model_ms REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS answers_thumbnail ON answers(thumbnail_hash);
+"""
+
+# External content FTS table, kept in sync by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(
+    answer, model, prompt_file, content='answers', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS answers_ai AFTER INSERT ON answers BEGIN
+    INSERT INTO answers_fts(rowid, answer, model, prompt_file)
+    VALUES (new.id, new.answer, new.model, new.prompt_file);
+END;
+CREATE TRIGGER IF NOT EXISTS answers_ad AFTER DELETE ON answers BEGIN
+    INSERT INTO answers_fts(answers_fts, rowid, answer, model, prompt_file)
+    VALUES ('delete', old.id, old.answer, old.model, old.prompt_file);
+END;
+"""
+
+_COLUMNS = ("id, created, kind, status, model, prompt_file, answer, tokens, input_tokens, latency_ms,"
+            " thumbnail_hash, model_ms, error")
+
+enabled = False
+has_fts = False
+_queue = queue.Queue(maxsize=1000) # Rows waiting for the writer thread
+_writer = None
+_local = threading.local() # One read connection per thread
+
+
+def _connect():
+    conn = sqlite3.connect(HISTORY_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _read_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _connect()
+    return conn
+
+
+def enable():
+    """Creates the database if needed and starts recording finished questions."""
+    global enabled, has_fts, _writer
+    if enabled:
+        return
+    conn = _connect()
+    conn.execute("PRAGMA journal_mode=WAL") # Readers don't wait for the writer
+    conn.executescript(_SCHEMA)
+    try:
+        conn.executescript(_FTS_SCHEMA)
+        has_fts = True
+    except sqlite3.OperationalError as e:
+        log.warning("SQLite has no FTS5 (%s), history search falls back to LIKE.", e)
+    conn.commit()
+    conn.close()
+
+    _writer = threading.Thread(target=_write_loop, name="history-writer", daemon=True)
+    _writer.start()
+    tracing.add_listener(_on_trace_finished)
+    enabled = True
+    log.info("Answer history enabled (%s).", HISTORY_DB)
+
+
+def thumbnail_hash(image):
+    """64-bit average hash of a screenshot: equal for the same question seen twice."""
+    small = image.resize((8, 8)).convert("L")
+    pixels = list(small.getdata())
+    mean = sum(pixels) / len(pixels)
+    bits = 0
+    for p in pixels:
+        bits = (bits << 1) | (p > mean)
+    return f"{bits:016x}"
+
+
+def _on_trace_finished(record):
+    attrs = record["attrs"]
+    if "answer" not in attrs:
+        return
+    model_ms = sum(s["duration_ms"] for s in record["spans"] if s["name"] == "model_call")
+    row = (record["started_at"], record["name"], record["status"], attrs.get("model"),
+           attrs.get("prompt_file"), attrs["answer"], attrs.get("tokens"), attrs.get("input_tokens"),
+           round(record["duration_ms"], 1), attrs.get("thumbnail_hash"),
+           round(model_ms, 1), attrs.get("error"))
+    try:
+        _queue.put_nowait(row)
+    except queue.Full:
+        log.warning("History queue is full, an answer was not stored.")
+
+
+def _write_loop():
+    """Inserts the queued rows, several per transaction when they pile up."""
+    conn = _connect()
+    while True:
+        rows = [_queue.get()]
+        while len(rows) < WRITE_BATCH:
+            try:
+                rows.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO answers (created, kind, status, model, prompt_file, answer, tokens, input_tokens,"
+                    " latency_ms, thumbnail_hash, model_ms, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            log.debug("Stored %s answers in the history.", len(rows))
+        except sqlite3.Error as e:
+            log.error("Failed to store %s answers in the history: %s", len(rows), e)
+
+
+def recent(limit=5000, kind="question"):
+    """Returns the newest stored rows of a kind as dicts, newest first."""
+    if not enabled:
+        return []
+    rows = _read_connection().execute(
+        f"SELECT {_COLUMNS} FROM answers WHERE kind = ? ORDER BY id DESC LIMIT ?", (kind, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _match_query(text):
+    """Turns free text into an FTS5 query: every word as a quoted prefix term."""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+def search(text="", before_id=None, limit=PAGE_SIZE):
+    """
+    Returns {"entries": [...], "nextCursor": id or None}, newest first.
+    Pass nextCursor as before_id to get the next page.
+    """
+    if not enabled:
+        return {"entries": [], "nextCursor": None}
+    limit = max(1, min(int(limit), 500))
+    cursor = int(before_id) if before_id else None
+    text = (text or "").strip()
+
+    if not text:
+        sql = f"SELECT {_COLUMNS} FROM answers"
+        where, params = [], []
+        if cursor:
+            where.append("id < ?")
+            params.append(cursor)
+    elif has_fts:
+        sql = (f"SELECT {', '.join('a.' + c.strip() for c in _COLUMNS.split(','))} "
+               "FROM answers_fts JOIN answers a ON a.id = answers_fts.rowid")
+        where, params = ["answers_fts MATCH ?"], [_match_query(text)]
+        if cursor:
+            where.append("answers_fts.rowid < ?")
+            params.append(cursor)
+    else:
+        sql = f"SELECT {_COLUMNS} FROM answers"
+        where, params = ["answer LIKE ?"], [f"%{text}%"]
+        if cursor:
+            where.append("id < ?")
+            params.append(cursor)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {'answers_fts.rowid' if text and has_fts else 'id'} DESC LIMIT ?"
+    params.append(limit + 1) # One extra row tells if there is a next page
+
+    start = time.perf_counter()
+    try:
+        rows = _read_connection().execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        log.warning("History search for %r failed: %s", text, e)
+        return {"entries": [], "nextCursor": None}
+    log.debug("History query %r took %.1f ms.", text, (time.perf_counter() - start) * 1000)
+
+    entries = [dict(row) for row in rows[:limit]]
+    next_cursor = entries[-1]["id"] if len(rows) > limit else None
+    return {"entries": entries, "nextCursor": next_cursor}
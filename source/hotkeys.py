@@ -0,0 +1,367 @@
+# Global hotkey backends. All of them take hotkeys in the `keyboard` library's
+# notation ("ctrl+shift+q") and run the callback on a background thread:
+#   win32     RegisterHotKey, the OS matches the keys (default on Windows)
+#   x11       XGrabKey on the X11 root window, no root rights needed
+#   keyboard  the `keyboard` library (fallback; its global hook runs Python on every keystroke)
+#   fake      never fires by itself, trigger() presses a hotkey (benchmarks, socket-only runs)
+# win32 and x11 only wake Python when a registered combination is pressed.
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import sys
+import threading
+
+from logs import get_logger
+
+log = get_logger("hotkeys")
+
+
+class KeyboardHotkeys:
+    name = "keyboard"
+
+    def __init__(self):
+        import keyboard
+        self._keyboard = keyboard
+
+    def add_hotkey(self, combo, callback):
+        self._keyboard.add_hotkey(combo, callback)
+
+    def unhook_all(self):
+        self._keyboard.unhook_all_hotkeys()
+
+    def stop(self):
+        self.unhook_all()
+
+
+# --- X11 ---
+
+_SHIFT, _LOCK, _CONTROL, _MOD1, _MOD2, _MOD4 = 1, 2, 4, 8, 16, 64
+_KEY_PRESS = 2
+_GRAB_MODE_ASYNC = 1
+_MODIFIERS = {"ctrl": _CONTROL, "control": _CONTROL, "shift": _SHIFT, "alt": _MOD1,
+              "win": _MOD4, "windows": _MOD4, "super": _MOD4, "cmd": _MOD4}
+_IGNORED = _LOCK | _MOD2 # Caps Lock and Num Lock must not change the hotkey
+_KEYSYM_NAMES = {"esc": "Escape", "enter": "Return", "space": "space", "tab": "Tab",
+                 "backspace": "BackSpace", "delete": "Delete", "insert": "Insert",
+                 "home": "Home", "end": "End", "page up": "Prior", "page down": "Next",
+                 "up": "Up", "down": "Down", "left": "Left", "right": "Right"}
+
+
+class _XKeyEvent(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_int), ("serial", ctypes.c_ulong), ("send_event", ctypes.c_int),
+                ("display", ctypes.c_void_p), ("window", ctypes.c_ulong), ("root", ctypes.c_ulong),
+                ("subwindow", ctypes.c_ulong), ("time", ctypes.c_ulong),
+                ("x", ctypes.c_int), ("y", ctypes.c_int), ("x_root", ctypes.c_int), ("y_root", ctypes.c_int),
+                ("state", ctypes.c_uint), ("keycode", ctypes.c_uint), ("same_screen", ctypes.c_int)]
+
+
+class _XEvent(ctypes.Union):
+    _fields_ = [("type", ctypes.c_int), ("xkey", _XKeyEvent), ("pad", ctypes.c_long * 24)]
+
+
+_XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+
+def _load_xlib():
+    path = ctypes.util.find_library("X11")
+    if not path:
+        raise RuntimeError("libX11 not found.")
+    xlib = ctypes.cdll.LoadLibrary(path)
+    xlib.XOpenDisplay.restype = ctypes.c_void_p
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+    xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    xlib.XStringToKeysym.restype = ctypes.c_ulong
+    xlib.XStringToKeysym.argtypes = [ctypes.c_char_p]
+    xlib.XKeysymToKeycode.restype = ctypes.c_ubyte
+    xlib.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    xlib.XGrabKey.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_uint, ctypes.c_ulong,
+                              ctypes.c_int, ctypes.c_int, ctypes.c_int]
+    xlib.XUngrabKey.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_uint, ctypes.c_ulong]
+    xlib.XPending.argtypes = [ctypes.c_void_p]
+    xlib.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XEvent)]
+    xlib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+    xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    xlib.XSetErrorHandler.argtypes = [_XErrorHandler]
+    return xlib
+
+
+class X11Hotkeys:
+    """Grabs the keys on the root window and waits for their events on one thread."""
+    name = "x11"
+
+    def __init__(self, display=None):
+        self._xlib = _load_xlib()
+        name = display or os.environ.get("DISPLAY")
+        self._display = self._xlib.XOpenDisplay(name.encode() if name else None)
+        if not self._display:
+            raise RuntimeError(f"Cannot open X11 display {name!r}.")
+        self._root = self._xlib.XDefaultRootWindow(self._display)
+        # The default handler exits the process, e.g. when a key is already grabbed by another app
+        self._error_handler = _XErrorHandler(self._on_x_error)
+        self._xlib.XSetErrorHandler(self._error_handler)
+
+        self._lock = threading.Lock() # Xlib calls of the event thread and the callers
+        self._hotkeys = {} # (keycode, modifiers) -> (combo, callback)
+        self._running = True
+        self._thread = threading.Thread(target=self._event_loop, name="x11-hotkeys", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _on_x_error(display, event):
+        log.error("X11 error while grabbing a hotkey (already used by another application?).")
+        return 0
+
+    def _parse(self, combo):
+        modifiers, key = 0, None
+        for part in combo.lower().split("+"):
+            part = part.strip()
+            if part in _MODIFIERS:
+                modifiers |= _MODIFIERS[part]
+            else:
+                key = part
+        if key is None:
+            raise ValueError(f"Hotkey {combo!r} has no key.")
+        if key in _KEYSYM_NAMES:
+            key = _KEYSYM_NAMES[key]
+        elif key[0] == "f" and key[1:].isdigit():
+            key = key.upper()
+        keysym = self._xlib.XStringToKeysym(key.encode())
+        keycode = self._xlib.XKeysymToKeycode(self._display, keysym) if keysym else 0
+        if not keycode:
+            raise ValueError(f"Unknown key {key!r} in hotkey {combo!r}.")
+        return keycode, modifiers
+
+    def add_hotkey(self, combo, callback):
+        with self._lock:
+            keycode, modifiers = self._parse(combo)
+            for extra in (0, _LOCK, _MOD2, _LOCK | _MOD2):
+                self._xlib.XGrabKey(self._display, keycode, modifiers | extra, self._root,
+                                    False, _GRAB_MODE_ASYNC, _GRAB_MODE_ASYNC)
+            self._xlib.XSync(self._display, False)
+            self._hotkeys[(keycode, modifiers)] = (combo, callback)
+
+    def unhook_all(self):
+        with self._lock:
+            for keycode, modifiers in self._hotkeys:
+                for extra in (0, _LOCK, _MOD2, _LOCK | _MOD2):
+                    self._xlib.XUngrabKey(self._display, keycode, modifiers | extra, self._root)
+            self._xlib.XSync(self._display, False)
+            self._hotkeys.clear()
+
+    def _event_loop(self):
+        fd = self._xlib.XConnectionNumber(self._display)
+        event = _XEvent()
+        while self._running:
+            # Wait on the connection without holding the lock, so add_hotkey isn't blocked
+            select.select([fd], [], [], 0.5)
+            with self._lock:
+                pressed = []
+                while self._running and self._xlib.XPending(self._display):
+                    self._xlib.XNextEvent(self._display, ctypes.byref(event))
+                    if event.type == _KEY_PRESS:
+                        key = (event.xkey.keycode, event.xkey.state & ~_IGNORED)
+                        if key in self._hotkeys:
+                            pressed.append(self._hotkeys[key])
+            for combo, callback in pressed:
+                log.debug("Hotkey %s pressed.", combo)
+                threading.Thread(target=callback, daemon=True).start()
+
+    def stop(self):
+        self.unhook_all()
+        self._running = False
+        self._thread.join(timeout=2)
+        with self._lock:
+            self._xlib.XCloseDisplay(self._display)
+
+
+# --- Windows ---
+
+_MOD_ALT, _MOD_CONTROL, _MOD_SHIFT, _MOD_WIN, _MOD_NOREPEAT = 0x1, 0x2, 0x4, 0x8, 0x4000
+_WIN_MODIFIERS = {"ctrl": _MOD_CONTROL, "control": _MOD_CONTROL, "shift": _MOD_SHIFT, "alt": _MOD_ALT,
+                  "win": _MOD_WIN, "windows": _MOD_WIN, "super": _MOD_WIN, "cmd": _MOD_WIN}
+_VK_NAMES = {"esc": 0x1B, "enter": 0x0D, "space": 0x20, "tab": 0x09, "backspace": 0x08,
+             "delete": 0x2E, "insert": 0x2D, "home": 0x24, "end": 0x23, "page up": 0x21, "page down": 0x22,
+             "left": 0x25, "up": 0x26, "right": 0x27, "down": 0x28}
+_WM_QUIT, _WM_HOTKEY, _WM_APP = 0x0012, 0x0312, 0x8000
+
+
+class _MSG(ctypes.Structure):
+    _fields_ = [("hwnd", ctypes.c_void_p), ("message", ctypes.c_uint), ("wParam", ctypes.c_size_t),
+                ("lParam", ctypes.c_ssize_t), ("time", ctypes.c_uint32), ("pt_x", ctypes.c_long),
+                ("pt_y", ctypes.c_long), ("lPrivate", ctypes.c_uint32)]
+
+
+class Win32Hotkeys:
+    """RegisterHotKey on a thread of its own, whose message loop gets WM_HOTKEY."""
+    name = "win32"
+
+    def __init__(self):
+        if sys.platform != "win32":
+            raise RuntimeError("The win32 hotkey backend only runs on Windows.")
+        user32, kernel32 = ctypes.windll.user32, ctypes.windll.kernel32
+        user32.RegisterHotKey.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_uint, ctypes.c_uint]
+        user32.UnregisterHotKey.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        user32.GetMessageW.argtypes = [ctypes.POINTER(_MSG), ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint]
+        user32.PeekMessageW.argtypes = [ctypes.POINTER(_MSG), ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint,
+                                        ctypes.c_uint]
+        user32.PostThreadMessageW.argtypes = [ctypes.c_uint32, ctypes.c_uint, ctypes.c_size_t, ctypes.c_ssize_t]
+        user32.VkKeyScanW.argtypes = [ctypes.c_wchar]
+        user32.VkKeyScanW.restype = ctypes.c_short
+        self._user32, self._kernel32 = user32, kernel32
+
+        self._hotkeys = {} # hotkey id -> (combo, callback), only touched by the message loop thread
+        self._next_id = 1
+        self._requests = queue.Queue() # (function, args, done event, result dict) for the message loop
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._message_loop, name="win32-hotkeys", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout=2):
+            raise RuntimeError("The hotkey message loop did not start.")
+
+    def _parse(self, combo):
+        modifiers, key = 0, None
+        for part in combo.lower().split("+"):
+            part = part.strip()
+            if part in _WIN_MODIFIERS:
+                modifiers |= _WIN_MODIFIERS[part]
+            else:
+                key = part
+        if key is None:
+            raise ValueError(f"Hotkey {combo!r} has no key.")
+        if key in _VK_NAMES:
+            vk = _VK_NAMES[key]
+        elif key[0] == "f" and key[1:].isdigit() and 1 <= int(key[1:]) <= 24:
+            vk = 0x70 + int(key[1:]) - 1
+        elif len(key) == 1 and key.isalnum():
+            vk = ord(key.upper())
+        elif len(key) == 1:
+            vk = self._user32.VkKeyScanW(key) & 0xFF
+            if vk == 0xFF:
+                raise ValueError(f"Unknown key {key!r} in hotkey {combo!r}.")
+        else:
+            raise ValueError(f"Unknown key {key!r} in hotkey {combo!r}.")
+        return modifiers, vk
+
+    def _call(self, func, *args):
+        """Runs func on the message loop thread: hotkeys belong to the thread that registered them."""
+        done, result = threading.Event(), {}
+        self._requests.put((func, args, done, result))
+        self._user32.PostThreadMessageW(self._thread_id, _WM_APP, 0, 0)
+        if not done.wait(timeout=5):
+            raise RuntimeError("The hotkey message loop is not responding.")
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+    def _register(self, combo, modifiers, vk, callback):
+        hotkey_id, self._next_id = self._next_id, self._next_id + 1
+        if not self._user32.RegisterHotKey(None, hotkey_id, modifiers | _MOD_NOREPEAT, vk):
+            # Raised through _call, so the caller knows the hotkey doesn't work
+            raise RuntimeError(f"Cannot register hotkey {combo} (already used by another application?).")
+        self._hotkeys[hotkey_id] = (combo, callback)
+
+    def _unregister_all(self):
+        for hotkey_id in self._hotkeys:
+            self._user32.UnregisterHotKey(None, hotkey_id)
+        self._hotkeys.clear()
+
+    def add_hotkey(self, combo, callback):
+        modifiers, vk = self._parse(combo)
+        self._call(self._register, combo, modifiers, vk, callback)
+
+    def unhook_all(self):
+        self._call(self._unregister_all)
+
+    def _message_loop(self):
+        self._thread_id = self._kernel32.GetCurrentThreadId()
+        msg = _MSG()
+        # Creates the thread's message queue, so PostThreadMessage works from now on
+        self._user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, 0)
+        self._ready.set()
+        while self._user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            if msg.message == _WM_HOTKEY:
+                entry = self._hotkeys.get(msg.wParam)
+                if entry is not None:
+                    log.debug("Hotkey %s pressed.", entry[0])
+                    threading.Thread(target=entry[1], daemon=True).start()
+            elif msg.message == _WM_APP:
+                while True:
+                    try:
+                        func, args, done, result = self._requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        result["value"] = func(*args)
+                    except Exception as e:
+                        result["error"] = e
+                    done.set()
+
+    def stop(self):
+        if not self._thread.is_alive():
+            return
+        self.unhook_all()
+        self._user32.PostThreadMessageW(self._thread_id, _WM_QUIT, 0, 0)
+        self._thread.join(timeout=2)
+
+
+class FakeHotkeys:
+    name = "fake"
+
+    def __init__(self):
+        self._hotkeys = {}
+
+    def add_hotkey(self, combo, callback):
+        self._hotkeys[combo] = callback
+
+    def unhook_all(self):
+        self._hotkeys.clear()
+
+    def trigger(self, combo):
+        """Runs the callback of a registered hotkey on the calling thread."""
+        callback = self._hotkeys.get(combo)
+        if callback is not None:
+            callback()
+
+    def stop(self):
+        self.unhook_all()
+
+
+BACKENDS = {
+    "win32": Win32Hotkeys,
+    "x11": X11Hotkeys,
+    "keyboard": KeyboardHotkeys,
+    "fake": FakeHotkeys,
+}
+FALLBACK_BACKEND = "keyboard"
+
+
+def default_backend_name():
+    if sys.platform == "win32":
+        return "win32"
+    if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        return "x11"
+    return FALLBACK_BACKEND
+
+
+def create_backend(name=None):
+    """
+    Creates the named hotkey backend, or the default one of this platform.
+    If the default one fails, the keyboard library is used instead.
+    """
+    explicit = name is not None
+    name = name or default_backend_name()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown hotkey backend {name!r} (available: {', '.join(BACKENDS)}).")
+    try:
+        backend = BACKENDS[name]()
+    except Exception as e:
+        if explicit or name == FALLBACK_BACKEND:
+            raise
+        log.warning("The %s hotkey backend is not available (%s), falling back to %s.", name, e, FALLBACK_BACKEND)
+        name, backend = FALLBACK_BACKEND, BACKENDS[FALLBACK_BACKEND]()
+    log.info("Using the %s hotkey backend.", name)
+    return backend
@@ -0,0 +1,178 @@
+# Per-keystroke overhead of the hotkey backends.
+# With a backend listening for the app's hotkeys, ordinary keystrokes (Shift
+# taps, which type nothing) are injected through the OS (SendInput on
+# Windows, XTest on X11), and the CPU time this process spends on them is
+# compared with the same injection without a backend. A global hook (the
+# keyboard library) runs Python code on every keystroke; OS-level
+# registrations (win32, x11) only wake Python when a bound combination is
+# pressed. It also times injected hotkey presses until their callback runs.
+# The fake backend can't see keystrokes, only its trigger() latency is timed.
+#
+# Usage:
+#   py hotkeys_bench.py
+#   py hotkeys_bench.py --backends x11,keyboard --keystrokes 2000
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import hotkeys
+import logs
+import tracing
+
+APP_HOTKEYS = ("ctrl+shift+q", "ctrl+shift+a", "ctrl+shift+x", "ctrl+alt+shift+c") # main.HOTKEYS
+BENCH_HOTKEY = "ctrl+alt+shift+f12"
+DRAIN_SECONDS = 0.5 # Time for the listeners to process the injected events
+
+
+class Win32Injector:
+    _VK = {"shift": 0x10, "ctrl": 0x11, "alt": 0x12, "f12": 0x7B}
+
+    def __init__(self):
+        self._user32 = ctypes.windll.user32
+
+    def key(self, name, down):
+        self._user32.keybd_event(self._VK[name], 0, 0 if down else 2, 0) # 2: KEYEVENTF_KEYUP
+
+    def flush(self):
+        pass
+
+
+class XTestInjector:
+    _KEYSYMS = {"shift": b"Shift_L", "ctrl": b"Control_L", "alt": b"Alt_L", "f12": b"F12"}
+
+    def __init__(self):
+        path = ctypes.util.find_library("Xtst")
+        if not path or not os.environ.get("DISPLAY"):
+            raise RuntimeError("XTest needs libXtst and an X11 display.")
+        self._xlib = hotkeys._load_xlib()
+        self._xlib.XFlush.argtypes = [ctypes.c_void_p]
+        self._xtst = ctypes.cdll.LoadLibrary(path)
+        self._xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        self._display = self._xlib.XOpenDisplay(None)
+        if not self._display:
+            raise RuntimeError("Cannot open the X11 display.")
+        self._keycodes = {name: self._xlib.XKeysymToKeycode(self._display, self._xlib.XStringToKeysym(keysym))
+                          for name, keysym in self._KEYSYMS.items()}
+
+    def key(self, name, down):
+        self._xtst.XTestFakeKeyEvent(self._display, self._keycodes[name], down, 0)
+
+    def flush(self):
+        self._xlib.XFlush(self._display)
+
+
+def create_injector():
+    try:
+        return Win32Injector() if sys.platform == "win32" else XTestInjector()
+    except Exception as e:
+        print(f"Keystrokes can't be injected ({e}), only trigger latency is measured.")
+        return None
+
+
+def inject_taps(injector, count):
+    """Taps Shift count times and returns the process CPU seconds spent until the events are processed."""
+    cpu = time.process_time()
+    for _ in range(count):
+        injector.key("shift", True)
+        injector.key("shift", False)
+    injector.flush()
+    time.sleep(DRAIN_SECONDS)
+    return time.process_time() - cpu
+
+
+def press_hotkey(injector):
+    for name in ("ctrl", "alt", "shift", "f12"):
+        injector.key(name, True)
+    for name in ("f12", "shift", "alt", "ctrl"):
+        injector.key(name, False)
+    injector.flush()
+
+
+def measure_latency(backend, press, presses):
+    """p50/p95 ms from pressing BENCH_HOTKEY to its callback."""
+    fired = threading.Event()
+    backend.add_hotkey(BENCH_HOTKEY, fired.set)
+    durations = []
+    for _ in range(presses):
+        fired.clear()
+        start = time.perf_counter()
+        press()
+        if fired.wait(timeout=2):
+            durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return {
+        "fired": len(durations),
+        "p50_ms": round(tracing.percentile(durations, 50), 3) if durations else None,
+        "p95_ms": round(tracing.percentile(durations, 95), 3) if durations else None,
+    }
+
+
+def bench_backend(name, injector, keystrokes, presses, baseline):
+    backend = hotkeys.create_backend(name)
+    try:
+        for combo in APP_HOTKEYS:
+            backend.add_hotkey(combo, lambda: None)
+        result = {"backend": name, "us_per_keystroke": None}
+        if name == "fake":
+            result.update(measure_latency(backend, lambda: backend.trigger(BENCH_HOTKEY), presses))
+            return result
+        if injector is None:
+            return result
+        cpu = inject_taps(injector, keystrokes)
+        # Two events (press and release) per tap
+        result["us_per_keystroke"] = round(max(cpu - baseline, 0) / (keystrokes * 2) * 1e6, 2)
+        result.update(measure_latency(backend, lambda: press_hotkey(injector), presses))
+        return result
+    finally:
+        backend.stop()
+
+
+def print_report(results, baseline_us):
+    print()
+    if baseline_us is not None:
+        print(f"Injection alone: {baseline_us} us of CPU per keystroke (subtracted below)")
+    print(f"{'backend':<10} {'CPU us/keystroke':>17} {'hotkey p50/p95 ms':>22} {'fired':>7}")
+    for r in results:
+        overhead = r["us_per_keystroke"] if r["us_per_keystroke"] is not None else "-"
+        latency = f"{r.get('p50_ms', '-')} / {r.get('p95_ms', '-')}"
+        print(f"{r['backend']:<10} {overhead:>17} {latency:>22} {r.get('fired', '-'):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-keystroke overhead of the hotkey backends.")
+    parser.add_argument("--backends", default=",".join(hotkeys.BACKENDS), help="Backends to measure")
+    parser.add_argument("--keystrokes", type=int, default=1000, help="Shift taps injected per backend")
+    parser.add_argument("--presses", type=int, default=20, help="Hotkey presses for the latency")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the app's logs")
+    args = parser.parse_args()
+
+    logs.configure(verbose=args.verbose)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    injector = create_injector()
+    baseline = inject_taps(injector, args.keystrokes) if injector else 0.0
+    results = []
+    for name in args.backends.split(","):
+        print(f"Running {name}...")
+        try:
+            results.append(bench_backend(name, injector, args.keystrokes, args.presses, baseline))
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+
+    print_report(results, round(baseline / (args.keystrokes * 2) * 1e6, 2) if injector else None)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import copy
+import logging
+import logging.handlers
+import os
+import re
+import sys
+import threading
+from collections import deque
+
+from ansi import ansi
+
+# Custom level between INFO and WARNING, used for the old green "SUCCESS:" messages
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+LOG_FILE = "../logs/scrai.log"
+LOG_FILE_MAX_BYTES = 1024 * 1024 # Rotate the file sink after 1 MB
+LOG_FILE_BACKUPS = 3 # Number of rotated files kept
+UI_QUEUE_CAPACITY = 2000 # Max number of records waiting for the UI
+
+# Prefixes printed before each message, same as the old ansi.*_MSG prints
+LEVEL_PREFIXES = {
+    logging.DEBUG: ansi.HEADER + "DEBUG: " + ansi.ENDC,
+    logging.INFO: ansi.INFO_MSG,
+    SUCCESS: ansi.SUCCESS_MSG,
+    logging.WARNING: ansi.WARNING_MSG,
+    logging.ERROR: ansi.ERROR_MSG,
+    logging.CRITICAL: ansi.ERROR_MSG,
+}
+
+# Components that used their own tag (e.g. "TRAYICON: ") keep it for info messages
+COMPONENT_TAGS = {
+    "trayicon": ansi.OKCYAN + "TRAYICON: " + ansi.ENDC,
+    "ui": ansi.OKCYAN + "UI: " + ansi.ENDC,
+    "stdout": "", # Stray prints are shown as they are
+}
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[\d;]*m")
+
+
+class AppLogger(logging.Logger):
+    """Logger with an extra success() method for the SUCCESS level."""
+    def success(self, msg, *args, **kwargs):
+        if self.isEnabledFor(SUCCESS):
+            self._log(SUCCESS, msg, args, **kwargs)
+
+
+class AnsiFormatter(logging.Formatter):
+    """Formats records like the old print calls: colored prefix + message."""
+    def format(self, record):
+        component = record.name.rsplit(".", 1)[-1]
+        if record.levelno <= logging.INFO and component in COMPONENT_TAGS:
+            prefix = COMPONENT_TAGS[component]
+        else:
+            prefix = LEVEL_PREFIXES.get(record.levelno, "")
+
+        text = prefix + record.getMessage()
+        repeats = getattr(record, "repeats", 1)
+        if repeats > 1:
+            text += f" (x{repeats})"
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+class PlainFormatter(logging.Formatter):
+    """Formatter for the file sink: timestamped and without ANSI codes."""
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        return ANSI_ESCAPE.sub("", super().format(record))
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the newest records in a bounded buffer for the UI to drain.
+    The message is built when the record is emitted (mutable arguments may
+    change before the UI polls), the rest of the formatting when drained.
+    On overflow the oldest records are dropped and counted, and identical
+    consecutive messages are merged.
+    """
+    def __init__(self, capacity=UI_QUEUE_CAPACITY):
+        super().__init__()
+        self._records = deque(maxlen=capacity)
+        self._dropped = 0
+        self._ready = threading.Condition(threading.Lock())
+        self.setFormatter(AnsiFormatter())
+
+    def emit(self, record):
+        # Like QueueHandler.prepare: a copy with the message of now, the other handlers keep theirs
+        try:
+            message = record.getMessage()
+        except Exception:
+            self.handleError(record)
+            return
+        record = copy.copy(record)
+        record.msg, record.args = message, None
+        with self._ready:
+            last = self._records[-1] if self._records else None
+            if (last is not None and last.levelno == record.levelno
+                    and last.msg == record.msg and not record.exc_info):
+                last.repeats = getattr(last, "repeats", 1) + 1
+                return
+
+            if len(self._records) == self._records.maxlen:
+                self._dropped += 1
+            self._records.append(record)
+            self._ready.notify()
+
+    def drain(self, timeout=None):
+        """Waits up to timeout seconds for records and returns them formatted, oldest first."""
+        with self._ready:
+            if not self._records:
+                self._ready.wait(timeout)
+            records = list(self._records)
+            self._records.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        lines = []
+        if dropped:
+            lines.append(ansi.WARNING_MSG + f"{dropped} log lines were dropped because the UI could not keep up.")
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        return lines
+
+    def wake(self):
+        """Wakes up a thread blocked in drain()."""
+        with self._ready:
+            self._ready.notify_all()
+
+    def __len__(self):
+        with self._ready:
+            return len(self._records)
+
+
+def get_logger(name):
+    """Returns the application logger for a component (e.g. 'gemini')."""
+    previous = logging.getLoggerClass()
+    logging.setLoggerClass(AppLogger)
+    try:
+        return logging.getLogger("scrai." + name)
+    finally:
+        logging.setLoggerClass(previous)
+
+
+def configure(verbose=False, log_file=False):
+    """
+    Sets the log level and optionally enables the rotating file sink.
+    Debug messages are filtered out before formatting unless verbose is set.
+    """
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    if log_file:
+        try:
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                LOG_FILE,
+                maxBytes=LOG_FILE_MAX_BYTES,
+                backupCount=LOG_FILE_BACKUPS,
+                encoding="utf-8",
+            )
+            file_handler.setFormatter(PlainFormatter())
+            root.addHandler(file_handler)
+            root.info("Writing logs to %s", os.path.abspath(LOG_FILE))
+        except Exception as e:
+            root.error("Failed to open log file %s: %s", LOG_FILE, e)
+
+
+# --- Default pipeline, active as soon as any module imports this one ---
+root = logging.getLogger("scrai")
+root.setLevel(logging.INFO)
+root.propagate = False
+
+# Console sink writes to the real stdout, sys.stdout may be redirected into the pipeline
+if sys.__stdout__ is not None:
+    _console_handler = logging.StreamHandler(sys.__stdout__)
+    _console_handler.setFormatter(AnsiFormatter())
+    root.addHandler(_console_handler)
+
+# Bounded queue feeding the log view of the UI
+ui_handler = RingBufferHandler()
+root.addHandler(ui_handler)
@@ -2,17 +2,30 @@ import ctypes
 from datetime import date
 import os
 import sys
-import time
-import keyboard
-import win32con
-import win32gui
+import threading
 import re
 
-from trayicon import TrayIcon
-from ansi import ansi
+import logs
 import gemini
 import token_db
-from ui import UI, LogRedirector
+import tracing
+import metrics
+import recorder
+import profiling
+import file_manager
+import history
+import capture
+import hotkeys
+import notifier
+import profiles
+import router
+import autocrop
+import session
+import token_estimator
+# The UI (webview), the metrics endpoints (Flask), the tray icon and the Windows console calls are
+# imported where they are used, so the headless mode runs without them
+
+log = logs.get_logger("main")
 
 # A script abszolút elérési útja
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -27,19 +40,31 @@ should_start_listening = False # Flag to start listening automatically
 is_hidden = False # Track if UI is hidden
 pdf_sources_list = [] # List of PDF paths/URLs
 selected_model = None # Default model
+available_models = None # Model catalogue, from the API or the last session until it is fetched again
 token_data = {} # Dictionary to store token usage loaded from token_db
 hwnd = None # Handle for the console window
+batch_captures = [] # Temporary screenshot files queued for the next batch request
+batch_lock = threading.Lock()
+headless = False # Run only the question engine, without UI and tray icon
+quit_event = threading.Event() # Set on shutdown, the headless main thread waits on it
+HOTKEYS = ("ctrl+shift+q", "ctrl+shift+a", "ctrl+shift+x", "ctrl+alt+shift+c") # Question, batch add, batch submit, quit
 
 # --- Objects ---
-trayicon = None
+trayicon = None # TrayIcon, or a notifier backend in headless mode
 ui_app = None
+hotkey_backend = None
+socket_api = None
 
 def set_quitting_flag():
     """Sets the global flag and signals UI to close."""
     global quitting
     if not quitting: # Only signal once
-        print(ansi.INFO_MSG + "Shutdown requested.")
+        log.info("Shutdown requested.")
         quitting = True
+        quit_event.set()
+
+        # The next launch continues from here
+        save_session(wait=True)
 
         # Set the tray icon to a loading state
         if trayicon:
@@ -48,19 +73,19 @@ def set_quitting_flag():
         # Signal the UI window to close if it exists
         if ui_app and ui_app.window:
             try:
-                print(ansi.INFO_MSG + "Signaling UI window to destroy...")
+                log.info("Signaling UI window to destroy...")
                 # Calling destroy() on the window should cause webview.start() to return
                 ui_app.destroy()
-                print(ansi.INFO_MSG + "UI window destroy signaled.")
+                log.info("UI window destroy signaled.")
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error signaling UI window destroy: {e}")
+                log.error("Error signaling UI window destroy: %s", e)
         else:
             # If no UI, we still need to unhook keyboard
             try:
-                keyboard.unhook_all_hotkeys()
-                print(ansi.INFO_MSG + "Hotkeys unhooked (UI not active).")
+                hotkey_backend.unhook_all()
+                log.info("Hotkeys unhooked (UI not active).")
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error unhooking hotkeys: {e}")
+                log.error("Error unhooking hotkeys: %s", e)
 
 def toggle_ui_visibility():
     """Shows the UI window if hidden, hides if shown."""
@@ -73,7 +98,7 @@ def toggle_ui_visibility():
                 ui_app.hide()         
             is_hidden = not is_hidden
         else:
-            print(ansi.WARNING_MSG + "UI window not yet loaded.")
+            log.warning("UI window not yet loaded.")
 
 
 # Callback for the Start/Stop button in the UI
@@ -91,17 +116,18 @@ def start_listening():
     """Sets state to listening and registers hotkeys."""
     global is_listening
     if is_listening:
-        print(ansi.INFO_MSG + "Already in listening state.")
+        log.info("Already in listening state.")
         return
 
-    print("\n" + "-" * 50)
-    print(ansi.INFO_MSG + "Entering listening state...")
+    log.info("-" * 50)
+    log.info("Entering listening state...")
 
     if not pdf_sources_list:
-        print(ansi.WARNING_MSG + "No PDF sources added. Will only use image for context.")
+        log.warning("No PDF sources added. Will only use image for context.")
     if not selected_model:
-        print(ansi.ERROR_MSG + "No AI model selected. Cannot start listening.")
-        ui_app.update_ui_state('configuring') # Stay in configuring state
+        log.error("No AI model selected. Cannot start listening.")
+        if ui_app:
+            ui_app.update_ui_state('configuring') # Stay in configuring state
         return False # Indicate failure to start listening
 
     # Disable config elements in UI
@@ -112,21 +138,32 @@ def start_listening():
     try:
         # Use a lambda to pass current state variables to the handler
         # The hotkey handler will be called in a separate thread!
-        keyboard.add_hotkey("ctrl+shift+q", lambda: process_question_handler())
-        keyboard.add_hotkey("ctrl+alt+shift+c", lambda: set_quitting_flag())
-        print(ansi.SUCCESS_MSG + "Keyboard hotkeys registered.")
+        question_key, batch_add_key, batch_submit_key, quit_key = HOTKEYS
+        hotkey_backend.add_hotkey(question_key, lambda: process_question_handler())
+        hotkey_backend.add_hotkey(batch_add_key, lambda: add_to_batch_handler())
+        hotkey_backend.add_hotkey(batch_submit_key, lambda: submit_batch_handler())
+        hotkey_backend.add_hotkey(quit_key, lambda: set_quitting_flag())
+        # Every profile asks with its own preloaded settings, no reconfiguring needed
+        for profile in profiles.profiles.values():
+            hotkey_backend.add_hotkey(profile.hotkey, lambda profile=profile: process_question_handler(profile=profile))
+        log.success("Keyboard hotkeys registered.")
         is_listening = True
-        print(ansi.INFO_MSG + "Listening state active. Hotkeys are enabled.")
-        print("-" * 50 + "\n")
+        log.info("Listening state active. Hotkeys are enabled.")
+        log.info("-" * 50)
         return True # Indicate success
 
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to register hotkeys: {e}")
+        log.error("Failed to register hotkeys: %s", e)
+        # The hotkeys registered before the failing one must not stay active
+        try:
+            hotkey_backend.unhook_all()
+        except Exception as unhook_error:
+            log.error("Failed to unhook the registered hotkeys: %s", unhook_error)
         # Revert state if hotkey registration fails
         if ui_app:
             ui_app.update_ui_state('configuring')
-        print(ansi.INFO_MSG + "Returning to configuring state.")
-        print("-" * 50 + "\n")
+        log.info("Returning to configuring state.")
+        log.info("-" * 50)
         return False # Indicate failure
 
 
@@ -134,66 +171,247 @@ def stop_listening():
     """Sets state to configuring and unhooks hotkeys."""
     global is_listening
     if not is_listening:
-        print(ansi.INFO_MSG + "Already in configuring state.")
+        log.info("Already in configuring state.")
         return
 
-    print("\n" + "-" * 50)
-    print(ansi.INFO_MSG + "Entering configuring state...")
+    log.info("-" * 50)
+    log.info("Entering configuring state...")
 
     # Unhook hotkeys
     try:
-        keyboard.unhook_all_hotkeys()
-        print(ansi.SUCCESS_MSG + "Keyboard hotkeys unhooked.")
+        hotkey_backend.unhook_all()
+        log.success("Keyboard hotkeys unhooked.")
     except Exception as e:
-        print(ansi.WARNING_MSG + f"Error unhooking hotkeys: {e}")
+        log.warning("Error unhooking hotkeys: %s", e)
 
     is_listening = False
-    print(ansi.INFO_MSG + "Configuring state active. Hotkeys are disabled.")
+    clear_batch()
+    log.info("Configuring state active. Hotkeys are disabled.")
 
     # Enable config elements in UI
     if ui_app:
         ui_app.update_ui_state('configuring') # Call JS function to update UI look/feel
 
-    print("-" * 50 + "\n")
+    log.info("-" * 50)
 
 
-def process_question_handler():
-    """Handles the process question hotkey trigger."""
+def process_question_handler(answer_target=None, profile=None):
+    """
+    Handles the process question hotkey trigger.
+    answer_target replaces the tray icon, e.g. to collect the answer for the socket API.
+    profile (a profiles.Profile) replaces the current config.
+    """
     global is_listening, token_data, selected_model, pdf_sources_list
 
     # Check state before processing
     if not is_listening or quitting:
         return # Do nothing if not listening or shutting down
 
-    print(ansi.INFO_MSG + "Question hotkey detected.")
+    answer_target = answer_target or trayicon
+
+    if profile is None:
+        log.info("Question hotkey detected.")
+        pdf_sources, prompt_file, generation = pdf_sources_list, prompt_file_name, None
+        model = router.choose(pdf_sources, selected_model, prompt_file)
+    else:
+        log.info("Question hotkey of profile %r detected.", profile.name)
+        pdf_sources, prompt_file, generation = profile.pdf_sources, profile.prompt_file, profile.generation
+        model = profile.model or router.choose(pdf_sources, selected_model, prompt_file)
 
     # Call the actual processing logic in gemini.py
     # This might take time, but since it's called from a keyboard thread, it shouldn't block the UI/main loop.
     # However, if gemini.process_question has blocking network calls, it *will* block this hotkey thread.
     try:
         # Pass current config from main.py state
-        tokens_used = gemini.process_question(
-            trayicon,
-            pdf_sources_list,
-            selected_model,
-            prompt_file_name
-        )
-
-        if tokens_used > 0:
-            print(ansi.INFO_MSG + f"Used {tokens_used} tokens for this query.")
-            token_data = token_db.update_token_data(token_data, tokens_used)
-            token_db.save_token_data(token_data)
-            # Update UI with new token counts
-            if ui_app:
-                today_str = str(date.today()) # Need date from datetime
-                ui_app.update_token_usage(token_data["total"], token_data["daily"].get(today_str, 0))
+        # profile_question() runs cProfile around it when armed from the UI
+        with profiling.profile_question():
+            tokens_used = gemini.process_question(
+                answer_target,
+                pdf_sources,
+                model,
+                prompt_file,
+                generation
+            )
+        record_question_result(tokens_used)
 
     except Exception as e:
-        print(ansi.ERROR_MSG + f"An error occurred in the hotkey handler: {e}")
+        log.error("An error occurred in the hotkey handler: %s", e)
         # Update tray icon state to error if possible
-        if trayicon:
-            trayicon.display_answer("ERR", color="red")
+        if answer_target:
+            answer_target.display_answer("ERR", color="red")
+
+
+def record_question_result(tokens_used):
+    """Saves the token usage of a finished question (or batch) and refreshes the UI."""
+    global token_data
+
+    if tokens_used > 0:
+        log.info("Used %s tokens for this query.", tokens_used)
+        token_data = token_db.update_token_data(token_data, tokens_used)
+        token_db.save_token_data(token_data)
+        # Update UI with new token counts
+        if ui_app:
+            today_str = str(date.today()) # Need date from datetime
+            ui_app.update_token_usage(token_data["total"], token_data["daily"].get(today_str, 0))
+
+    # Update UI with the new latency percentiles
+    if ui_app:
+        ui_app.update_latency_stats(tracing.stage_stats())
+        ui_app.update_profiling_status(profiling.get_profiling_status())
+        ui_app.update_storage_usage(gemini.storage_usage_by_key())
+        ui_app.refresh_history()
+
+
+# --- Batch mode ---
+
+def add_to_batch_handler():
+    """Handles the batch add hotkey: queues a screenshot of the current screen."""
+    if not is_listening or quitting:
+        return
+
+    with batch_lock:
+        if len(batch_captures) >= gemini.BATCH_MAX_CAPTURES:
+            log.warning("The batch is full (%s captures). Submit it first.", gemini.BATCH_MAX_CAPTURES)
+            return len(batch_captures)
+        try:
+            batch_captures.append(gemini.take_screenshot())
+        except Exception as e:
+            log.error("Failed to capture the screen for the batch: %s", e)
+            return len(batch_captures)
+        count = len(batch_captures)
+
+    log.info("Capture %s added to the batch.", count)
+    if trayicon:
+        trayicon.display_answer(f"+{count}", color="blue")
+    return count
+
+
+def submit_batch_handler(answer_target=None):
+    """Handles the batch submit hotkey: answers every queued capture with one request."""
+    global batch_captures
+    if not is_listening or quitting:
+        return
+
+    answer_target = answer_target or trayicon
+    with batch_lock:
+        captures, batch_captures = batch_captures, []
+    if not captures:
+        log.warning("The batch is empty. Add captures with the batch add hotkey first.")
+        return
+
+    log.info("Batch submit hotkey detected (%s captures).", len(captures))
+    try:
+        with profiling.profile_question():
+            tokens_used = gemini.process_batch(
+                answer_target,
+                captures,
+                pdf_sources_list,
+                selected_model, # Batches are rare and large, they aren't routed
+                prompt_file_name
+            )
+        record_question_result(tokens_used)
+
+    except Exception as e:
+        log.error("An error occurred in the batch handler: %s", e)
+        if answer_target:
+            answer_target.display_answer("ERR", color="red")
+
+
+def clear_batch():
+    """Drops the queued captures and their temporary files."""
+    global batch_captures
+    with batch_lock:
+        captures, batch_captures = batch_captures, []
+    for path in captures:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if captures:
+        log.info("Discarded %s queued batch captures.", len(captures))
+
+
+
+# --- Functions exposed to the socket API (headless mode) ---
 
+def ask_question(profile_name=None):
+    """Answers the question on the screen (with the named profile) and returns the answer."""
+    if not is_listening:
+        raise RuntimeError("Not listening (no model selected?).")
+    profile = profiles.get(profile_name) if profile_name else None
+    collector = notifier.AnswerCollector(trayicon)
+    process_question_handler(collector, profile)
+    return collector.answer
+
+def submit_batch():
+    """Answers the queued captures and returns the answers."""
+    if not is_listening:
+        raise RuntimeError("Not listening (no model selected?).")
+    collector = notifier.AnswerCollector(trayicon)
+    submit_batch_handler(collector)
+    return collector.answer
+
+def get_status():
+    """Returns the state of the question engine."""
+    return {
+        'listening': is_listening,
+        'model': selected_model,
+        'promptFile': prompt_file_name,
+        'pdfSources': pdf_sources_list,
+        'keyIndex': gemini.current_index,
+        'keysCoolingDown': len(gemini.key_cooldowns_remaining()),
+        'tokenUsage': get_token_usage(),
+        'latencyStats': tracing.stage_stats(),
+        'storageUsage': gemini.storage_usage_by_key(),
+        'router': router.get_stats(pdf_sources_list, prompt_file_name),
+        'profiles': profiles.status(),
+        'session': session.status(),
+        'autocrop': autocrop.stats(),
+        'tokenEstimator': {'budget': gemini.token_budget, **token_estimator.calibration()},
+    }
+
+
+def save_session(wait=False):
+    """Writes the session snapshot (if it changed) in the background, or right away with wait."""
+    # The values of now, the snapshot itself (hashing the PDFs) is taken later
+    args = (list(pdf_sources_list), selected_model, prompt_file_name, available_models)
+    if not wait:
+        session.save_later(lambda: session.snapshot(*args))
+        return
+    try:
+        session.save_now(lambda: session.snapshot(*args))
+    except Exception as e:
+        log.error("Failed to save the session: %s", e)
+
+
+def restore_session(keep_prompt_file):
+    """
+    Continues the last session: its PDFs, model and model catalogue are used
+    right away and revalidated in the background. Returns False if there is
+    no session to continue.
+    """
+    global pdf_sources_list, selected_model, available_models, prompt_file_name
+    state = session.load()
+    if state is None or not state.get("model"):
+        return False
+    pdf_sources_list = list(state.get("pdfSources", []))
+    selected_model = state["model"]
+    available_models = state.get("models")
+    if not keep_prompt_file and state.get("promptFile"):
+        prompt_file_name = state["promptFile"]
+    session.apply_cached(state)
+    log.success("Continuing the last session: %s, %s PDF sources, prompt %s.",
+                selected_model, len(pdf_sources_list), prompt_file_name)
+
+    def check_model():
+        models = get_available_models(refresh=True)
+        if models and selected_model not in models:
+            log.warning("The model of the last session (%s) is not available anymore.", selected_model)
+            select_newest_flash_model()
+        return selected_model
+
+    session.revalidate(state, check_model, save_session)
+    return True
 
 
 # --- Functions exposed to UI/JS ---
@@ -211,47 +429,63 @@ def get_current_config():
 def set_pdf_sources(sources):
     """Updates the list of PDF sources from the UI."""
     global pdf_sources_list
-    print(ansi.INFO_MSG + f"UI updated PDF sources: {sources}")
+    log.info("UI updated PDF sources: %s", sources)
 
     pdf_sources_list = sources
+    save_session()
 
     if is_listening:
-        print(ansi.WARNING_MSG + "PDF sources changed while listening. Automatically stopping listening.")
+        log.warning("PDF sources changed while listening. Automatically stopping listening.")
         stop_listening()
 
 
-def get_available_models():
-    """Fetches available models from the Gemini API."""
+def get_available_models(refresh=False):
+    """Fetches available models from the Gemini API (once, unless refresh is set)."""
+    global available_models
+    if available_models and not refresh:
+        return available_models
     if gemini.client is None:
-        print(ansi.ERROR_MSG + "Gemini client not initialized. Cannot get models.")
+        log.error("Gemini client not initialized. Cannot get models.")
         return [selected_model] # Return only default if client failed
 
     try:
-        print(ansi.INFO_MSG + "Fetching available models...")
+        log.info("Fetching available models...")
         # List models that support generateContent and have multimodal capability
         models = [m.name for m in gemini.client.models.list()
                   if 'generateContent' in m.supported_actions]
-        print(ansi.SUCCESS_MSG + f"Fetched {len(models)} available models.")
+        log.success("Fetched %s available models.", len(models))
 
+        available_models = models
         return models
 
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to fetch models: {e}")
+        log.error("Failed to fetch models: %s", e)
         return [selected_model] # Return only default on error
 
 def set_selected_model(model):
     """Sets the selected AI model from the UI."""
     global selected_model
-    print(ansi.INFO_MSG + f"UI selected model: {model}")
+    log.info("UI selected model: %s", model)
 
     selected_model = model
+    save_session()
 
     # Configuration changed, ensure not in listening state
     if is_listening:
-        print(ansi.WARNING_MSG + "Model changed while listening. Automatically stopping listening.")
+        log.warning("Model changed while listening. Automatically stopping listening.")
         stop_listening()
 
 
+def search_history(text="", before_id=None):
+    """Returns a page of the answer history matching text, newest first."""
+    return history.search(text, before_id)
+
+
+def get_profiles():
+    """Returns the profiles with their hotkeys and preload state."""
+    return profiles.status()
+
+
 def get_token_usage():
     """Returns current token usage data."""
     global token_data
@@ -267,10 +501,10 @@ def select_newest_flash_model():
     """
     global selected_model
     fallback_model = "models/gemini-2.5-flash"
-    print(ansi.INFO_MSG + "Attempting to select the newest Gemini flash model...")
+    log.info("Attempting to select the newest Gemini flash model...")
 
     if gemini.client is None:
-        print(ansi.ERROR_MSG + "Gemini client not initialized. Using fallback model.")
+        log.error("Gemini client not initialized. Using fallback model.")
         selected_model = fallback_model
         return
 
@@ -284,7 +518,7 @@ def select_newest_flash_model():
         ]
 
         if not flash_models:
-            print(ansi.WARNING_MSG + "No 'flash' models found. Using fallback model.")
+            log.warning("No 'flash' models found. Using fallback model.")
             selected_model = fallback_model
             return
 
@@ -293,55 +527,68 @@ def select_newest_flash_model():
         flash_models.sort(key=lambda m: m.name, reverse=True)
         
         newest_model = flash_models[0].name
-        print(ansi.SUCCESS_MSG + f"Automatically selected newest flash model: {newest_model}")
+        log.success("Automatically selected newest flash model: %s", newest_model)
         selected_model = newest_model
 
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to fetch or select newest model: {e}")
-        print(ansi.WARNING_MSG + f"Using fallback model: {fallback_model}")
+        log.error("Failed to fetch or select newest model: %s", e)
+        log.warning("Using fallback model: %s", fallback_model)
         selected_model = fallback_model
 
 
 
-if __name__ == "__main__":
-
-    # --- Prompt fájl beolvasása parancssorból ---
-    prompt_file_name = "default_prompt.txt" # Default value
-    args = sys.argv[1:] # Get arguments excluding script name
-
-    # Check for invisible flag
-    if "-i" in args or "--invisible" in args:
-        print(ansi.INFO_MSG + "Starting in invisible mode.")
-        is_hidden = True
-        should_start_listening = True # Start listening automatically
-        if "-i" in args: args.remove("-i")
-        if "--invisible" in args: args.remove("--invisible")
-
-    # The remaining argument should be the prompt file
-    if len(args) > 0:
-        prompt_file_name = args[0]
-        print(ansi.INFO_MSG + f"Prompt file set to: {prompt_file_name}")
-    else:
-        print(ansi.WARNING_MSG + f"No prompt file specified, using default: {prompt_file_name}")
-
-    # Ensure Gemini client is initialized by importing gemini module
-    if gemini.client is None:
-        # This condition should only be true if gemini.py failed to init and exited
-        print(ansi.ERROR_MSG + "Gemini client initialization failed. Exiting...")
-        sys.exit(1)
+def pop_option(args, *names, type=None):
+    """
+    Removes '--name value' from the argument list and returns the value (or None).
+    type (e.g. float) converts the value, an invalid one exits like a missing one.
+    """
+    for name in names:
+        if name in args:
+            i = args.index(name)
+            if i + 1 >= len(args):
+                log.error("Missing value for %s.", name)
+                sys.exit(2)
+            value = args[i + 1]
+            del args[i:i + 2]
+            if type is not None:
+                try:
+                    value = type(value)
+                except ValueError:
+                    log.error("Invalid value for %s: %s", name, value)
+                    sys.exit(2)
+            return value
+    return None
+
+
+def hide_console():
+    """Hides the console window (Windows only)."""
+    global hwnd
+    if sys.platform != "win32":
+        return
+    import win32con
+    import win32gui
+    log.info("Hiding console window...")
+    hwnd = ctypes.windll.kernel32.GetConsoleWindow()
+    win32gui.SetForegroundWindow(hwnd)
+    hwnd = win32gui.GetForegroundWindow() 
+    if hwnd:
+        win32gui.ShowWindow(hwnd, win32con.SW_HIDE)
 
-    # Automatically select the best model before initializing UI
-    select_newest_flash_model()
 
-    # Load existing token usage data
-    token_data = token_db.load_token_data()
-    print(ansi.INFO_MSG + f"Loaded initial token data: Total={token_data['total']}, Daily for Today={token_data['daily'].get(str(date.today()), 0)}")
+def run_gui():
+    """Runs the app with the tray icon and the config window. Blocks until the window is closed."""
+    global trayicon, ui_app
+    from trayicon import TrayIcon, render_icon
+    from ui import UI
 
     # Init the tray icon with this script's instance
     trayicon = TrayIcon(quit_callback=set_quitting_flag, show_gui_callback=toggle_ui_visibility)
     trayicon.display_answer("RDY", color="green")
 
-    print(ansi.INFO_MSG + "Initializing UI...")
+    # Report the hit rate of the rendered tray icon cache
+    metrics.register_cache("tray_icon", lambda: render_icon.cache_info()[:2])
+
+    log.info("Initializing UI...")
 
     # Pass necessary callbacks to the UI instance
     ui_callbacks = {
@@ -353,6 +600,16 @@ if __name__ == "__main__":
         'get_selected_model': lambda: selected_model, # UI -> Main (gets current model)
         'set_selected_model': set_selected_model, # UI -> Main (sets model)
         'get_token_usage': get_token_usage, # UI -> Main (gets token data)
+        'get_latency_stats': tracing.stage_stats, # UI -> Main (gets per-stage latency percentiles)
+        'get_storage_usage': gemini.storage_usage_by_key, # UI -> Main (gets uploaded files per key)
+        'search_history': search_history, # UI -> Main (gets a page of the answer history)
+        'get_profiles': get_profiles, # UI -> Main (gets the profiles and their preload state)
+        'start_cprofile': profiling.start_cprofile, # UI -> Main (profiles the next N questions)
+        'stop_cprofile': profiling.stop_cprofile, # UI -> Main (stops and writes the profile)
+        'take_memory_snapshot': profiling.take_memory_snapshot, # UI -> Main (tracemalloc snapshot and diff)
+        'stop_memory_tracing': profiling.stop_memory_tracing, # UI -> Main (stops tracemalloc)
+        'dump_thread_stacks': profiling.dump_thread_stacks, # UI -> Main (writes all thread stacks)
+        'get_profiling_status': profiling.get_profiling_status, # UI -> Main (gets profiler state)
         'quit_app': set_quitting_flag,       # UI -> Main (signals quit)
         'toggle_ui_visibility': toggle_ui_visibility, # UI -> Main (toggles visibility)
         # UI can also call update methods on ui_app directly from main.py
@@ -360,63 +617,237 @@ if __name__ == "__main__":
 
     try:
         ui_app = UI(main_app_callbacks=ui_callbacks, hidden=is_hidden, listening=should_start_listening)
-        print(ansi.SUCCESS_MSG + "UI initialized.")
+        log.success("UI initialized.")
 
         # Note: ui_app.start_ui() includes the webview.start() blocking call
-        # and runs the Flask server and log thread.
+        # and runs the static UI server and log thread.
 
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Failed to initialize UI: {e}")
-        print(ansi.WARNING_MSG + "Continuing without GUI. Console will be the only interface.")
+        log.error("Failed to initialize UI: %s", e)
+        log.warning("Continuing without GUI. Console will be the only interface.")
         ui_app = None # Ensure ui_app is None if initialization failed
 
-    print("-" * 50)
-    print(ansi.INFO_MSG + "Setup complete.")
+    log.info("-" * 50)
+    log.info("Setup complete.")
 
     # Hide the console window after a small delay
-    print(ansi.INFO_MSG + "Hiding console window...")
-    hwnd = ctypes.windll.kernel32.GetConsoleWindow()
-    win32gui.SetForegroundWindow(hwnd)
-    hwnd = win32gui.GetForegroundWindow() 
-    if hwnd:
-        win32gui.ShowWindow(hwnd, win32con.SW_HIDE)
+    hide_console()
 
     if ui_app:
         # Start the UI - this call blocks the main thread until the window is closed
-        print(ansi.INFO_MSG + "Starting UI application loop...")
+        log.info("Starting UI application loop...")
         ui_app.start_ui() # This blocks until window is closed
 
     else:
         # If UI failed to initialize, fall back to console interface
-        print(ansi.WARNING_MSG + "UI not available. Using console interface.")
-        print(ansi.WARNING + "RESTRICTED: " + ansi.ENDC + "Hotkeys are NOT active without UI state management.")
-        print(ansi.INFO_MSG + "Press Ctrl+C to quit.")
+        log.warning("UI not available. Using console interface.")
+        log.warning("RESTRICTED: Hotkeys are NOT active without UI state management.")
+        log.info("Press Ctrl+C to quit.")
+        wait_for_quit()
+
+
+def run_headless(notifier_name, socket_path):
+    """Runs only the question engine: hotkeys, socket API and a notifier. Blocks until quit."""
+    global trayicon, socket_api
+    import socket_api as socket_api_module
+
+    trayicon = notifier.create_backend(notifier_name)
+
+    commands = {
+        'ask': ask_question,
+        'batch_add': add_to_batch_handler,
+        'batch_submit': submit_batch,
+        'status': get_status,
+        'history': lambda *words: search_history(" ".join(words))["entries"][:20],
+        'quit': set_quitting_flag,
+    }
+    try:
+        socket_api = socket_api_module.SocketAPI(commands, socket_path or socket_api_module.SOCKET_PATH)
+        socket_api.start()
+    except Exception as e:
+        log.error("Failed to start the socket API: %s", e)
+        socket_api = None
 
-        # Keep the script running (fallback mode)
-        try:
-            while not quitting: # Use the quitting flag even in fallback
-                time.sleep(0.1) # Polling loop fallback
+    if not start_listening():
+        log.error("Cannot start the question engine. Exiting...")
+        set_quitting_flag()
+        return
 
-        except KeyboardInterrupt:
-            print(ansi.INFO_MSG + "Keyboard interrupt (Ctrl+C) detected in fallback loop.")
-            set_quitting_flag() # Signal quitting
+    log.info("Headless setup complete. Press Ctrl+C to quit.")
+    wait_for_quit()
 
-        except Exception as e:
-            print(ansi.ERROR_MSG + f"An unexpected error occurred in fallback loop: {e}")
-            set_quitting_flag() # Signal quitting
+
+def wait_for_quit():
+    """Blocks the main thread until set_quitting_flag() is called or Ctrl+C is pressed."""
+    try:
+        # Short timeouts, so Ctrl+C is handled on every platform
+        while not quit_event.wait(1):
+            pass
+
+    except KeyboardInterrupt:
+        log.info("Keyboard interrupt (Ctrl+C) detected.")
+        set_quitting_flag() # Signal quitting
+
+    except Exception as e:
+        log.error("An unexpected error occurred while waiting: %s", e)
+        set_quitting_flag() # Signal quitting
+
+
+if __name__ == "__main__":
+
+    # --- Prompt fájl beolvasása parancssorból ---
+    prompt_file_name = "default_prompt.txt" # Default value
+    args = sys.argv[1:] # Get arguments excluding script name
+
+    # Check for logging flags: -v enables the per-stage debug logs, --log-file the rotating file sink
+    verbose = "-v" in args or "--verbose" in args
+    log_to_file = "--log-file" in args
+    for flag in ("-v", "--verbose", "--log-file"):
+        if flag in args: args.remove(flag)
+    logs.configure(verbose=verbose, log_file=log_to_file)
+
+    # Opt-in recording of every question into ../corpus for replays
+    if "--record" in args:
+        args.remove("--record")
+        recorder.enable()
+
+    # Check for invisible flag
+    if "-i" in args or "--invisible" in args:
+        log.info("Starting in invisible mode.")
+        is_hidden = True
+        should_start_listening = True # Start listening automatically
+        if "-i" in args: args.remove("-i")
+        if "--invisible" in args: args.remove("--invisible")
+
+    # Crop the screenshots to the question around the mouse cursor
+    if "--autocrop" in args:
+        args.remove("--autocrop")
+        autocrop.enable()
+
+    # Per-question input token budget: screenshots are scaled down and PDFs trimmed to fit it
+    token_budget = pop_option(args, "--token-budget", type=int)
+    if token_budget is not None:
+        if token_budget <= 0:
+            log.error("Invalid value for --token-budget: %s", token_budget)
+            sys.exit(2)
+        gemini.token_budget = token_budget
+        log.info("Token budget: %s input tokens per question.", gemini.token_budget)
+
+    # Headless mode and its backends
+    if "--headless" in args:
+        args.remove("--headless")
+        headless = True
+        log.info("Starting in headless mode.")
+    capture_name = pop_option(args, "--capture")
+    hotkeys_name = pop_option(args, "--hotkeys")
+    notifier_name = pop_option(args, "--notifier")
+    socket_path = pop_option(args, "--socket")
+
+    # Optional /metrics and /stats endpoints (the only part that needs Flask)
+    metrics_port = pop_option(args, "--metrics-port", type=int)
+    enable_metrics = "--metrics" in args or metrics_port is not None
+    if "--metrics" in args: args.remove("--metrics")
+
+    # Automatic model routing within a latency and a cost target
+    router_p95 = pop_option(args, "--router-p95", type=float)
+    router_cost = pop_option(args, "--router-cost", type=float)
+    enable_router = "--router" in args or router_p95 is not None or router_cost is not None
+    if "--router" in args: args.remove("--router")
+
+    # The remaining argument should be the prompt file
+    if len(args) > 0:
+        prompt_file_name = args[0]
+        log.info("Prompt file set to: %s", prompt_file_name)
+    elif os.path.exists(session.SESSION_FILE):
+        log.info("No prompt file specified, using the last session's.")
+    else:
+        log.warning("No prompt file specified, using default: %s", prompt_file_name)
+
+    # Ensure Gemini client is initialized by importing gemini module
+    if gemini.client is None:
+        # This condition should only be true if gemini.py failed to init and exited
+        log.error("Gemini client initialization failed. Exiting...")
+        sys.exit(1)
+
+    # Select the platform backends
+    try:
+        capture.set_backend(capture.create_backend(capture_name))
+    except Exception as e:
+        log.error("Failed to initialize the capture backend: %s", e)
+        sys.exit(1)
+    try:
+        hotkey_backend = hotkeys.create_backend(hotkeys_name)
+    except Exception as e:
+        log.error("Failed to initialize the hotkey backend: %s", e)
+        if not headless or hotkeys_name:
+            sys.exit(1)
+        # Headless without hotkeys still answers questions asked over the socket
+        log.warning("Hotkeys are disabled, use the socket API to ask questions.")
+        hotkey_backend = hotkeys.FakeHotkeys()
+
+    # Continue the last session, or automatically select the best model before initializing UI
+    if not restore_session(keep_prompt_file=len(args) > 0):
+        select_newest_flash_model()
+
+    # Load existing token usage data
+    token_data = token_db.load_token_data()
+    log.info("Loaded initial token data: Total=%s, Daily for Today=%s", token_data['total'], token_data['daily'].get(str(date.today()), 0))
+
+    # Store every answer in the searchable history
+    history.enable()
+
+    # Pick the model of every question from the measured latencies and costs
+    if enable_router:
+        router.enable(get_available_models(),
+                      p95_ms=router_p95 or None, cost_usd=router_cost or None)
+
+    # Clean up stale uploads of every key in the background
+    gemini.start_file_gc()
+
+    # Named profiles with their own hotkeys, warmed up in the background
+    profiles.load(reserved_hotkeys=HOTKEYS)
+    profiles.preload_all(selected_model)
+
+    if enable_metrics:
+        import metrics_server
+        metrics_server.start(port=metrics_port or metrics_server.METRICS_PORT)
+
+    if headless:
+        run_headless(notifier_name, socket_path)
+    else:
+        run_gui()
 
     # Cleanup
-    print(ansi.INFO_MSG + "Application loop finished. Starting cleanup...")
+    log.info("Application loop finished. Starting cleanup...")
 
-    # Keyboard hook cleanup
+    # Hotkey cleanup
     try:
-        keyboard.unhook_all_hotkeys()
-        print(ansi.INFO_MSG + "Final keyboard hotkey unhook attempt complete.")
+        hotkey_backend.stop()
+        log.info("Final keyboard hotkey unhook attempt complete.")
     except Exception as e:
         # This might happen if no hotkeys were ever hooked (e.g. UI failed and never started listening)
-        print(ansi.WARNING_MSG + f"Error during final hotkey unhook attempt: {e}")
+        log.warning("Error during final hotkey unhook attempt: %s", e)
+
+    # Socket API cleanup
+    if socket_api:
+        socket_api.stop()
+
+    if enable_metrics:
+        metrics_server.stop()
+
+    # Queued batch captures are temporary files
+    clear_batch()
+
+    # Wait for the pending deletes of uploaded screenshots
+    file_manager.stop()
+
+    # Write the last traces
+    tracing.flush()
+
+    # Tray icon cleanup
+    if trayicon:
+        trayicon.stop()
 
     # Final message
-    print(ansi.INFO_MSG + "Program finished.")
+    log.info("Program finished.")
     sys.exit(0)
-
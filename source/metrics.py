@@ -0,0 +1,227 @@
+import ctypes
+import os
+import sys
+import threading
+import time
+
+import logs
+import tracing
+
+log = logs.get_logger("metrics")
+
+PREFIX = "scrai_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60) # Seconds
+
+_lock = threading.Lock()
+_metrics = [] # Registration order is the exposition order
+_caches = {} # name -> function returning (hits, misses)
+_started_at = time.time()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = PREFIX + name
+        self.help = help_text
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with _lock:
+            return dict(self._values)
+
+    def samples(self):
+        for key, value in self.values().items():
+            yield self.name + _format_labels(key), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down, or is read from a function at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, func=None, kind="gauge"):
+        super().__init__(name, help_text)
+        self._func = func # Returns a number or a {label key: number} dict
+        self.kind = kind # Callback values that only grow are exposed as counters
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def values(self):
+        if self._func is None:
+            return super().values()
+        try:
+            value = self._func()
+        except Exception as e:
+            log.debug("Gauge %s failed: %s", self.name, e)
+            return {}
+        if isinstance(value, dict):
+            return dict(value)
+        return {(): value}
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets and optional labels."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {} # label key -> [bucket counts..., sum, count]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            data = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def samples(self):
+        with _lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, data in items:
+            for bound, count in zip(self.buckets, data):
+                yield self.name + "_bucket" + _format_labels(key, [("le", bound)]), count
+            yield self.name + "_bucket" + _format_labels(key, [("le", "+Inf")]), data[-1]
+            yield self.name + "_sum" + _format_labels(key), data[-2]
+            yield self.name + "_count" + _format_labels(key), data[-1]
+
+
+def register_cache(name, stats_func):
+    """Registers a cache for the hit rate metrics. stats_func returns (hits, misses)."""
+    _caches[name] = stats_func
+
+
+def cache_stats():
+    stats = {}
+    for name, func in list(_caches.items()):
+        try:
+            hits, misses = func()
+        except Exception as e:
+            log.debug("Cache stats for %s failed: %s", name, e)
+            continue
+        total = hits + misses
+        stats[name] = {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 4) if total else None}
+    return stats
+
+
+def process_rss_bytes():
+    """Resident set size of this process in bytes, or None if unknown."""
+    if sys.platform == "win32":
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+# --- Application metrics ---
+QUESTIONS = Counter("questions_total", "Questions processed, by outcome.")
+STAGE_LATENCY = Histogram("stage_latency_seconds", "Latency of each question pipeline stage.")
+TOKENS = Counter("tokens_total", "Tokens used, by model and API key index.")
+IN_FLIGHT = Gauge("in_flight_jobs", "Questions currently being processed.")
+CACHE_HITS = Gauge("cache_hits_total", "Cache hits, by cache.", kind="counter",
+                   func=lambda: {(("cache", n),): s["hits"] for n, s in cache_stats().items()})
+CACHE_MISSES = Gauge("cache_misses_total", "Cache misses, by cache.", kind="counter",
+                     func=lambda: {(("cache", n),): s["misses"] for n, s in cache_stats().items()})
+LOG_QUEUE_DEPTH = Gauge("log_queue_depth", "Log records waiting to be sent to the UI.",
+                        func=lambda: len(logs.ui_handler))
+RSS = Gauge("process_resident_memory_bytes", "Resident memory of the process.", func=process_rss_bytes)
+UPTIME = Gauge("uptime_seconds", "Seconds since the app started.", func=lambda: time.time() - _started_at)
+
+_key_cooldowns_func = lambda: {}
+
+
+def set_key_cooldowns_source(func):
+    """Sets the function returning {key_index: remaining cooldown seconds}."""
+    global _key_cooldowns_func
+    _key_cooldowns_func = func
+
+KEY_COOLDOWN = Gauge("key_cooldown_seconds", "Remaining rate limit cooldown of each API key.",
+                     func=lambda: {(("key", str(k)),): v for k, v in _key_cooldowns_func().items()})
+
+
+def observe_trace(record):
+    """Tracing listener: updates the counters and histograms from a finished trace."""
+    QUESTIONS.inc(outcome=record["status"])
+    STAGE_LATENCY.observe(record["duration_ms"] / 1000, stage="total")
+    for span in record["spans"]:
+        STAGE_LATENCY.observe(span["duration_ms"] / 1000, stage=span["name"])
+
+    attrs = record["attrs"]
+    if attrs.get("tokens"):
+        TOKENS.inc(attrs["tokens"], model=attrs.get("model") or "unknown", key=str(attrs.get("key_index")))
+
+tracing.add_listener(observe_trace)
+
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, value in metric.samples():
+            if value is not None:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Returns the metrics as a JSON-friendly dict for the /stats endpoint."""
+    tokens = {}
+    for key, value in TOKENS.values().items():
+        labels = dict(key)
+        tokens.setdefault(labels["model"], {})[labels["key"]] = value
+
+    return {
+        "uptime_seconds": round(time.time() - _started_at, 1),
+        "questions": {dict(k)["outcome"]: v for k, v in QUESTIONS.values().items()},
+        "in_flight_jobs": IN_FLIGHT.values().get((), 0),
+        "stage_latency_ms": tracing.stage_stats(),
+        "tokens": tokens,
+        "caches": cache_stats(),
+        "key_cooldowns": {str(k): round(v, 1) for k, v in _key_cooldowns_func().items()},
+        "log_queue_depth": len(logs.ui_handler),
+        "process_resident_memory_bytes": process_rss_bytes(),
+    }
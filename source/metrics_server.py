@@ -0,0 +1,57 @@
+# Optional HTTP endpoints for monitoring, started with --metrics:
+#   /metrics  Prometheus text format
+#   /stats    the same data as JSON
+# Flask is only imported when they are enabled.
+import threading
+
+import metrics
+from logs import get_logger
+
+log = get_logger("metrics_server")
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 5000
+
+_server = None
+
+
+def create_app():
+    from flask import Flask, Response, jsonify
+
+    app = Flask(__name__)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        # Prometheus text format for the local scraper
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/stats')
+    def stats():
+        return jsonify(metrics.snapshot())
+
+    return app
+
+
+def start(host=METRICS_HOST, port=METRICS_PORT):
+    """Starts the endpoints on a daemon thread. Returns False if the port can't be bound."""
+    global _server
+    from werkzeug.serving import make_server
+
+    try:
+        _server = make_server(host, port, create_app(), threaded=True)
+    except OSError as e:
+        log.error("Cannot start the metrics endpoints on %s:%s: %s", host, port, e)
+        return False
+    except SystemExit: # werkzeug exits when the port is taken
+        log.error("Cannot start the metrics endpoints, port %s is in use.", port)
+        return False
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    log.success("Metrics endpoints at http://%s:%s/metrics and /stats", host, port)
+    return True
+
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server = None
@@ -0,0 +1,106 @@
+# Answer notification backends for the headless mode. They have the interface
+# of trayicon.TrayIcon (set_loading, display_answer, stop), so the question
+# pipeline doesn't care which one shows the answer:
+#   log          answers only go to the log (default)
+#   notify-send  desktop notifications through libnotify on Linux
+#   fake         records the answers, for benchmarks
+import shutil
+import subprocess
+import threading
+
+from logs import get_logger
+
+log = get_logger("notifier")
+
+
+class LogNotifier:
+    name = "log"
+
+    def set_loading(self):
+        log.debug("Question in progress...")
+
+    def display_answer(self, answer, color="black"):
+        log.info("Answer: %s", answer)
+
+    def stop(self):
+        pass
+
+
+class NotifySendNotifier:
+    name = "notify-send"
+    APP_NAME = "screenshot-ai"
+    TIMEOUT_MS = 5000
+
+    def __init__(self):
+        self._command = shutil.which("notify-send")
+        if self._command is None:
+            raise RuntimeError("notify-send not found (install libnotify-bin).")
+
+    def set_loading(self):
+        pass # A notification per question start would only be noise
+
+    def display_answer(self, answer, color="black"):
+        urgency = "critical" if color == "red" else "normal"
+        try:
+            # The synchronous hint makes the new answer replace the previous notification
+            subprocess.Popen([self._command, "-a", self.APP_NAME, "-u", urgency, "-t", str(self.TIMEOUT_MS),
+                              "-h", "string:x-canonical-private-synchronous:" + self.APP_NAME,
+                              "Answer", answer])
+        except OSError as e:
+            log.error("notify-send failed: %s", e)
+
+    def stop(self):
+        pass
+
+
+class FakeNotifier:
+    """Records the answers instead of showing them."""
+    name = "fake"
+
+    def __init__(self):
+        self.answers = []
+        self._lock = threading.Lock()
+
+    def set_loading(self):
+        pass
+
+    def display_answer(self, answer, color="black"):
+        with self._lock:
+            self.answers.append(answer)
+
+    def stop(self):
+        pass
+
+
+class AnswerCollector:
+    """Passes the updates on to another notifier and keeps the answer of one question."""
+    def __init__(self, inner):
+        self.inner = inner
+        self.answer = None
+        self.color = None
+
+    def set_loading(self):
+        if self.inner:
+            self.inner.set_loading()
+
+    def display_answer(self, answer, color="black"):
+        self.answer, self.color = answer, color
+        if self.inner:
+            self.inner.display_answer(answer, color)
+
+
+BACKENDS = {
+    "log": LogNotifier,
+    "notify-send": NotifySendNotifier,
+    "fake": FakeNotifier,
+}
+
+
+def create_backend(name=None):
+    """Creates the named notifier, the log notifier by default."""
+    name = name or "log"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown notifier {name!r} (available: {', '.join(BACKENDS)}).")
+    backend = BACKENDS[name]()
+    log.info("Using the %s notifier.", name)
+    return backend
@@ -0,0 +1,137 @@
+# Named question profiles from ../profiles.json. Every profile has its own
+# prompt file, model, PDF set, generation settings and hotkey, e.g.:
+#   {"profiles": [
+#     {"name": "math", "hotkey": "ctrl+shift+1", "prompt_file": "math.txt",
+#      "model": "models/gemini-2.5-pro", "pdf_sources": ["../pdfs/calculus.pdf"],
+#      "generation": {"temperature": 0.2}}
+#   ]}
+# All profiles are preloaded in the background on startup: the client of
+# every key is created, the PDFs (or their map-reduce chunks) are uploaded
+# with every key, and the prompt file and the model's input limit are read.
+# Pressing a profile's hotkey then asks the question with that profile,
+# without reconfiguring or leaving the listening state.
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gemini
+from logs import get_logger
+
+log = get_logger("profiles")
+
+PROFILES_FILE = "../profiles.json"
+PRELOAD_WORKERS = 4
+
+profiles = {} # name -> Profile, in file order
+_preload_thread = None
+
+
+class Profile:
+    def __init__(self, name, hotkey, prompt_file="default_prompt.txt", model=None,
+                 pdf_sources=(), generation=None):
+        self.name = name
+        self.hotkey = hotkey
+        self.prompt_file = prompt_file
+        self.model = model # None: the selected (or routed) model
+        self.pdf_sources = list(pdf_sources)
+        self.generation = dict(generation) if generation else None
+        self.state = "cold" # cold, warming, warm or failed
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "hotkey": self.hotkey,
+            "promptFile": self.prompt_file,
+            "model": self.model,
+            "pdfSources": self.pdf_sources,
+            "generation": self.generation,
+            "state": self.state,
+        }
+
+
+def load(path=PROFILES_FILE, reserved_hotkeys=()):
+    """Reads the profiles file. Invalid profiles are logged and skipped."""
+    profiles.clear()
+    if not os.path.exists(path):
+        return profiles
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f).get("profiles", [])
+    except (OSError, ValueError, AttributeError) as e:
+        log.error("Error loading %s: %s. No profiles loaded.", path, e)
+        return profiles
+
+    hotkeys = {hotkey.lower() for hotkey in reserved_hotkeys}
+    for entry in entries:
+        try:
+            profile = Profile(entry["name"], entry["hotkey"], entry.get("prompt_file", "default_prompt.txt"),
+                              entry.get("model"), entry.get("pdf_sources", []), entry.get("generation"))
+        except (KeyError, TypeError, ValueError) as e:
+            log.error("Skipping invalid profile %r: %s", entry, e)
+            continue
+        if profile.name in profiles:
+            log.error("Skipping the second profile named %r.", profile.name)
+            continue
+        if profile.hotkey.lower() in hotkeys:
+            log.error("Skipping profile %r, its hotkey %s is already used.", profile.name, profile.hotkey)
+            continue
+        if not os.path.exists(gemini.prompt_path(profile.prompt_file)):
+            log.error("Skipping profile %r, its prompt file %s doesn't exist.", profile.name, profile.prompt_file)
+            continue
+        hotkeys.add(profile.hotkey.lower())
+        profiles[profile.name] = profile
+    if profiles:
+        log.success("Loaded %s profiles: %s", len(profiles), ", ".join(f"{p.name} ({p.hotkey})" for p in profiles.values()))
+    return profiles
+
+
+def get(name):
+    profile = profiles.get(name)
+    if profile is None:
+        raise ValueError(f"Unknown profile {name!r} (profiles: {', '.join(profiles) or 'none'}).")
+    return profile
+
+
+def _preload(profile, default_model, pool):
+    profile.state = "warming"
+    model = profile.model or default_model
+    try:
+        gemini.read_prompt(gemini.prompt_path(profile.prompt_file))
+        gemini.input_token_limit(model)
+        sources = gemini.question_sources(profile.pdf_sources, model)
+    except Exception as e:
+        log.error("Failed to preload profile %r: %s", profile.name, e)
+        profile.state = "failed"
+        return
+    # Every key, since the questions rotate through them
+    tasks = [(source, idx) for idx in range(len(gemini.api_keys)) for source in sources]
+    uploaded = list(pool.map(lambda task: gemini.upload_pdf_part(*task), tasks))
+    failed = sum(1 for u in uploaded if u is None)
+    if failed:
+        log.warning("Profile %r: %s of %s uploads failed, they are retried on its next question.",
+                    profile.name, failed, len(tasks))
+    profile.state = "failed" if failed else "warm"
+    log.info("Profile %r preloaded (%s files on %s keys).", profile.name, len(sources), len(gemini.api_keys))
+
+
+def preload_all(default_model):
+    """Warms every profile on a background thread."""
+    global _preload_thread
+    if not profiles or _preload_thread is not None:
+        return
+
+    def run():
+        for idx in range(len(gemini.api_keys)):
+            gemini.get_client(idx)
+        with ThreadPoolExecutor(max_workers=PRELOAD_WORKERS, thread_name_prefix="profile-preload") as pool:
+            for profile in list(profiles.values()):
+                _preload(profile, default_model, pool)
+
+    _preload_thread = threading.Thread(target=run, name="profile-preload", daemon=True)
+    _preload_thread.start()
+
+
+def status():
+    """The profiles with their preload state, for the UI and the status command."""
+    return [p.to_dict() for p in profiles.values()]
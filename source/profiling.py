@@ -0,0 +1,195 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from contextlib import contextmanager
+
+from logs import get_logger
+
+log = get_logger("profiling")
+
+PROFILE_DIR = "../profiles"
+TOP_STATS = 40 # Lines written to the text summaries
+TRACEMALLOC_FRAMES = 25
+
+_lock = threading.Lock()
+_cprofile_remaining = 0 # Questions still to be profiled
+_cprofile_stats = None # pstats.Stats accumulated over the profiled questions
+_cprofile_questions = 0
+_last_snapshot = None # Previous tracemalloc snapshot, for diffs
+_last_files = [] # Newest written files first
+
+
+def _output_path(kind, ext):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.abspath(os.path.join(PROFILE_DIR, f"{kind}_{stamp}.{ext}"))
+    n = 1
+    while os.path.exists(path): # Several files of one kind within a second
+        n += 1
+        path = os.path.abspath(os.path.join(PROFILE_DIR, f"{kind}_{stamp}_{n}.{ext}"))
+    _last_files.insert(0, path)
+    del _last_files[10:]
+    return path
+
+
+# --- cProfile ---
+
+def start_cprofile(questions=1):
+    """Profiles the next N questions, then writes the results automatically."""
+    global _cprofile_remaining, _cprofile_stats, _cprofile_questions
+    questions = max(1, int(questions))
+    with _lock:
+        _cprofile_remaining = questions
+        _cprofile_stats = None
+        _cprofile_questions = 0
+    log.info("cProfile armed for the next %s question(s).", questions)
+    return get_profiling_status()
+
+
+def stop_cprofile():
+    """Stops profiling early and writes what was collected so far."""
+    global _cprofile_remaining
+    with _lock:
+        _cprofile_remaining = 0
+        path = _dump_cprofile_locked()
+    if path is None:
+        log.info("cProfile stopped, no question was profiled.")
+    return get_profiling_status()
+
+
+def _dump_cprofile_locked():
+    global _cprofile_stats
+    if _cprofile_stats is None:
+        return None
+    path = _output_path("cprofile", "prof")
+    _cprofile_stats.dump_stats(path)
+
+    summary = io.StringIO()
+    _cprofile_stats.stream = summary
+    _cprofile_stats.sort_stats("cumulative").print_stats(TOP_STATS)
+    with open(path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+        f.write(f"cProfile of {_cprofile_questions} question(s)\n\n")
+        f.write(summary.getvalue())
+
+    _cprofile_stats = None
+    log.success("cProfile results written to %s", path)
+    return path
+
+
+@contextmanager
+def profile_question():
+    """Wraps one question; profiles it when cProfile is armed."""
+    global _cprofile_remaining, _cprofile_stats, _cprofile_questions
+    with _lock:
+        armed = _cprofile_remaining > 0
+    if not armed:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Only one profiler can be active, e.g. two questions at the same time
+        log.debug("Question not profiled: %s", e)
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _lock:
+            if _cprofile_remaining > 0:
+                if _cprofile_stats is None:
+                    _cprofile_stats = pstats.Stats(profiler)
+                else:
+                    _cprofile_stats.add(profiler)
+                _cprofile_questions += 1
+                _cprofile_remaining -= 1
+                if _cprofile_remaining == 0:
+                    _dump_cprofile_locked()
+
+
+# --- tracemalloc ---
+
+def take_memory_snapshot():
+    """
+    Starts tracemalloc on the first call. Later calls write the top
+    allocations and the difference to the previous snapshot.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _last_snapshot = None
+        log.info("tracemalloc started. Take another snapshot later to see what grew.")
+        return get_profiling_status()
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    path = _output_path("tracemalloc", "txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Traced memory: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n")
+
+        if _last_snapshot is not None:
+            f.write(f"\nTop {TOP_STATS} differences to the previous snapshot:\n")
+            for stat in snapshot.compare_to(_last_snapshot, "lineno")[:TOP_STATS]:
+                f.write(f"{stat}\n")
+
+        f.write(f"\nTop {TOP_STATS} allocations:\n")
+        for stat in snapshot.statistics("lineno")[:TOP_STATS]:
+            f.write(f"{stat}\n")
+
+        f.write("\nTracebacks of the 5 largest allocations:\n")
+        for stat in snapshot.statistics("traceback")[:5]:
+            f.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+            f.write("\n".join(stat.traceback.format()) + "\n")
+
+    _last_snapshot = snapshot
+    log.success("tracemalloc snapshot written to %s", path)
+    return get_profiling_status()
+
+
+def stop_memory_tracing():
+    """Stops tracemalloc and drops the stored snapshot."""
+    global _last_snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        log.info("tracemalloc stopped.")
+    _last_snapshot = None
+    return get_profiling_status()
+
+
+# --- Thread stacks ---
+
+def dump_thread_stacks():
+    """Writes the current stack of every thread."""
+    names = {t.ident: f"{t.name}{' (daemon)' if t.daemon else ''}" for t in threading.enumerate()}
+    path = _output_path("threads", "txt")
+    with open(path, "w", encoding="utf-8") as f:
+        for ident, frame in sys._current_frames().items():
+            f.write(f"Thread {names.get(ident, 'unknown')} [{ident}]:\n")
+            f.write("".join(traceback.format_stack(frame)))
+            f.write("\n")
+    log.success("Thread stacks written to %s", path)
+    return get_profiling_status()
+
+
+def get_profiling_status():
+    """State of the profiling tools for the UI."""
+    with _lock:
+        return {
+            "cprofileRemaining": _cprofile_remaining,
+            "cprofileQuestions": _cprofile_questions,
+            "tracemallocActive": tracemalloc.is_tracing(),
+            "lastFiles": list(_last_files),
+        }
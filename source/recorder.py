@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import tracing
+from logs import get_logger
+
+log = get_logger("recorder")
+
+CORPUS_DIR = "../corpus"
+INDEX_FILE = "requests.jsonl" # One line per recorded question
+BLOB_DIR = "blobs" # Screenshots, gzip-compressed and named by their SHA-256
+
+enabled = False
+_corpus_dir = CORPUS_DIR
+_pending = {} # trace_id -> data collected while the question runs
+_lock = threading.Lock()
+_queue = queue.Queue(maxsize=100) # Finished records waiting for the writer thread
+_writer = None
+
+
+def enable(corpus_dir=CORPUS_DIR):
+    """Starts recording every question into the corpus directory."""
+    global enabled, _corpus_dir, _writer
+    _corpus_dir = corpus_dir
+    os.makedirs(os.path.join(_corpus_dir, BLOB_DIR), exist_ok=True)
+    if _writer is None:
+        _writer = threading.Thread(target=_write_loop, daemon=True)
+        _writer.start()
+        tracing.add_listener(_on_trace_finished)
+    enabled = True
+    log.info("Recording questions into %s", os.path.abspath(_corpus_dir))
+
+
+def blob_path(sha, corpus_dir=None):
+    return os.path.join(corpus_dir or _corpus_dir, BLOB_DIR, sha + ".gz")
+
+
+def capture(image_path, config):
+    """
+    Called by the pipeline with the encoded screenshot and the config
+    snapshot of the running question. Does nothing unless enabled.
+    """
+    t = tracing.current_trace()
+    if not enabled or t is None:
+        return
+    try:
+        with open(image_path, "rb") as f:
+            screenshot = f.read()
+    except OSError as e:
+        log.warning("Could not read screenshot for recording: %s", e)
+        return
+    with _lock:
+        _pending[t.trace_id] = {"screenshot": screenshot, "config": config}
+
+
+def set_response(text, tokens):
+    """Stores the model answer of the running question."""
+    t = tracing.current_trace()
+    if not enabled or t is None:
+        return
+    with _lock:
+        if t.trace_id in _pending:
+            _pending[t.trace_id]["response"] = {"text": text, "tokens": tokens}
+
+
+def _on_trace_finished(record):
+    with _lock:
+        data = _pending.pop(record["trace_id"], None)
+    if data is None:
+        return
+
+    stages = {}
+    for span in record["spans"]:
+        stages[span["name"]] = round(stages.get(span["name"], 0) + span["duration_ms"], 3)
+    data.update({
+        "id": record["trace_id"],
+        "time": record["started_at"],
+        "status": record["status"],
+        "total_ms": round(record["duration_ms"], 3),
+        "stages_ms": stages,
+    })
+    try:
+        _queue.put_nowait(data)
+    except queue.Full:
+        log.warning("Recorder queue is full, question %s was not recorded.", record["trace_id"])
+
+
+def _write_loop():
+    """Compresses and stores the records off the question thread."""
+    while True:
+        data = _queue.get()
+        try:
+            _write(data)
+        except Exception as e:
+            log.error("Failed to record question %s: %s", data.get("id"), e)
+
+
+def _write(data):
+    screenshot = data.pop("screenshot")
+    sha = hashlib.sha256(screenshot).hexdigest()
+    path = blob_path(sha)
+    if not os.path.exists(path): # Same screenshot already stored
+        with open(path + ".tmp", "wb") as f:
+            f.write(gzip.compress(screenshot, compresslevel=6))
+        os.replace(path + ".tmp", path)
+
+    data["screenshot"] = {"sha256": sha, "bytes": len(screenshot)}
+    with open(os.path.join(_corpus_dir, INDEX_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(data) + "\n")
+    log.debug("Recorded question %s (screenshot %s).", data["id"], sha[:12])
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """Returns the recorded questions of a corpus, oldest first."""
+    entries = []
+    with open(os.path.join(corpus_dir, INDEX_FILE), encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+
+def load_screenshot(entry, corpus_dir=CORPUS_DIR):
+    """Returns the encoded screenshot bytes of a recorded question."""
+    with open(blob_path(entry["screenshot"]["sha256"], corpus_dir), "rb") as f:
+        return gzip.decompress(f.read())
+
+
+def config_snapshot(pdf_sources, model, prompt_file_name, prompt_text=None):
+    """The configuration a question ran with, as stored in the corpus."""
+    pdfs = []
+    for source in pdf_sources:
+        size = None
+        if not source.lower().startswith("http") and os.path.exists(source):
+            size = os.path.getsize(source)
+        pdfs.append({"source": source, "bytes": size})
+    return {
+        "model": model,
+        "prompt_file": prompt_file_name,
+        "prompt_sha256": hashlib.sha256(prompt_text.encode()).hexdigest() if prompt_text else None,
+        "pdf_sources": pdfs,
+        "recorded_at": time.time(),
+    }
@@ -0,0 +1,177 @@
+# Replays a corpus recorded with `main.py --record` (see recorder.py) through
+# the question pipeline, so encoding, caching and scheduling changes can be
+# compared on identical traffic.
+#
+# Usage:
+#   py replay.py                                 replay ../corpus against the offline fake
+#   py replay.py --target model                  replay against the real API (apikeys.txt)
+#   py replay.py --target model --model models/gemini-2.5-pro --rate 0.5
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import benchmark
+import fake_gemini
+import logs
+import notifier
+import recorder
+import tracing
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(script_dir) # Corpus and prompt paths are relative to the source folder
+
+PROMPT_DIR = "../prompt_files"
+DEFAULT_PROMPT = "default_prompt.txt"
+
+_local = threading.local() # Screenshot and finished trace of each replay worker
+
+
+def _on_trace_finished(record):
+    _local.trace = record
+
+
+def _stand_in_pdfs(entries):
+    """Synthetic PDFs of the recorded sizes for sources that are not available offline."""
+    stand_ins = {}
+    for entry in entries:
+        for pdf in entry["config"]["pdf_sources"]:
+            source = pdf["source"]
+            if source in stand_ins or (not source.lower().startswith("http") and os.path.exists(source)):
+                continue
+            size = pdf["bytes"] or 20 * 50_000
+            pages = max(1, size // 50_000)
+            path = os.path.join(benchmark.work_dir, f"standin_{len(stand_ins)}.pdf")
+            fake_gemini.synthetic_pdf(path, pages, page_bytes=size // pages, seed=len(stand_ins))
+            stand_ins[source] = path
+    return stand_ins
+
+
+def _prompt_file(entry):
+    name = entry["config"]["prompt_file"] or DEFAULT_PROMPT
+    if not name.endswith(".txt"):
+        name += ".txt"
+    if os.path.exists(os.path.join(PROMPT_DIR, name)):
+        return name
+    print(f"Prompt file {name!r} not found, using {DEFAULT_PROMPT}.")
+    return DEFAULT_PROMPT
+
+
+def replay_one(gemini, entry, image, pdf_sources, model, prompt_file):
+    """Runs one recorded question and returns (answer, trace record)."""
+    _local.image = image
+    _local.trace = None
+    tray = notifier.FakeNotifier()
+    gemini.process_question(tray, pdf_sources, model, prompt_file)
+    return (tray.answers[-1] if tray.answers else None), _local.trace
+
+
+def _as_trace(entry):
+    """A recorded entry in the shape tracing.stage_stats expects."""
+    return {"duration_ms": entry["total_ms"],
+            "spans": [{"name": k, "duration_ms": v} for k, v in entry["stages_ms"].items()]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded questions.")
+    parser.add_argument("--corpus", default=recorder.CORPUS_DIR, help="Corpus directory")
+    parser.add_argument("--target", choices=("fake", "model"), default="fake",
+                        help="Offline fake client or the real API")
+    parser.add_argument("--model", help="Model to use instead of the recorded one")
+    parser.add_argument("--rate", type=float, default=0, help="Questions per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Max questions in flight")
+    parser.add_argument("--limit", type=int, help="Replay only the first N questions")
+    parser.add_argument("--keys", type=int, default=4, help="Number of fake API keys (fake target)")
+    parser.add_argument("--generate-ms", type=float, default=800, help="Mean fake model latency (fake target)")
+    parser.add_argument("--output", help="Write the per-question results as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the app's logs")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logs.root.setLevel(logging.WARNING)
+    tracing.TRACE_FILE = os.path.join(benchmark.work_dir, "traces.jsonl")
+
+    entries = recorder.load_corpus(args.corpus)[:args.limit]
+    if not entries:
+        print(f"No recorded questions in {args.corpus}.")
+        return 1
+
+    if args.target == "fake":
+        gemini = benchmark.import_gemini_offline(args.keys)
+        backend = fake_gemini.FakeBackend(fake_gemini.FakeConfig(
+            generate_latency=(args.generate_ms / 1000, args.generate_ms * 0.2 / 1000), seed=1))
+        gemini.client_factory = backend.client_factory
+        gemini._init_client_with_index(0)
+        stand_ins = _stand_in_pdfs(entries)
+    else:
+        import gemini
+        stand_ins = {}
+
+    from PIL import Image
+    gemini.grab_screen = lambda: _local.image.copy()
+    tracing.add_listener(_on_trace_finished)
+
+    print(f"Replaying {len(entries)} questions against the {args.target} target...")
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = []
+        for i, entry in enumerate(entries):
+            if args.rate > 0:
+                # Open-loop arrivals: question i starts at i / rate seconds
+                delay = start + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            image = Image.open(io.BytesIO(recorder.load_screenshot(entry, args.corpus)))
+            image.load()
+            pdf_sources = [stand_ins.get(p["source"], p["source"]) for p in entry["config"]["pdf_sources"]]
+            model = args.model or entry["config"]["model"]
+            futures.append((entry, pool.submit(replay_one, gemini, entry, image, pdf_sources, model,
+                                               _prompt_file(entry))))
+
+        for entry, future in futures:
+            answer, trace = future.result()
+            results.append({
+                "id": entry["id"],
+                "recorded_answer": (entry.get("response") or {}).get("text"),
+                "replayed_answer": answer,
+                "recorded_ms": entry["total_ms"],
+                "replayed_ms": trace["duration_ms"] if trace else None,
+                "status": trace["status"] if trace else "error",
+                "_trace": trace,
+            })
+    elapsed = time.perf_counter() - start
+
+    recorded = tracing.stage_stats([_as_trace(e) for e in entries])
+    replayed = tracing.stage_stats([r["_trace"] for r in results if r["_trace"]])
+    print(f"\nReplayed {len(results)} questions in {elapsed:.1f} s ({len(results) / elapsed:.2f} q/s), "
+          f"{sum(r['status'] != 'ok' for r in results)} errors.")
+    print(f"\n{'stage':<14} {'recorded p50':>13} {'replayed p50':>13} {'recorded p95':>13} {'replayed p95':>13}")
+    for stage in sorted(set(recorded) | set(replayed)):
+        old, new = recorded.get(stage, {}), replayed.get(stage, {})
+        print(f"{stage:<14} {old.get('p50', '-'):>13} {new.get('p50', '-'):>13} "
+              f"{old.get('p95', '-'):>13} {new.get('p95', '-'):>13}")
+
+    if args.target == "model":
+        comparable = [r for r in results if r["recorded_answer"] and r["replayed_answer"]]
+        same = sum(r["recorded_answer"].strip() == r["replayed_answer"].strip() for r in comparable)
+        print(f"\nSame answer as recorded: {same}/{len(comparable)}")
+
+    if args.output:
+        for r in results:
+            r["stages_ms"] = {}
+            for span in (r.pop("_trace") or {}).get("spans", []):
+                r["stages_ms"][span["name"]] = r["stages_ms"].get(span["name"], 0) + span["duration_ms"]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "elapsed_s": elapsed, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
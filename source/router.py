@@ -0,0 +1,259 @@
+# Optional automatic model routing (--router). For every question it picks the
+# most capable model that is expected to stay within a latency target (p95 of
+# the model call) and a cost target (USD per question), using what this app
+# measured itself: model call latencies, error and rate limit rates and token
+# counts of the recent questions. The statistics are loaded from the answer
+# history on startup and kept up to date from the finished traces.
+# Latency is predicted for the size of the next request (screenshot tiles and
+# PDF pages). The cost is the estimated input plus the answer (and thinking)
+# tokens the model recently used for the same prompt file, priced with the
+# table below; the static DEFAULT_OUTPUT_TOKENS only stands in while there are
+# too few of those samples. A small share of the questions (EXPLORE_RATE) tries another
+# model, those without (fresh) statistics first, so the statistics of the
+# models that are not picked don't go stale; the other questions only go to
+# models with statistics, or to the selected model while there are none.
+import math
+import random
+import threading
+import time
+from collections import deque
+
+import history
+import token_estimator
+import tracing
+from logs import get_logger
+
+log = get_logger("router")
+
+# USD per 1M (input, output) tokens, output includes thinking (paid tier,
+# prompts up to 200k tokens). The more expensive model is assumed to be the
+# more capable one. Other models are priced like the newest model of their
+# family, see price().
+MODEL_PRICES = {
+    "models/gemini-2.0-flash-lite": (0.075, 0.30),
+    "models/gemini-2.0-flash": (0.10, 0.40),
+    "models/gemini-2.5-flash-lite": (0.10, 0.40),
+    "models/gemini-2.5-flash": (0.30, 2.50),
+    "models/gemini-2.5-pro": (1.25, 10.00),
+}
+FAMILIES = ("flash-lite", "flash", "pro") # Most specific first
+DEFAULT_OUTPUT_TOKENS = 300 # Answer and thinking tokens assumed with too few samples
+
+WINDOW = 200 # Recent questions per model taken into account
+MIN_SAMPLES = 5 # Fewer samples than this: the model is explored first
+EXPLORE_RATE = 0.05 # Share of questions sent to another model that fits the cost target
+STALE_SECONDS = 6 * 3600 # A model without a sample for this long is explored again
+UNHEALTHY_ERROR_RATE = 0.5 # Over the last HEALTH_WINDOW questions of the model
+HEALTH_WINDOW = 10
+RATE_LIMIT_BACKOFF_SECONDS = 60 # A model is skipped this long after a 429
+
+enabled = False
+p95_target_ms = None
+cost_target_usd = None
+candidates = []
+_samples = {} # model -> deque of (time, tokens, model_ms, error)
+_output_tokens = {} # (model, prompt file) -> deque of answer and thinking tokens
+_last_rate_limit = {} # model -> time of the last 429
+_lock = threading.Lock()
+_random = random.Random()
+
+
+def price(model):
+    """(input, output) USD per 1M tokens of a model, or None for an unknown model family."""
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    for family in FAMILIES:
+        known = [m for m in MODEL_PRICES if m.endswith("-" + family)]
+        if f"-{family}" in model and known:
+            return MODEL_PRICES[max(known)] # The newest version of the family
+    return None
+
+
+def enable(models, p95_ms=None, cost_usd=None):
+    """Routes between the given models (those with a known price family) from now on."""
+    global enabled, p95_target_ms, cost_target_usd, candidates
+    candidates = sorted((m for m in models if price(m)), key=price, reverse=True)
+    if not candidates:
+        log.error("None of the available models has a known price, model routing is disabled.")
+        return False
+    p95_target_ms, cost_target_usd = p95_ms, cost_usd
+    _load_history()
+    tracing.add_listener(_on_trace_finished)
+    enabled = True
+    log.success("Model routing enabled between %s (p95 target: %s ms, cost target: %s USD).",
+                ", ".join(candidates), p95_ms or "none", cost_usd or "none")
+    return True
+
+
+def _add_sample(model, prompt_file, started_at, tokens, input_tokens, model_ms, error):
+    with _lock:
+        _samples.setdefault(model, deque(maxlen=WINDOW)).append((started_at, tokens or 0, model_ms, error))
+        if error == "rate_limit":
+            _last_rate_limit[model] = max(_last_rate_limit.get(model, 0), started_at)
+        if error is None and tokens and input_tokens is not None:
+            _output_tokens.setdefault((model, prompt_file), deque(maxlen=WINDOW)).append(tokens - input_tokens)
+
+
+def _load_history():
+    """Fills the statistics from the stored questions, oldest first."""
+    try:
+        rows = history.recent(WINDOW * len(candidates))
+    except Exception as e:
+        log.warning("Cannot load the routing statistics from the history: %s", e)
+        return
+    loaded = 0
+    for row in reversed(rows):
+        if row["model"] in candidates and row.get("model_ms"):
+            _add_sample(row["model"], row["prompt_file"], row["created"], row["tokens"], row.get("input_tokens"),
+                        row["model_ms"], row.get("error"))
+            loaded += 1
+    log.info("Loaded %s questions from the history for model routing.", loaded)
+
+
+def _on_trace_finished(record):
+    attrs = record["attrs"]
+    model = attrs.get("model")
+    if record["name"] != "question" or model not in candidates:
+        return
+    model_ms = sum(s["duration_ms"] for s in record["spans"] if s["name"] == "model_call")
+    if not model_ms:
+        return # Failed before the model was called
+    _add_sample(model, attrs.get("prompt_file"), record["started_at"], attrs.get("tokens"),
+                attrs.get("input_tokens"), model_ms, attrs.get("error") or (None if record["status"] == "ok" else "error"))
+
+
+def _fit(samples):
+    """Least squares fit of model_ms = a + b * tokens, plus the residuals."""
+    n = len(samples)
+    xs = [s[1] for s in samples]
+    ys = [s[2] for s in samples]
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    b = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x if var_x else 0.0
+    b = max(b, 0.0) # More tokens never make the call faster
+    a = mean_y - b * mean_x
+    return a, b, sorted(y - (a + b * x) for x, y in zip(xs, ys))
+
+
+def model_stats(model, tokens=None):
+    """Statistics of a model; p95_ms is predicted for a request of the given size."""
+    with _lock:
+        samples = list(_samples.get(model, ()))
+    ok = [s for s in samples if s[3] is None]
+    stats = {
+        "samples": len(samples),
+        "errorRate": (len(samples) - len(ok)) / len(samples) if samples else None,
+        "rateLimitRate": sum(1 for s in samples if s[3] == "rate_limit") / len(samples) if samples else None,
+        "recentErrorRate": (sum(1 for s in samples[-HEALTH_WINDOW:] if s[3] is not None)
+                            / len(samples[-HEALTH_WINDOW:]) if samples else None),
+        "lastSample": samples[-1][0] if samples else None,
+        "p50_ms": None,
+        "p95_ms": None,
+    }
+    if ok:
+        latencies = sorted(s[2] for s in ok)
+        stats["p50_ms"] = round(tracing.percentile(latencies, 50), 1)
+        stats["p95_ms"] = round(tracing.percentile(latencies, 95), 1)
+        if tokens is not None and len(ok) >= MIN_SAMPLES:
+            a, b, residuals = _fit(ok)
+            stats["p95_ms"] = round(max(a + b * tokens + tracing.percentile(residuals, 95), 0), 1)
+    return stats
+
+
+def output_tokens(model, prompt_file):
+    """Median answer and thinking tokens of the model for the prompt file, and whether it was measured."""
+    with _lock:
+        samples = sorted(_output_tokens.get((model, prompt_file), ()))
+    if len(samples) < MIN_SAMPLES:
+        return DEFAULT_OUTPUT_TOKENS, False
+    return tracing.percentile(samples, 50), True
+
+
+def estimate_cost(model, tokens, prompt_file=None):
+    """USD of a question with the given input tokens."""
+    input_price, output_price = price(model)
+    return (input_price * tokens + output_price * output_tokens(model, prompt_file)[0]) / 1_000_000
+
+
+def _needs_exploring(stats, now):
+    return stats["samples"] < MIN_SAMPLES or now - stats["lastSample"] > STALE_SECONDS
+
+
+def choose(pdf_sources, fallback, prompt_file=None):
+    """Returns the model for the next question (fallback if routing is off or nothing is known)."""
+    if not enabled:
+        return fallback
+    now = time.time()
+    tokens = token_estimator.estimate_input_tokens(pdf_sources)
+    stats = {m: model_stats(m, tokens) for m in candidates}
+
+    usable = []
+    for m in candidates:
+        if now - _last_rate_limit.get(m, 0) < RATE_LIMIT_BACKOFF_SECONDS:
+            log.debug("Router skips %s: rate limited recently.", m)
+        elif (stats[m]["samples"] >= HEALTH_WINDOW and stats[m]["recentErrorRate"] >= UNHEALTHY_ERROR_RATE):
+            log.debug("Router skips %s: %.0f%% of its recent calls failed.", m, stats[m]["recentErrorRate"] * 100)
+        else:
+            usable.append(m)
+    if not usable:
+        log.warning("Every routed model is unhealthy, using %s.", fallback)
+        return fallback
+
+    affordable = [m for m in usable
+                  if cost_target_usd is None or estimate_cost(m, tokens, prompt_file) <= cost_target_usd]
+
+    # Explore a small share of the questions: models without (fresh) statistics first
+    if affordable and _random.random() < EXPLORE_RATE:
+        unexplored = [m for m in affordable if _needs_exploring(stats[m], now)]
+        if unexplored:
+            return _chosen(_random.choice(unexplored), "exploring", tokens, prompt_file, stats)
+        return _chosen(_random.choice(affordable), "random exploration", tokens, prompt_file, stats)
+
+    # The rest only goes to models with measurements
+    usable = [m for m in usable if stats[m]["samples"]]
+    affordable = [m for m in affordable if stats[m]["samples"]]
+    if not usable:
+        log.debug("Router has no statistics yet, using %s.", fallback)
+        return fallback
+
+    def expected_ms(m):
+        # A failed call is retried by the user, so errors stretch the latency
+        if stats[m]["p95_ms"] is None: # Only failed calls so far
+            return math.inf
+        return stats[m]["p95_ms"] / max(1 - stats[m]["errorRate"], 0.1)
+
+    for m in affordable: # Most capable first
+        if p95_target_ms is None or expected_ms(m) <= p95_target_ms:
+            return _chosen(m, "fits the targets", tokens, prompt_file, stats)
+
+    # Nothing fits: the model that misses the targets the least
+    def violation(m):
+        latency = expected_ms(m) / p95_target_ms if p95_target_ms else 1
+        cost = estimate_cost(m, tokens, prompt_file) / cost_target_usd if cost_target_usd else 1
+        return max(latency, cost)
+    return _chosen(min(usable, key=violation), "closest to the targets", tokens, prompt_file, stats)
+
+
+def _chosen(model, reason, tokens, prompt_file, stats):
+    s = stats[model]
+    log.info("Router picked %s (%s): ~%s input tokens, predicted p95 %s ms, ~%.5f USD.",
+             model, reason, tokens, s["p95_ms"], estimate_cost(model, tokens, prompt_file))
+    return model
+
+
+def get_stats(pdf_sources=(), prompt_file=None):
+    """Routing targets and per-model statistics for the status command."""
+    if not enabled:
+        return None
+    tokens = token_estimator.estimate_input_tokens(pdf_sources)
+    models = {}
+    for m in candidates:
+        output, measured = output_tokens(m, prompt_file)
+        models[m] = dict(model_stats(m, tokens), outputTokens=round(output), outputMeasured=measured,
+                         usdPerQuestion=round(estimate_cost(m, tokens, prompt_file), 6))
+    return {
+        "inputTokens": tokens,
+        "p95TargetMs": p95_target_ms,
+        "costTargetUsd": cost_target_usd,
+        "models": models,
+    }
@@ -0,0 +1,215 @@
+# Session snapshot in ../session.json, so a restart doesn't start cold.
+# It holds what the user configured (PDF sources, model, prompt file) and what
+# was expensive to find out: the model catalogue and input limits, the live
+# uploads of the PDFs per key, the chunk files split out of them and the key
+# cooldowns. It is written atomically on a background thread whenever the
+# configuration changes (hashing a new PDF takes a while) and on shutdown. On
+# startup main.py applies it right away and revalidates it in the background:
+# the catalogue is fetched again, the live uploads of every key are looked up,
+# and the PDFs are uploaded again only with the key of the next question, so
+# it only uploads its screenshot. The other keys upload on first use.
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chunking
+import file_manager
+import gemini
+from logs import get_logger
+
+log = get_logger("session")
+
+SESSION_FILE = "../session.json"
+VERSION = 1
+REVALIDATE_WORKERS = 4
+
+_lock = threading.Lock()
+_last_saved = None # JSON of the last written snapshot, unchanged ones aren't written again
+_status = {"state": "cold"} # cold, restoring, ready or failed
+_pending = None # Snapshot function of the latest change, written by the save thread
+_pending_lock = threading.Lock()
+_save_wake = threading.Event()
+_save_order = threading.Lock() # A queued snapshot never lands after a newer one
+_save_thread = None
+
+
+def _is_url(source):
+    return source.lower().startswith(("http://", "https://"))
+
+
+def snapshot(pdf_sources, model, prompt_file, models=None):
+    """The session as a JSON-serializable dict."""
+    hashes = {s: file_manager.file_sha256(s) for s in pdf_sources if not _is_url(s) and os.path.exists(s)}
+    now = time.time()
+    return {
+        "version": VERSION,
+        "pdfSources": list(pdf_sources),
+        "pdfHashes": hashes,
+        "model": model,
+        "promptFile": prompt_file,
+        "models": list(models) if models else None,
+        "inputTokenLimits": dict(gemini.input_token_limits),
+        # Remote file names of the PDFs' live uploads, per key fingerprint
+        "uploads": {gemini.key_fingerprint(idx): file_manager.live_uploads(gemini.key_fingerprint(idx), pdf_sources)
+                    for idx in range(len(gemini.api_keys))},
+        "chunkFiles": chunking.existing_chunk_files(hashes.values()),
+        # Absolute times, still valid after a quick restart
+        "keyCooldowns": {str(idx): until for idx, until in gemini.key_cooldowns.items() if until > now},
+    }
+
+
+def save(state):
+    """Writes the snapshot atomically, if it changed since the last write."""
+    global _last_saved
+    data = json.dumps(state, indent=1, sort_keys=True)
+    with _lock:
+        if data == _last_saved:
+            return False
+        try:
+            with open(SESSION_FILE + ".tmp", "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(SESSION_FILE + ".tmp", SESSION_FILE)
+        except OSError as e:
+            log.error("Error saving %s: %s", SESSION_FILE, e)
+            return False
+        _last_saved = data
+    log.debug("Session saved.")
+    return True
+
+
+def _save_loop():
+    global _pending
+    while True:
+        _save_wake.wait()
+        _save_wake.clear()
+        with _save_order:
+            with _pending_lock:
+                make_state, _pending = _pending, None
+            if make_state is not None:
+                try:
+                    save(make_state())
+                except Exception as e:
+                    log.error("Failed to save the session: %s", e)
+
+
+def save_later(make_state):
+    """
+    Saves make_state() on a background thread, off the UI callbacks. Changes
+    coming faster than the writes are coalesced into the last one.
+    """
+    global _pending, _save_thread
+    with _pending_lock:
+        _pending = make_state
+        if _save_thread is None:
+            _save_thread = threading.Thread(target=_save_loop, name="session-save", daemon=True)
+            _save_thread.start()
+    _save_wake.set()
+
+
+def save_now(make_state):
+    """Saves make_state() right away (on shutdown), dropping a queued older snapshot."""
+    global _pending
+    with _save_order:
+        with _pending_lock:
+            _pending = None
+        save(make_state())
+
+
+def load():
+    """The last snapshot, or None if there is none (or it can't be used)."""
+    global _last_saved
+    if not os.path.exists(SESSION_FILE):
+        return None
+    try:
+        with open(SESSION_FILE, encoding="utf-8") as f:
+            data = f.read()
+        state = json.loads(data)
+    except (OSError, ValueError) as e:
+        log.error("Error loading %s: %s. Starting a new session.", SESSION_FILE, e)
+        return None
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        log.warning("%s is from another version, starting a new session.", SESSION_FILE)
+        return None
+    _last_saved = data
+    return state
+
+
+def apply_cached(state):
+    """Restores the parts of the snapshot gemini.py owns: input limits and key cooldowns."""
+    for model, limit in (state.get("inputTokenLimits") or {}).items():
+        gemini.input_token_limits.setdefault(model, limit)
+    now = time.time()
+    for idx, until in (state.get("keyCooldowns") or {}).items():
+        if until > now and int(idx) < len(gemini.api_keys):
+            gemini.key_cooldowns[int(idx)] = until
+
+
+def _reuse(source, idx):
+    """The live upload of a PDF with the given key, None if it has to be uploaded (on first use)."""
+    sha256 = None if _is_url(source) else file_manager.file_sha256(source)
+    return file_manager.find(gemini.get_client(idx), gemini.key_fingerprint(idx), sha256=sha256, source=source)
+
+
+def _revalidate(state, check_model, on_done):
+    _status.update(state="restoring", started=time.time())
+    try:
+        model = check_model()
+
+        sources = []
+        for source in state.get("pdfSources", []):
+            if _is_url(source):
+                sources.append(source)
+            elif not os.path.exists(source):
+                log.warning("PDF of the last session not found: %s", source)
+            else:
+                if state.get("pdfHashes", {}).get(source) != file_manager.file_sha256(source):
+                    log.info("%s changed since the last session, it is uploaded again.", os.path.basename(source))
+                sources.append(source)
+        missing_chunks = [f for f in state.get("chunkFiles", []) if not os.path.exists(f)]
+        if missing_chunks:
+            log.debug("%s chunk files of the last session are gone, they are split again when needed.",
+                      len(missing_chunks))
+
+        # Live uploads of every key are looked up, only the next question's key uploads now
+        upload_sources = gemini.question_sources(sources, model) if sources else []
+        next_key = gemini.next_key_index()
+        keys = range(len(gemini.api_keys))
+        with ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix="session-revalidate") as pool:
+            live = list(pool.map(lambda task: _reuse(*task),
+                                 [(source, idx) for idx in keys if idx != next_key for source in upload_sources]))
+            uploaded = list(pool.map(lambda source: gemini.upload_pdf_part(source, next_key), upload_sources))
+
+        # Handles of the snapshot that were still live
+        names = {u.name for u in live + uploaded if u is not None}
+        saved = [name for per_key in (state.get("uploads") or {}).values() for name in per_key.values()]
+        reused = sum(1 for name in saved if name in names)
+        failed = sum(1 for u in uploaded if u is None)
+        ready = sum(1 for u in live + uploaded if u is not None)
+        _status.update(state="failed" if failed else "ready", finished=time.time(), reusedUploads=reused,
+                       savedUploads=len(saved), readyFiles=ready, failedUploads=failed)
+        log.success("Session restored in %.1f s: %s of %s saved uploads still live, %s of %s files ready on %s keys.",
+                    _status["finished"] - _status["started"], reused, len(saved), ready,
+                    len(upload_sources) * len(keys), len(keys))
+    except Exception as e:
+        log.error("Failed to revalidate the last session: %s", e)
+        _status.update(state="failed", finished=time.time())
+    on_done()
+
+
+def revalidate(state, check_model, on_done):
+    """
+    Checks the restored session on a background thread. check_model() fetches
+    the model catalogue again and returns the model to use (another one if the
+    saved one is gone), on_done() runs at the end, e.g. to save the snapshot.
+    """
+    thread = threading.Thread(target=_revalidate, args=(state, check_model, on_done),
+                              name="session-revalidate", daemon=True)
+    thread.start()
+    return thread
+
+
+def status():
+    """Restore state of the session, for the status command."""
+    return dict(_status)
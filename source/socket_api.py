@@ -0,0 +1,107 @@
+# Local control socket of the headless mode. One command per connection:
+# a line of text in, a line of JSON ({"ok": ..., "result"/"error": ...}) out.
+#   ask [profile]    answers the question on the screen (with a profile) and returns the answer
+#   batch_add        queues a capture of the screen for the next batch
+#   batch_submit     answers the queued captures with one request
+#   status           state of the question engine
+#   history [words]  the 20 newest answers (matching the words)
+#   quit             shuts the app down
+#
+# Usage (from another terminal):
+#   py socket_api.py ask
+#   py socket_api.py status
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from logs import get_logger
+
+log = get_logger("socket_api")
+
+SOCKET_PATH = os.environ.get("SCRAI_SOCKET",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scrai.sock"))
+CLIENT_TIMEOUT = 300 # Seconds to wait for an answer (ask runs a whole question)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(4096).decode("utf-8", errors="replace").strip()
+        if not line:
+            return
+        command, *args = line.split()
+        func = self.server.commands.get(command)
+        if func is None:
+            reply = {"ok": False, "error": f"Unknown command {command!r}. Commands: {', '.join(self.server.commands)}"}
+        else:
+            log.debug("Socket command: %s", line)
+            try:
+                reply = {"ok": True, "result": func(*args)}
+            except Exception as e:
+                log.error("Socket command %r failed: %s", command, e)
+                reply = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(reply, default=str) + "\n").encode())
+
+
+class SocketAPI:
+    """Serves the given {command: function} dict on a Unix socket."""
+    def __init__(self, commands, path=SOCKET_PATH):
+        self.commands = commands
+        self.path = os.path.abspath(path)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Unix sockets are not supported on this platform.")
+        if os.path.exists(self.path):
+            os.remove(self.path) # Left over by a crashed run
+        # Only this user may trigger questions: the socket is created 0600, a chmod
+        # after bind would leave a window in which anyone could connect
+        old_umask = os.umask(0o177)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self.path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+        self._server.commands = self.commands
+        self._thread = threading.Thread(target=self._server.serve_forever, name="socket-api", daemon=True)
+        self._thread.start()
+        log.success("Listening for commands on %s", self.path)
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        log.info("Socket API stopped.")
+
+
+def send_command(line, path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+    """Sends one command to a running app and returns its decoded reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall((line + "\n").encode())
+        with s.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} ask|status|quit")
+        sys.exit(2)
+    try:
+        reply = send_command(" ".join(sys.argv[1:]))
+    except OSError as e:
+        print(f"Cannot reach the app at {SOCKET_PATH}: {e}")
+        sys.exit(1)
+    print(json.dumps(reply.get("result") if reply["ok"] else reply, indent=2))
+    sys.exit(0 if reply["ok"] else 1)
@@ -0,0 +1,106 @@
+# Minimal static file server for the config window. It serves the UI assets
+# of the source folder from memory on an ephemeral localhost port, with ETags,
+# so reloading unchanged files is answered with 304 Not Modified.
+import hashlib
+import mimetypes
+import os
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logs import get_logger
+
+log = get_logger("static_server")
+
+ASSETS = ("ui.html", "ui.js") # Only these files are served
+INDEX = "ui.html"
+CACHE_CONTROL = "no-cache" # Revalidate on every load, the ETag turns that into a cheap 304
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        name = self.path.split("?", 1)[0].lstrip("/") or INDEX
+        asset = self.server.static.load(name)
+        if asset is None:
+            self.send_error(404)
+            return
+        body, etag, content_type, mtime = asset
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.send_header("Cache-Control", CACHE_CONTROL)
+        self.send_header("X-Content-Type-Options", "nosniff")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+class StaticServer:
+    """Serves a fixed set of files from a folder. The port is bound on creation."""
+    def __init__(self, root, files=ASSETS, host="127.0.0.1", port=0):
+        self.root = root
+        self.files = set(files)
+        self._cache = {} # name -> ((mtime, size), asset tuple)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.static = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def load(self, name):
+        """Returns (body, etag, content type, mtime) of an asset, re-read only when the file changed."""
+        if name not in self.files:
+            return None
+        path = os.path.join(self.root, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached and cached[0] == key:
+                return cached[1]
+        with open(path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type.endswith("javascript"):
+            content_type += "; charset=utf-8"
+        asset = (body, '"' + hashlib.sha1(body).hexdigest() + '"', content_type, stat.st_mtime)
+        with self._lock:
+            self._cache[name] = (key, asset)
+        return asset
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="static-server", daemon=True)
+        self._thread.start()
+        log.info("Serving the UI at %s", self.url)
+
+    def stop(self):
+        if self._thread:
+            self._server.shutdown()
+        self._server.server_close()
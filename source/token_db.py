@@ -2,7 +2,9 @@ import json
 import os
 from datetime import date, timedelta
 
-from ansi import ansi
+from logs import get_logger
+
+log = get_logger("token_db")
 
 TOKEN_DB_FILE = "../token_usage.json"
 
@@ -15,14 +17,14 @@ def load_token_data():
             data = json.load(f)
             # Ensure structure is correct
             if "total" not in data or "daily" not in data:
-                print(ansi.WARNING_MSG + f"{TOKEN_DB_FILE} structure incorrect. Resetting.")
+                log.warning("%s structure incorrect. Resetting.", TOKEN_DB_FILE)
                 return {"total": 0, "daily": {}}
             return data
     except json.JSONDecodeError:
-        print(ansi.ERROR_MSG + f"Error decoding JSON from {TOKEN_DB_FILE}. Resetting.")
+        log.error("Error decoding JSON from %s. Resetting.", TOKEN_DB_FILE)
         return {"total": 0, "daily": {}}
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Error loading token data from {TOKEN_DB_FILE}: {e}. Resetting.")
+        log.error("Error loading token data from %s: %s. Resetting.", TOKEN_DB_FILE, e)
         return {"total": 0, "daily": {}}
 
 def save_token_data(data):
@@ -31,12 +33,12 @@ def save_token_data(data):
         with open(TOKEN_DB_FILE, 'w') as f:
             json.dump(data, f, indent=4)
     except Exception as e:
-        print(ansi.ERROR_MSG + f"Error saving token data to {TOKEN_DB_FILE}: {e}")
+        log.error("Error saving token data to %s: %s", TOKEN_DB_FILE, e)
 
 def update_token_data(data, tokens_used):
     """Updates token usage data with new tokens used."""
     if tokens_used is None or not isinstance(tokens_used, int) or tokens_used < 0:
-        print(ansi.WARNING_MSG + f"Invalid token usage value received: {tokens_used}. Not updating.")
+        log.warning("Invalid token usage value received: %s. Not updating.", tokens_used)
         return data # Return data unchanged
 
     today_str = str(date.today())
@@ -0,0 +1,256 @@
+# Local estimate of a request's input tokens, before anything is uploaded:
+#   image   Gemini bills images in 768x768 tiles of 258 tokens (258 in total up to 384x384)
+#   pdf     258 tokens per page, or what was measured for that PDF before
+#   prompt  about 4 characters per token
+# Every answered question calibrates the estimates against the counts of its
+# usage_metadata: a correction factor per modality (from the per-modality
+# prompt token details, or from the total without them) and the measured
+# tokens of single PDFs. The calibration is kept in ../token_estimates.json.
+#
+# With a per-question budget (--token-budget) fit_budget() decides how a
+# question fits before it is uploaded: a smaller screenshot first (down to
+# MIN_IMAGE_SCALE), then the PDFs are taken in order while they fit and the
+# others are trimmed to the first pages that still fit (URLs can only be
+# dropped), and if the screenshot and the prompt alone don't fit the question
+# is rejected.
+import json
+import math
+import os
+import threading
+
+import file_manager
+from logs import get_logger
+
+log = get_logger("token_estimator")
+
+ESTIMATES_FILE = "../token_estimates.json"
+TOKENS_PER_IMAGE_TILE = 258
+IMAGE_TILE_SIZE = 768
+SMALL_IMAGE_SIZE = 384 # Images up to this size in both directions are one tile
+TOKENS_PER_PDF_PAGE = 258
+CHARS_PER_TOKEN = 4
+DEFAULT_PROMPT_TOKENS = 300 # When the prompt text isn't known
+DEFAULT_IMAGE_SIZE = (1920, 1080) # Before the first capture
+URL_PAGES = 20 # Page count guess for PDFs given by URL
+CALIBRATION_RATE = 0.2 # Weight of a new observation in the correction factors
+FACTOR_RANGE = (0.25, 4.0)
+MIN_IMAGE_SCALE = 0.5 # A smaller screenshot gets hard to read
+MIN_TRIMMED_PAGES = 1
+
+_lock = threading.Lock()
+_state = None # {"factors": {modality: factor}, "pdfs": {source id: measured tokens}}
+_pdf_pages = {} # (path, mtime, size) -> page count
+last_image_size = None # Size of the last screenshot, the next one is most likely the same
+
+
+def _is_url(source):
+    return source.lower().startswith(("http://", "https://"))
+
+
+def _load():
+    global _state
+    if _state is None:
+        _state = {"factors": {"image": 1.0, "pdf": 1.0, "prompt": 1.0}, "pdfs": {}}
+        if os.path.exists(ESTIMATES_FILE):
+            try:
+                with open(ESTIMATES_FILE, encoding="utf-8") as f:
+                    saved = json.load(f)
+                _state["factors"].update(saved.get("factors", {}))
+                _state["pdfs"].update(saved.get("pdfs", {}))
+            except (OSError, ValueError, AttributeError) as e:
+                log.error("Error loading %s: %s. Starting uncalibrated.", ESTIMATES_FILE, e)
+    return _state
+
+
+def _save():
+    try:
+        with open(ESTIMATES_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(_state, f, indent=1)
+        os.replace(ESTIMATES_FILE + ".tmp", ESTIMATES_FILE)
+    except OSError as e:
+        log.error("Error saving %s: %s", ESTIMATES_FILE, e)
+
+
+def _factor(modality):
+    with _lock:
+        return _load()["factors"][modality]
+
+
+# --- Raw estimates ---
+
+def pdf_page_count(source):
+    """Page count of a local PDF (cached), a rough guess for URLs."""
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return URL_PAGES
+    key = (os.path.abspath(source), stat.st_mtime, stat.st_size)
+    if key not in _pdf_pages:
+        from pypdf import PdfReader # Page objects are often in compressed object streams
+        try:
+            _pdf_pages[key] = max(1, len(PdfReader(source).pages))
+        except Exception as e:
+            log.warning("Cannot count the pages of %s (%s), assuming %s.", os.path.basename(source), e, URL_PAGES)
+            return URL_PAGES
+    return _pdf_pages[key]
+
+
+def _pdf_id(source):
+    """Content hash of a local file, the address of a URL."""
+    if _is_url(source) or not os.path.exists(source):
+        return source
+    return file_manager.file_sha256(source)
+
+
+def image_tokens(width, height):
+    """Input tokens of an image of the given size (calibrated)."""
+    if width <= SMALL_IMAGE_SIZE and height <= SMALL_IMAGE_SIZE:
+        tiles = 1
+    else:
+        tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return round(tiles * TOKENS_PER_IMAGE_TILE * _factor("image"))
+
+
+def pdf_page_tokens(source):
+    """Tokens per page of a PDF: measured before, or the calibrated default."""
+    with _lock:
+        measured = _load()["pdfs"].get(_pdf_id(source))
+    if measured:
+        return max(1, measured / pdf_page_count(source))
+    return TOKENS_PER_PDF_PAGE * _factor("pdf")
+
+
+def pdf_tokens(source, pages=None):
+    """Tokens of a PDF, or of its first pages."""
+    total = pdf_page_count(source)
+    return round(pdf_page_tokens(source) * min(pages or total, total))
+
+
+def prompt_tokens(text=None):
+    if text is None:
+        return DEFAULT_PROMPT_TOKENS
+    return round(max(1, len(text) / CHARS_PER_TOKEN) * _factor("prompt"))
+
+
+class Estimate:
+    """Input tokens of one request, per part."""
+    def __init__(self, image_sizes, pdf_sources, prompt_text=None):
+        self.images = [image_tokens(*size) for size in image_sizes]
+        self.pdfs = {source: pdf_tokens(source) for source in pdf_sources}
+        self.prompt = prompt_tokens(prompt_text)
+
+    @property
+    def total(self):
+        return sum(self.images) + sum(self.pdfs.values()) + self.prompt
+
+    def to_dict(self):
+        return {"image": sum(self.images), "pdf": sum(self.pdfs.values()), "prompt": self.prompt, "total": self.total}
+
+
+def estimate_input_tokens(pdf_sources, image_size=None, prompt_text=None):
+    """Rough input size of the next question in tokens."""
+    return Estimate([image_size or last_image_size or DEFAULT_IMAGE_SIZE], pdf_sources, prompt_text).total
+
+
+# --- Calibration ---
+
+def _modality_counts(usage):
+    """{image, pdf, prompt: tokens} from the per-modality details of usage_metadata, or None."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if not details:
+        return None
+    names = {"IMAGE": "image", "DOCUMENT": "pdf", "TEXT": "prompt"}
+    counts = {}
+    for detail in details:
+        modality = getattr(detail, "modality", None)
+        modality = str(getattr(modality, "value", modality) or "").upper()
+        if modality in names:
+            counts[names[modality]] = counts.get(names[modality], 0) + (detail.token_count or 0)
+    return counts
+
+
+def _nudge(factors, modality, ratio):
+    low, high = FACTOR_RANGE
+    factors[modality] = min(high, max(low, factors[modality] * (1 - CALIBRATION_RATE + CALIBRATION_RATE * ratio)))
+
+
+def observe(estimate, usage):
+    """Calibrates the estimates with the usage_metadata of the request they were made for."""
+    prompt_count = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    if not prompt_count or not estimate.total:
+        return
+    counts = _modality_counts(usage)
+    with _lock:
+        state = _load()
+        factors = state["factors"]
+        if counts is None:
+            # Only the total is known: every part was off by the same ratio
+            for modality in factors:
+                _nudge(factors, modality, prompt_count / estimate.total)
+        else:
+            estimated = {"image": sum(estimate.images), "pdf": sum(estimate.pdfs.values()), "prompt": estimate.prompt}
+            for modality, actual in counts.items():
+                if actual and estimated[modality]:
+                    _nudge(factors, modality, actual / estimated[modality])
+            # A PDF alone in its request (or the only one not measured yet) is measured exactly
+            unknown = [s for s in estimate.pdfs if _pdf_id(s) not in state["pdfs"]]
+            if counts.get("pdf") and len(unknown) == 1:
+                known = sum(state["pdfs"][_pdf_id(s)] for s in estimate.pdfs if s not in unknown)
+                if counts["pdf"] > known:
+                    state["pdfs"][_pdf_id(unknown[0])] = counts["pdf"] - known
+        _save()
+    log.debug("Estimated %s input tokens, the API counted %s.", estimate.total, prompt_count)
+
+
+def calibration():
+    """Correction factors and measured PDFs, for the status command."""
+    with _lock:
+        state = _load()
+        return {"factors": {m: round(f, 3) for m, f in state["factors"].items()}, "measuredPdfs": len(state["pdfs"])}
+
+
+# --- Budget ---
+
+class BudgetPlan:
+    """How a question fits the budget: the screenshot scale and the PDF parts to send."""
+    def __init__(self, scale, pdf_parts, estimate, dropped=(), rejected=None):
+        self.scale = scale
+        self.pdf_parts = pdf_parts # (source, pages or None for all)
+        self.estimate = estimate
+        self.dropped = list(dropped)
+        self.rejected = rejected # Reason, or None
+
+
+def fit_budget(image_size, pdf_sources, prompt_text, budget):
+    """Plans a question of at most budget input tokens, see the top of the file."""
+    width, height = image_size
+    prompt = prompt_tokens(prompt_text)
+    pdfs = {source: pdf_tokens(source) for source in pdf_sources}
+
+    def image_at(scale):
+        return image_tokens(max(1, int(width * scale)), max(1, int(height * scale)))
+
+    # 1. A smaller screenshot: the largest scale that fits, at least MIN_IMAGE_SCALE
+    scale = 1.0
+    while image_at(scale) + sum(pdfs.values()) + prompt > budget and scale > MIN_IMAGE_SCALE:
+        scale = max(MIN_IMAGE_SCALE, round(scale - 0.05, 2))
+    image = image_at(scale)
+    left = budget - image - prompt
+    if left < 0:
+        return BudgetPlan(scale, [], image + prompt, dropped=pdf_sources,
+                          rejected=f"the screenshot and the prompt alone need ~{image + prompt} tokens")
+
+    # 2. PDFs in order while they fit, the others trimmed to what is left
+    parts, dropped = [], []
+    for source in pdf_sources:
+        if pdfs[source] <= left:
+            parts.append((source, None))
+            left -= pdfs[source]
+            continue
+        pages = int(left // pdf_page_tokens(source))
+        if not _is_url(source) and pages >= MIN_TRIMMED_PAGES:
+            parts.append((source, pages))
+            left -= pdf_tokens(source, pages)
+        else:
+            dropped.append(source)
+    return BudgetPlan(scale, parts, budget - left, dropped)
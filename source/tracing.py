@@ -0,0 +1,232 @@
+import json
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from logs import get_logger
+
+log = get_logger("tracing")
+
+TRACE_FILE = "../traces.jsonl"
+TRACE_FILE_MAX_BYTES = 5 * 1024 * 1024 # Rotate the trace file after 5 MB, like the log file sink
+TRACE_FILE_BACKUPS = 3 # Number of rotated files kept
+TRACE_BUFFER_SIZE = 500 # Completed traces kept in memory for the statistics
+PERCENTILES = (50, 95, 99)
+
+_local = threading.local() # Current trace and open span stack of each thread
+_completed = deque(maxlen=TRACE_BUFFER_SIZE)
+_listeners = [] # Functions called with every finished trace record
+_lock = threading.Lock()
+_write_queue = queue.Queue(maxsize=1000) # Records waiting for the writer thread
+_writer = None
+_dropped = 0 # Records not written because the queue was full
+
+
+class Trace:
+    """One traced request: an ID plus the timed spans of its stages."""
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.spans = []
+        self.status = "ok"
+        self.duration_ms = None
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attrs": self.attrs,
+            "spans": list(self.spans),
+        }
+
+
+def current_trace():
+    """Returns the trace active in this thread, or None."""
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    Starts a trace for one request. Spans opened in this thread while it
+    is active are linked to it. The finished trace is stored in memory
+    and appended to TRACE_FILE in the background.
+    """
+    t = Trace(name, attrs)
+    previous = (current_trace(), getattr(_local, "stack", None))
+    _local.trace, _local.stack = t, []
+    try:
+        yield t
+    except Exception:
+        t.status = "error"
+        raise
+    finally:
+        t.duration_ms = (time.perf_counter() - t._t0) * 1000
+        _local.trace, _local.stack = previous
+        _finish(t)
+
+
+@contextmanager
+def attach(t):
+    """Links the spans of a worker thread to a trace started in another thread."""
+    previous = (current_trace(), getattr(_local, "stack", None))
+    _local.trace, _local.stack = t, []
+    try:
+        yield t
+    finally:
+        _local.trace, _local.stack = previous
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times one stage of the current trace. Yields the span record so the
+    caller can add attributes; does nothing when no trace is active.
+    """
+    t = current_trace()
+    if t is None:
+        yield None
+        return
+
+    start = time.perf_counter()
+    record = {
+        "span_id": uuid.uuid4().hex[:8],
+        "parent_id": _local.stack[-1] if _local.stack else None,
+        "name": name,
+        "start_ms": round((start - t._t0) * 1000, 3),
+        "attrs": attrs,
+    }
+    _local.stack.append(record["span_id"])
+    try:
+        yield record
+    except Exception:
+        record["error"] = True
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _local.stack.pop()
+        with _lock:
+            t.spans.append(record)
+
+
+def mark_error(status="error", reason=None):
+    """Marks the current trace as failed without raising. reason (e.g. "rate_limit") is kept in its attrs."""
+    t = current_trace()
+    if t is not None:
+        t.status = status
+        if reason is not None:
+            t.attrs["error"] = reason
+
+
+def add_listener(func):
+    """Registers a function to be called with every finished trace (as a dict)."""
+    _listeners.append(func)
+
+
+def _finish(t):
+    global _writer, _dropped
+    record = t.to_dict()
+    with _lock:
+        _completed.append(record)
+        # Written on a background thread, off the question's critical path
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="trace-writer", daemon=True)
+            _writer.start()
+        try:
+            _write_queue.put_nowait(json.dumps(record))
+        except queue.Full:
+            _dropped += 1
+            if _dropped == 1 or _dropped % 100 == 0:
+                log.warning("Trace writer is behind, %s traces not written to %s.", _dropped, TRACE_FILE)
+
+    for listener in _listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            log.warning("Trace listener failed: %s", e)
+
+    log.debug("Trace %s finished in %.0f ms: %s", t.trace_id, t.duration_ms,
+              ", ".join(f"{s['name']}={s['duration_ms']:.0f}ms" for s in t.spans))
+
+
+def _rotate():
+    """Shifts TRACE_FILE to .1, .1 to .2, ... the oldest backup is dropped."""
+    for i in range(TRACE_FILE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{TRACE_FILE}.{i}"):
+            os.replace(f"{TRACE_FILE}.{i}", f"{TRACE_FILE}.{i + 1}")
+    os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+
+
+def _write_loop():
+    """Appends the queued records, several per write when they pile up."""
+    while True:
+        lines = [_write_queue.get()]
+        while True:
+            try:
+                lines.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_BYTES:
+                _rotate()
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except Exception as e:
+            log.warning("Failed to write %s traces to %s: %s", len(lines), TRACE_FILE, e)
+        for _ in lines:
+            _write_queue.task_done()
+
+
+def flush():
+    """Waits until the finished traces are written (on shutdown)."""
+    if _writer is not None:
+        _write_queue.join()
+
+
+def recent_traces():
+    """Returns the completed traces kept in memory, oldest first."""
+    with _lock:
+        return list(_completed)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def stage_stats(traces=None):
+    """
+    Returns {stage: {"count", "p50", "p95", "p99"}} in milliseconds over the
+    given trace records (default: the traces in memory). Spans of the same
+    stage in one trace are summed (e.g. several PDF uploads); "total" is the
+    whole request.
+    """
+    durations = {}
+    for t in (recent_traces() if traces is None else traces):
+        per_trace = {"total": t["duration_ms"]}
+        for s in t["spans"]:
+            per_trace[s["name"]] = per_trace.get(s["name"], 0) + s["duration_ms"]
+        for stage, value in per_trace.items():
+            durations.setdefault(stage, []).append(value)
+
+    stats = {}
+    for stage, values in durations.items():
+        values.sort()
+        stats[stage] = {"count": len(values)}
+        for p in PERCENTILES:
+            stats[stage][f"p{p}"] = round(percentile(values, p), 1)
+    return stats
@@ -1,95 +1,117 @@
 from PIL import Image, ImageDraw, ImageFont
 import pystray
 import threading
+import time
+from functools import lru_cache
 from pystray import MenuItem as item
 
-from ansi import ansi
+from logs import get_logger
 
-TRAYICON_MSG = ansi.OKCYAN + "TRAYICON: " + ansi.ENDC
+log = get_logger("trayicon")
 
-class TrayIcon:
-    def __init__(self, quit_callback, show_gui_callback):
-        self.icon = None
-        self.quit_callback = quit_callback
-        self.show_gui_callback = show_gui_callback
-        print(TRAYICON_MSG + "Initialized.")
-
-    def create_image(self, answer="", color="black"):
-        # Create an image for the icon
-        print(TRAYICON_MSG + "Creating icon image...")
+ICON_SIZE = 64
+FONT_SIZE = 32
+IMAGE_CACHE_SIZE = 32 # Rendered icons kept (RDY, ERR, loading, A-E and recent answers)
 
-        width, height = 64, 64
-        image = Image.new('RGBA', (width, height), (255, 255, 255, 0))
-        draw = ImageDraw.Draw(image)
+# Recurring states rendered up front, so showing them is only a cache lookup
+PRELOADED_ICONS = [("RDY", "green"), ("ERR", "red"), ("...", "navy")] + [(c, "black") for c in "ABCDE"]
 
-        # Set background color
-        draw.rectangle((0, 0, width, height), fill=color)
 
-        # Load a custom font with a larger size
-        try:
-            font = ImageFont.truetype("arial.ttf", 32)  # You can change the font and size here
-        except IOError:
-            font = ImageFont.load_default()  # Fallback to default font if custom font isn't found
+@lru_cache(maxsize=1)
+def load_font():
+    """Loads the icon font once, every render reuses it."""
+    try:
+        return ImageFont.truetype("arial.ttf", FONT_SIZE)  # You can change the font and size here
+    except IOError:
+        return ImageFont.load_default()  # Fallback to default font if custom font isn't found
 
-        text = answer
 
-        # Calculate the bounding box of the text
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def render_icon(text, color):
+    """Renders the icon image for a text and background color. Results are cached."""
+    log.debug("Rendering icon image for %r...", text)
 
-        # Position text at the center
-        text_x = (width - text_width) / 2
-        text_y = (height - text_height) / 2
+    width, height = ICON_SIZE, ICON_SIZE
+    image = Image.new('RGBA', (width, height), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
 
-        # Draw the text on the icon
-        draw.text((text_x, text_y), text, fill="white", font=font)
+    # Set background color
+    draw.rectangle((0, 0, width, height), fill=color)
 
-        print(TRAYICON_MSG + "Icon image created.")
+    font = load_font()
 
-        return image
+    # Calculate the bounding box of the text
+    text_bbox = draw.textbbox((0, 0), text, font=font)
+    text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
 
-    def display_answer(self, answer, color="black"):
-        """Displays the answer in the taskbar using a system tray icon."""
+    # Position text at the center
+    text_x = (width - text_width) / 2
+    text_y = (height - text_height) / 2
 
-        if self.icon is not None:
-            self.icon.stop()  # Stop the previous icon if it exists
+    # Draw the text on the icon
+    draw.text((text_x, text_y), text, fill="white", font=font)
 
-        max_length = 120
-        if len(answer) > max_length:
-            answer = answer[:max_length] + "..."  # Truncate and add "..."
+    return image
 
-        # Create a new icon
-        self.icon = pystray.Icon("Gemini Answer")
-        self.icon.icon = self.create_image(answer, color=color)
-        self.icon.title = answer
 
-        # Create a right-click menu
-        self.icon.menu = pystray.Menu(
-            item('Toggle GUI visibility', lambda icon, item: self.show_gui_callback()),
-            item('Quit', lambda icon, item: self.quit_callback()),
+class TrayIcon:
+    """
+    A single system tray icon that lives for the whole run of the app.
+    State changes only swap its image and title, the OS icon is never recreated.
+    """
+    def __init__(self, quit_callback, show_gui_callback):
+        self.quit_callback = quit_callback
+        self.show_gui_callback = show_gui_callback
+        self._lock = threading.Lock() # Updates come from the hotkey and UI threads
+
+        self.icon = pystray.Icon(
+            "Gemini Answer",
+            icon=render_icon("...", "navy"),
+            title="Loading...",
+            # Create a right-click menu
+            menu=pystray.Menu(
+                item('Toggle GUI visibility', lambda icon, item: self.show_gui_callback()),
+                item('Quit', lambda icon, item: self.quit_callback()),
+            ),
         )
 
-        # Run the icon in the system tray
-        threading.Thread(target=self.icon.run, daemon=True).start()
+        for text, color in PRELOADED_ICONS:
+            render_icon(text, color)
 
-    def set_loading(self):
-        """Displays a loading icon in the taskbar using a system tray icon."""
+        # Run the icon in the system tray, once
+        self._thread = threading.Thread(target=self.icon.run, daemon=True)
+        self._thread.start()
+        log.info("Initialized.")
 
-        if self.icon is not None:
-            self.icon.stop()  # Stop the previous icon if it exists
+    def create_image(self, answer="", color="black"):
+        """Returns the (cached) icon image for an answer."""
+        return render_icon(answer, color)
+
+    def _update(self, text, color, title):
+        """Swaps the image and title of the running icon in place."""
+        start = time.perf_counter()
+        image = render_icon(text, color)
+        with self._lock:
+            self.icon.icon = image
+            self.icon.title = title
+        log.debug("Tray icon updated in %.1f ms.", (time.perf_counter() - start) * 1000)
 
-        print(TRAYICON_MSG + "Displaying loading icon...")
+    def display_answer(self, answer, color="black"):
+        """Displays the answer in the taskbar using the system tray icon."""
+        max_length = 120
+        if len(answer) > max_length:
+            answer = answer[:max_length] + "..."  # Truncate and add "..."
 
-        # Create a new icon
-        self.icon = pystray.Icon("Gemini Answer")
-        self.icon.icon = self.create_image("...", color="navy")
-        self.icon.title = "Loading..."
+        self._update(answer, color, answer)
 
-        # Create a right-click menu
-        self.icon.menu = pystray.Menu(
-            item('Toggle GUI visibility', lambda icon, item: self.show_gui_callback()),
-            item('Quit', lambda icon, item: self.quit_callback()),
-        )
+    def set_loading(self):
+        """Displays the loading icon in the taskbar."""
+        log.info("Displaying loading icon...")
+        self._update("...", "navy", "Loading...")
 
-        # Run the icon in the system tray
-        threading.Thread(target=self.icon.run, daemon=True).start()
\ No newline at end of file
+    def stop(self):
+        """Removes the icon from the system tray."""
+        try:
+            self.icon.stop()
+        except Exception as e:
+            log.warning("Error stopping tray icon: %s", e)
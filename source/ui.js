@@ -5,9 +5,19 @@ const pdfInput = document.getElementById('pdf-input');
 const modelSelect = document.getElementById('model-select');
 const totalTokensSpan = document.getElementById('total-tokens');
 const todayTokensSpan = document.getElementById('today-tokens');
-const logOutputPre = document.getElementById('log-output');
+const logSpacerDiv = document.getElementById('log-spacer');
 const startStopButton = document.getElementById('start-stop-button');
 const stateStatusDiv = document.getElementById('state-status');
+const latencyTableBody = document.getElementById('latency-table-body');
+const storageTableBody = document.getElementById('storage-table-body');
+const profilesTableBody = document.getElementById('profiles-table-body');
+const historySearchInput = document.getElementById('history-search');
+const historyTableBody = document.getElementById('history-table-body');
+const historyMoreButton = document.getElementById('history-more');
+const historyStatusP = document.getElementById('history-status');
+const profilingStatusP = document.getElementById('profiling-status');
+const profilingFilesUl = document.getElementById('profiling-files');
+const profileQuestionsInput = document.getElementById('profile-questions');
 
 let currentPdfSources = [];
 let uiState = 'configuring'; // 'configuring' or 'listening'
@@ -120,6 +130,22 @@ function setInitialState(state) {
 
     updateTokenDisplay(state.tokenUsage.total, state.tokenUsage.daily[getTodayDateString()] || 0);
 
+    updateLatencyStats(state.latencyStats || {});
+
+    updateStorageUsage(state.storageUsage || {});
+
+    updateProfiles(state.profiles || []);
+
+    refreshHistory();
+
+    if (state.profilingStatus) {
+        updateProfilingStatus(state.profilingStatus);
+    }
+
+    if (state.logCapacity) {
+        setLogCapacity(state.logCapacity);
+    }
+
     // Set the initial listening state
     if (state.isListening) {
         setUIState('listening');
@@ -245,8 +271,12 @@ function browsePdfFile() {
 
 
 function copyLogs() {
-    const logText = logOutputPre.innerText;
-    navigator.clipboard.writeText(logText);
+    // Copy every buffered line, not only the rendered ones, without ANSI codes
+    const lines = [];
+    for (let i = 0; i < logCount; i++) {
+        lines.push(logEntryAt(i).text.replace(/\x1b\[[\d;]*m/g, ''));
+    }
+    navigator.clipboard.writeText(lines.join('\n'));
 }
 
 
@@ -265,29 +295,299 @@ function getTodayDateString() {
 }
 
 
-// --- Log Display ---
-// Function called by Python to append a log line
-function appendLog(logLine) {
-    if (logLine.includes("sending thread") && logLine.includes("monitoring thread")) {
-        logLine.split('.').forEach(line => {
-            if (line.trim()) {
-                appendLog(line.trim() + '.\n');
-            }
+// --- Latency Statistics ---
+// Stages in pipeline order, anything else is listed after them
+const LATENCY_STAGE_ORDER = ['rotate_key', 'capture', 'encode', 'image_upload', 'pdf_upload',
+                             'prompt_load', 'model_call', 'tray_update', 'total'];
+
+// Function called by Python with {stage: {count, p50, p95, p99}} in milliseconds
+function updateLatencyStats(stats) {
+    const stages = Object.keys(stats).sort((a, b) => {
+        const ia = LATENCY_STAGE_ORDER.indexOf(a), ib = LATENCY_STAGE_ORDER.indexOf(b);
+        return (ia < 0 ? 99 : ia) - (ib < 0 ? 99 : ib);
+    });
+
+    latencyTableBody.innerHTML = '';
+    if (!stages.length) {
+        latencyTableBody.innerHTML = '<tr><td colspan="5" class="py-2 text-gray-500">No questions traced yet.</td></tr>';
+        return;
+    }
+    stages.forEach(stage => {
+        const s = stats[stage];
+        const tr = document.createElement('tr');
+        [stage, s.count, s.p50, s.p95, s.p99].forEach((value, i) => {
+            const td = document.createElement('td');
+            td.textContent = i >= 2 ? value.toFixed(0) + ' ms' : value;
+            td.className = i === 0 ? 'py-1 font-mono' : 'py-1 text-right';
+            tr.appendChild(td);
+        });
+        latencyTableBody.appendChild(tr);
+    });
+}
+
+function refreshLatencyStats() {
+    window.pywebview.api.get_latency_stats().then(updateLatencyStats);
+}
+
+
+// --- Answer History ---
+// Pages come from Python newest first; nextCursor is the id to continue below (keyset pagination)
+let historyCursor = null;
+let historyShown = 0;
+let historyRequest = 0; // Ignores the replies of outdated searches
+let historySearchTimer = null;
+
+function loadHistory(reset) {
+    const request = ++historyRequest;
+    const cursor = reset ? null : historyCursor;
+    window.pywebview.api.search_history(historySearchInput.value, cursor).then(page => {
+        if (request !== historyRequest) return;
+        if (reset) {
+            historyTableBody.innerHTML = '';
+            historyShown = 0;
+        }
+        page.entries.forEach(entry => historyTableBody.appendChild(createHistoryRow(entry)));
+        historyShown += page.entries.length;
+        historyCursor = page.nextCursor;
+        historyMoreButton.classList.toggle('hidden', historyCursor === null);
+        historyStatusP.textContent = historyShown
+            ? `${historyShown} answer(s) shown` + (historyCursor === null ? '' : ', more available')
+            : 'No answers found.';
+    });
+}
+
+function createHistoryRow(entry) {
+    const tr = document.createElement('tr');
+    const time = new Date(entry.created * 1000).toLocaleString();
+    const model = (entry.model || '').replace(/^models\//, '');
+    const latency = entry.latency_ms === null ? '' : (entry.latency_ms / 1000).toFixed(1) + ' s';
+    [time, entry.answer, model, entry.tokens ?? '', latency].forEach((value, i) => {
+        const td = document.createElement('td');
+        td.textContent = value;
+        td.className = i === 1 ? 'py-1 font-mono break-all' : (i >= 3 ? 'py-1 text-right whitespace-nowrap' : 'py-1 whitespace-nowrap');
+        if (i === 1 && entry.status !== 'ok') td.classList.add('text-red-600');
+        tr.appendChild(td);
+    });
+    tr.title = `Prompt: ${entry.prompt_file || '-'} | ${entry.kind}` + (entry.thumbnail_hash ? ` | screen ${entry.thumbnail_hash}` : '');
+    return tr;
+}
+
+// Function called by Python after every question
+function refreshHistory() {
+    loadHistory(true);
+}
+
+function loadMoreHistory() {
+    loadHistory(false);
+}
+
+function onHistorySearchInput() {
+    clearTimeout(historySearchTimer);
+    historySearchTimer = setTimeout(refreshHistory, 250); // Search when typing pauses
+}
+
+
+// --- Profiles ---
+// Function called with [{name, hotkey, model, pdfSources, state, ...}]
+function updateProfiles(profiles) {
+    profilesTableBody.innerHTML = '';
+    if (!profiles.length) {
+        profilesTableBody.innerHTML = '<tr><td colspan="5" class="py-2 text-gray-500">No profiles in profiles.json.</td></tr>';
+        return;
+    }
+    profiles.forEach(p => {
+        const tr = document.createElement('tr');
+        [p.name, p.hotkey, p.model || 'selected', p.pdfSources.length, p.state].forEach((value, i) => {
+            const td = document.createElement('td');
+            td.textContent = value;
+            td.className = i === 1 ? 'py-1 font-mono' : (i > 2 ? 'py-1 text-right' : 'py-1');
+            tr.appendChild(td);
         });
+        profilesTableBody.appendChild(tr);
+    });
+}
+
+function refreshProfiles() {
+    window.pywebview.api.get_profiles().then(updateProfiles);
+}
+
+
+// --- File Storage ---
+// Function called by Python with {key number: {files, bytes, pdfs, screenshots}}
+function updateStorageUsage(usage) {
+    storageTableBody.innerHTML = '';
+    const keys = Object.keys(usage);
+    if (!keys.length) {
+        storageTableBody.innerHTML = '<tr><td colspan="5" class="py-2 text-gray-500">No API keys loaded.</td></tr>';
         return;
     }
-    // Skip empty lines
-    if (!logLine.trim()) return;
+    keys.forEach(key => {
+        const u = usage[key];
+        const tr = document.createElement('tr');
+        ['#' + key, u.files, u.pdfs, u.screenshots, (u.bytes / 1e6).toFixed(1) + ' MB'].forEach((value, i) => {
+            const td = document.createElement('td');
+            td.textContent = value;
+            td.className = i === 0 ? 'py-1 font-mono' : 'py-1 text-right';
+            tr.appendChild(td);
+        });
+        storageTableBody.appendChild(tr);
+    });
+}
+
+function refreshStorageUsage() {
+    window.pywebview.api.get_storage_usage().then(updateStorageUsage);
+}
+
+
+// --- Diagnostics ---
+// Function called by Python (and after every button) with the profiler state
+function updateProfilingStatus(status) {
+    const parts = [];
+    parts.push(status.cprofileRemaining > 0
+        ? `cProfile: ${status.cprofileRemaining} question(s) left (${status.cprofileQuestions} profiled)`
+        : 'cProfile: off');
+    parts.push(status.tracemallocActive ? 'tracemalloc: tracing' : 'tracemalloc: off');
+    profilingStatusP.textContent = parts.join(' | ');
+
+    profilingFilesUl.innerHTML = '';
+    (status.lastFiles || []).forEach(path => {
+        const li = document.createElement('li');
+        li.textContent = path;
+        li.className = 'font-mono text-xs text-gray-600 break-all';
+        profilingFilesUl.appendChild(li);
+    });
+}
+
+function startCProfile() {
+    const questions = parseInt(profileQuestionsInput.value, 10) || 1;
+    window.pywebview.api.start_cprofile(questions).then(updateProfilingStatus);
+}
+
+function stopCProfile() {
+    window.pywebview.api.stop_cprofile().then(updateProfilingStatus);
+}
+
+function takeMemorySnapshot() {
+    window.pywebview.api.take_memory_snapshot().then(updateProfilingStatus);
+}
+
+function stopMemoryTracing() {
+    window.pywebview.api.stop_memory_tracing().then(updateProfilingStatus);
+}
+
+function dumpThreadStacks() {
+    window.pywebview.api.dump_thread_stacks().then(updateProfilingStatus);
+}
+
+
+// --- Log Display ---
+// The log view is virtualized: parsed entries live in a capped ring buffer and
+// only the rows scrolled into view are turned into DOM nodes.
+const LOG_ROW_HEIGHT = 20; // px, must match the .log-row height in ui.html
+const LOG_OVERSCAN = 10;   // Extra rows rendered above and below the viewport
+
+const logViewport = document.getElementById('log-viewport');
+const logRowsDiv = document.getElementById('log-rows');
+
+let logCapacity = 5000; // Max number of entries kept, can be changed by setLogCapacity
+let logEntries = new Array(logCapacity); // Ring buffer of {text, html} entries
+let logHead = 0;  // Index of the oldest entry in logEntries
+let logCount = 0; // Number of entries currently stored
+let logDropped = 0; // Entries evicted since the last render (to keep the scroll position)
+let logStickToBottom = true; // Autoscroll only while the user is at the bottom
+let logRenderPending = false;
+
+function logEntryAt(i) {
+    return logEntries[(logHead + i) % logCapacity];
+}
+
+function pushLogEntry(text) {
+    // html is filled lazily the first time the entry is rendered, then reused
+    const entry = { text: text, html: null };
+    if (logCount < logCapacity) {
+        logEntries[(logHead + logCount) % logCapacity] = entry;
+        logCount++;
+    } else {
+        // Buffer is full, overwrite the oldest entry
+        logEntries[logHead] = entry;
+        logHead = (logHead + 1) % logCapacity;
+        logDropped++;
+    }
+}
 
-    // Convert ANSI to HTML
-    const coloredHtml = ansiToHtml(logLine);
+// Function called by Python to change how many log lines are kept
+function setLogCapacity(capacity) {
+    capacity = Math.max(100, Math.floor(capacity) || 0);
+    const keep = Math.min(logCount, capacity);
+    const entries = new Array(capacity);
+    for (let i = 0; i < keep; i++) {
+        entries[i] = logEntryAt(logCount - keep + i);
+    }
+    logEntries = entries;
+    logCapacity = capacity;
+    logHead = 0;
+    logCount = keep;
+    scheduleLogRender();
+}
+
+// Batch DOM updates: however many lines arrive, render at most once per frame
+function scheduleLogRender() {
+    if (logRenderPending) return;
+    logRenderPending = true;
+    requestAnimationFrame(renderLogView);
+}
+
+function renderLogView() {
+    logRenderPending = false;
 
-    // Append the HTML to the PRE element's innerHTML
-    // Using insertAdjacentHTML is generally more performant and safer than += innerHTML
-    logOutputPre.insertAdjacentHTML('beforeend', coloredHtml);
+    logSpacerDiv.style.height = (logCount * LOG_ROW_HEIGHT) + 'px';
 
-    // Auto-scroll to the bottom - works for PRE element too
-    logOutputPre.scrollTop = logOutputPre.scrollHeight;
+    if (logStickToBottom) {
+        logViewport.scrollTop = logViewport.scrollHeight;
+    } else if (logDropped) {
+        // Old rows were evicted above the viewport, shift so the visible lines stay put
+        logViewport.scrollTop = Math.max(0, logViewport.scrollTop - logDropped * LOG_ROW_HEIGHT);
+    }
+    logDropped = 0;
+
+    const scrollTop = logViewport.scrollTop;
+    const first = Math.max(0, Math.floor(scrollTop / LOG_ROW_HEIGHT) - LOG_OVERSCAN);
+    const last = Math.min(logCount,
+        Math.ceil((scrollTop + logViewport.clientHeight) / LOG_ROW_HEIGHT) + LOG_OVERSCAN);
+
+    let html = '';
+    for (let i = first; i < last; i++) {
+        const entry = logEntryAt(i);
+        if (entry.html === null) {
+            entry.html = ansiToHtml(entry.text);
+        }
+        html += '<div class="log-row">' + entry.html + '</div>';
+    }
+    logRowsDiv.style.transform = `translateY(${first * LOG_ROW_HEIGHT}px)`;
+    logRowsDiv.innerHTML = html;
+}
+
+logViewport.addEventListener('scroll', function() {
+    logStickToBottom = logViewport.scrollTop + logViewport.clientHeight
+        >= logViewport.scrollHeight - LOG_ROW_HEIGHT;
+    scheduleLogRender();
+});
+
+// Function called by Python to append a batch of log lines
+function appendLogs(logLines) {
+    logLines.forEach(appendLog);
+}
+
+// Append a log line (may contain several lines, e.g. tracebacks)
+function appendLog(logLine) {
+    // Every row of the virtual list is a single line
+    logLine.split('\n').forEach(line => {
+        // Skip empty lines
+        if (line.trim()) {
+            pushLogEntry(line);
+        }
+    });
+    scheduleLogRender();
 }
 
 
@@ -319,7 +619,13 @@ function toggleListening() {
 }
 
 function clearLogs() {
-    logOutputPre.innerHTML = ''; // Clear the log display
+    // Clear the log display
+    logEntries = new Array(logCapacity);
+    logHead = 0;
+    logCount = 0;
+    logDropped = 0;
+    logStickToBottom = true;
+    scheduleLogRender();
 }
 
 function toggleVisibility() {
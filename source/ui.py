@@ -1,35 +1,45 @@
 import os
 import webview
 import threading
-import queue
 import sys
-import time
 import json
 
-from ansi import ansi
+import logs
+from static_server import StaticServer
 
-UI_MSG = ansi.OKCYAN + "UI: " + ansi.ENDC
+log = logs.get_logger("ui")
+LOG_VIEW_CAPACITY = 5000 # Max number of log lines kept by the log view in ui.js
 
 class LogRedirector(object):
-    """Redirects stdout to a queue for the UI."""
-    def __init__(self, queue):
-        self.queue = queue
+    """Redirects stray stdout writes (e.g. prints from libraries) into the logging pipeline."""
+    def __init__(self, logger):
+        self.logger = logger
         self._stdout = sys.stdout # Keep original stdout
-        self._buffer = "" # Buffer for incomplete lines
+        self._pending = [] # Chunks of the current, not yet finished line
+        self._lock = threading.Lock() # write() is called from many threads
 
     def write(self, text):
-        self._stdout.write(text) # Also write to original stdout (console)
-        self._buffer += text
-        while '\n' in self._buffer:
-            line, self._buffer = self._buffer.split('\n', 1)
-            self.queue.put(line + '\n') # Add newline back for consistency
+        with self._lock:
+            if '\n' not in text:
+                self._pending.append(text)
+                return len(text)
+            lines = text.split('\n')
+            self._pending.append(lines[0])
+            complete = ["".join(self._pending)] + lines[1:-1]
+            self._pending = [lines[-1]] if lines[-1] else []
+
+        for line in complete:
+            if line.strip():
+                self.logger.info("%s", line)
+        return len(text)
 
     def flush(self):
-        self._stdout.flush() # Flush original stdout
-        # If there's anything left in the buffer without a newline, put it in the queue
-        if self._buffer:
-             self.queue.put(self._buffer)
-             self._buffer = ""
+        # If there's anything left without a newline, log it as a line
+        with self._lock:
+            line = "".join(self._pending)
+            self._pending = []
+        if line.strip():
+            self.logger.info("%s", line)
 
     # Required for Python 3
     def isatty(self):
@@ -43,7 +53,7 @@ class LogRedirector(object):
     @property
     def encoding(self):
         try:
-            return self._original_stream.encoding
+            return self._stdout.encoding
         except Exception:
             return 'utf-8' # Default encoding
 
@@ -56,8 +66,8 @@ class UI:
             main_app_callbacks: A dictionary of functions from main.py to be called by the UI/JS.
         """
         self.window = None
-        self.log_queue = queue.Queue()
-        self.log_redirector = LogRedirector(self.log_queue)
+        self.log_handler = logs.ui_handler # Bounded buffer the log thread drains
+        self.log_redirector = LogRedirector(logs.get_logger("stdout"))
         self._log_thread = None
         self._log_thread_running = False
         self.initial_listening_state = listening # Store initial state
@@ -65,23 +75,15 @@ class UI:
         # Store callbacks from the main application
         self.main_app_callbacks = main_app_callbacks
 
-        # We serve the HTML file using Flask
+        # We serve ui.html and ui.js with a small static server on a free localhost port
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        self.app = Flask(__name__, 
-                         static_url_path='', # Serve static files from the root URL path
-                         static_folder=current_dir, # Serve static files from the current directory
-                         template_folder=current_dir) # Serve templates from the current directory
+        self.static_server = StaticServer(current_dir)
 
-        @self.app.route('/')
-        def index():
-            # Render ui.html from the same directory
-            return render_template('ui.html')
-
-        # Create the webview window, serving the Flask app
+        # Create the webview window, loading the UI from the static server
         # headless=True might be useful if you want to start without the GUI visible
         self.window = webview.create_window(
             'Gemini QA Config',
-            url='http://127.0.0.1:5000/',
+            url=self.static_server.url,
             width=800,
             height=600,
             resizable=True,
@@ -105,34 +107,27 @@ class UI:
                 pdf_path = pdf_path[0]
                 return pdf_path
             else:
-                print(UI_MSG + "No PDF file selected.")
+                log.info("No PDF file selected.")
                 return None
         except Exception as e:
-            print(ansi.ERROR_MSG + f"Error opening file dialog: {e}")
+            log.error("Error opening file dialog: %s", e)
             return None
 
     def start_ui(self):
         """Starts the pywebview GUI and the log monitoring thread."""
-        print(UI_MSG + "Starting UI window...")
-        # Redirect stdout AFTER Flask app is configured but BEFORE webview.start()
-        # so logs from Flask/webview setup also go to console.
+        log.info("Starting UI window...")
+        # Redirect stdout AFTER the window is configured but BEFORE webview.start()
+        # so logs from the webview setup also go to console.
         sys.stdout = self.log_redirector
 
         # Start the thread that monitors the log queue and sends updates to the UI
         self._log_thread_running = True
         self._log_thread = threading.Thread(target=self._send_logs_to_ui, daemon=True)
         self._log_thread.start()
-        print(UI_MSG + "Log monitoring thread started.")
-
-        # We need to start the Flask server in a separate thread because webview.start() blocks the main thread.
-        def run_flask():
-            # Use a simple development server
-            self.app.run(use_reloader=False) # Important: use_reloader=False with threading
+        log.info("Log monitoring thread started.")
 
-        # Start Flask server in a thread
-        self._flask_thread = threading.Thread(target=run_flask, daemon=True)
-        self._flask_thread.start()
-        print(UI_MSG + "Flask development server started.")
+        # The static server runs on its own threads because webview.start() blocks the main thread.
+        self.static_server.start()
 
         # Start the webview GUI - this call blocks the main thread until the window is closed
         # The 'on_shown' callback is fired when the window is first displayed
@@ -140,25 +135,26 @@ class UI:
         self.window.events.closed += self._on_window_closed # Hook closed event
         self.window.events.shown += self._on_window_shown # Hook shown event (for initial state sync)
 
-        print(UI_MSG + "Entering webview.start() blocking call...")
+        log.info("Entering webview.start() blocking call...")
         webview.start() # This call blocks the main thread
 
         # This code is reached AFTER webview.start() returns (i.e. window is closed)
-        print(UI_MSG + "webview.start() returned. Shutting down UI.")
+        log.info("webview.start() returned. Shutting down UI.")
+        self.static_server.stop()
         self._log_thread_running = False # Signal log thread to stop
         if self._log_thread and self._log_thread.is_alive():
-            # Put a dummy item in queue to unblock the thread if it's waiting
-            self.log_queue.put(None)
+            # Wake the thread up if it's waiting for new records
+            self.log_handler.wake()
             self._log_thread.join(timeout=2) # Wait for log thread to finish
 
         # Restore original stdout
         sys.stdout = self.log_redirector._stdout
-        print(UI_MSG + "Restored original stdout.")
+        log.info("Restored original stdout.")
 
 
     def _on_window_shown(self):
         """Callback executed when the webview window is first shown."""
-        print(UI_MSG + "Window shown. Syncing initial state.")
+        log.info("Window shown. Syncing initial state.")
         # Send initial data to the UI after it's ready
         # Call JavaScript function to populate settings
         # Example: window.pywebview.api.load_settings() on the JS side calls Python's load_settings
@@ -170,60 +166,61 @@ class UI:
                 'availableModels': self.main_app_callbacks['get_available_models'](),
                 'selectedModel': self.main_app_callbacks['get_selected_model'](),
                 'tokenUsage': self.main_app_callbacks['get_token_usage'](),
+                'latencyStats': self.main_app_callbacks['get_latency_stats'](),
+                'profilingStatus': self.main_app_callbacks['get_profiling_status'](),
+                'storageUsage': self.main_app_callbacks['get_storage_usage'](),
+                'profiles': self.main_app_callbacks['get_profiles'](),
                 'isListening': self.initial_listening_state, # Pass the initial listening state
+                'logCapacity': LOG_VIEW_CAPACITY, # Size of the log view's ring buffer
                 # UI state (listening/configuring) should be handled by main.py and sent via update_ui_state
             }
             # Call a JS function to apply this initial state
             self.window.evaluate_js(f'setInitialState({json.dumps(initial_state)})')
-            print(UI_MSG + "Sent initial state to JS.")
+            log.info("Sent initial state to JS.")
 
             # If the app was meant to start listening, trigger the callback now that the UI is ready
             if self.initial_listening_state:
-                print(UI_MSG + "Initial listening state is true, calling start_listening callback.")
+                log.info("Initial listening state is true, calling start_listening callback.")
                 self.main_app_callbacks['start_listening']()
                 
         except Exception as e:
-            print(ansi.ERROR_MSG + f"Error sending initial state to JS: {e}")
+            log.error("Error sending initial state to JS: %s", e)
 
 
     def _on_window_closed(self):
         """Callback executed when the webview window is closed by the user."""
-        print(UI_MSG + "Window closed by user.")
+        log.info("Window closed by user.")
         # Signal the main application to quit gracefully
         if self.main_app_callbacks['quit_app']:
-            print(UI_MSG + "Calling quit_app callback.")
+            log.info("Calling quit_app callback.")
             self.main_app_callbacks['quit_app']() # Call the callback provided by main.py
 
 
     def _send_logs_to_ui(self):
-        """Reads logs from the queue and sends them to the UI."""
-        print(UI_MSG + "Log sending thread started.")
+        """Drains the log buffer and sends the lines to the UI in batches."""
+        log.info("Log sending thread started.")
         while self._log_thread_running:
             try:
-                # Get log line from the queue (blocks until item is available or timeout)
-                log_line = self.log_queue.get(timeout=0.5) # Use timeout to check running flag
+                # Wait for new records (timeout to check the running flag)
+                lines = self.log_handler.drain(timeout=0.5)
+                if not lines or not self._log_thread_running:
+                    continue
 
-                if log_line is None: # Special signal to stop
-                    break
-
-                # Send the log line to the UI using evaluate_js
-                # Use json.dumps to properly escape the string for JavaScript
+                # Send every pending line with a single evaluate_js call
+                # Use json.dumps to properly escape the strings for JavaScript
                 if self.window: # Ensure window object still exists
                     try:
-                        self.window.evaluate_js(f'appendLog({json.dumps(log_line)})')
-                    except Exception as e:
-                         # This might happen if the window is closing while thread is running
-                         # print(f"UI: Error sending log to JS: {e}") # Avoid excessive error logs during shutdown
-                         pass
-
-            except queue.Empty:
-                # No logs in the queue, continue looping and check _log_thread_running
-                pass
+                        self.window.evaluate_js(f'appendLogs({json.dumps(lines)})')
+                    except Exception:
+                        # This might happen if the window is closing while thread is running
+                        # Not logged, it would feed back into this thread
+                        pass
+
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error in log sending thread: {e}")
-                # Continue trying unless flag is set or queue gets None
+                log.error("Error in log sending thread: %s", e)
+                # Continue trying unless flag is set
 
-        print(UI_MSG + "Log sending thread finished.")
+        log.info("Log sending thread finished.")
 
 
     # Methods called by the main application to update the UI from Python
@@ -235,7 +232,7 @@ class UI:
             try:
                 self.window.evaluate_js(f'appendLog({json.dumps(log_text)})')
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error calling JS appendLog: {e}")
+                log.error("Error calling JS appendLog: %s", e)
 
     def update_token_usage(self, total, today):
         """Updates the token usage display in the UI."""
@@ -243,7 +240,43 @@ class UI:
             try:
                 self.window.evaluate_js(f'updateTokenDisplay({total}, {today})')
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error calling JS updateTokenDisplay: {e}")
+                log.error("Error calling JS updateTokenDisplay: %s", e)
+
+
+    def update_latency_stats(self, stats):
+        """Updates the per-stage latency percentiles table in the UI."""
+        if self.window:
+            try:
+                self.window.evaluate_js(f'updateLatencyStats({json.dumps(stats)})')
+            except Exception as e:
+                log.error("Error calling JS updateLatencyStats: %s", e)
+
+
+    def refresh_history(self):
+        """Reloads the first page of the history panel (keeps the search text)."""
+        if self.window:
+            try:
+                self.window.evaluate_js('refreshHistory()')
+            except Exception as e:
+                log.error("Error calling JS refreshHistory: %s", e)
+
+
+    def update_storage_usage(self, usage):
+        """Updates the uploaded files per API key table in the UI."""
+        if self.window:
+            try:
+                self.window.evaluate_js(f'updateStorageUsage({json.dumps(usage)})')
+            except Exception as e:
+                log.error("Error calling JS updateStorageUsage: %s", e)
+
+
+    def update_profiling_status(self, status):
+        """Updates the diagnostics section (profiler state and written files) in the UI."""
+        if self.window:
+            try:
+                self.window.evaluate_js(f'updateProfilingStatus({json.dumps(status)})')
+            except Exception as e:
+                log.error("Error calling JS updateProfilingStatus: %s", e)
 
 
     def update_ui_state(self, state):
@@ -253,7 +286,7 @@ class UI:
             try:
                 self.window.evaluate_js(f'setUIState({json.dumps(state)})')
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error calling JS setUIState: {e}")
+                log.error("Error calling JS setUIState: %s", e)
 
 
     def show(self):
@@ -261,9 +294,9 @@ class UI:
         if self.window:
             try:
                 self.window.show()
-                print(UI_MSG + "Window shown.")
+                log.info("Window shown.")
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error showing window: {e}")
+                log.error("Error showing window: %s", e)
 
 
     def hide(self):
@@ -271,22 +304,17 @@ class UI:
         if self.window:
             try:
                 self.window.hide()
-                print(UI_MSG + "Window hidden.")
+                log.info("Window hidden.")
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error hiding window: {e}")
+                log.error("Error hiding window: %s", e)
 
     def destroy(self):
         """Destroys the UI window."""
         if self.window:
             try:
                 self.window.destroy()
-                print(UI_MSG + "Window destroyed.")
+                log.info("Window destroyed.")
             except Exception as e:
-                print(ansi.ERROR_MSG + f"Error destroying window: {e}")
+                log.error("Error destroying window: %s", e)
             self.window = None # Clear reference
 
-
-# Need Flask setup here because it's used by UI class
-from flask import Flask, render_template
-# Ensure Flask only runs its dev server when imported and used by UI.
-# Flask dev server setup happens inside the UI class __init__ and start_ui methods.
\ No newline at end of file